@@ -3,6 +3,8 @@ import os
 import time
 import json
 import datetime
+import hashlib
+import importlib
 from pathlib import Path
 import sqlite3
 from urllib.parse import urlparse, parse_qs
@@ -14,26 +16,45 @@ SPOTIFY_CLIENT_ID =st.secrets["SPOTIFY_CLIENT_ID"]
 SPOTIFY_CLIENT_SECRET =st.secrets["SPOTIFY_CLIENT_SECRET"]
 
 
-# Import services - keeping all original function names exactly as they were
-from services.spotify_service import (
-    get_spotify_auth_url, get_spotify_token, get_spotify_client_from_token,
-    analyze_user_genres, find_opposite_tracks, create_anti_playlist
-)
-from services.youtube_service import (
-    get_authenticated_service, analyze_recent_genres, search_authentic_music, 
-    create_anti_playlist_main_flow  # Preserved original name
-)
+# Provider services (spotipy, ytmusicapi, google auth) are imported on first
+# use through spotify_service() / youtube_service(), not on every script run.
 
 # Database helper
-from database import init_db, save_history, load_history
+from database import init_db
+
+# Background generation jobs
+import jobs
+from services.metrics import start_metrics_server
+from services.client_registry import get_client_registry
 
 # App Config and Helper Functions
 APP_TITLE = "OTTER."
 TAGLINE = "Your Anti-Playlist Generator"
 DEBUG = os.environ.get("DEBUG", "false").lower() == "true"
+JOB_POLL_SECONDS = float(os.environ.get("OTTER_JOB_POLL_SECONDS", "1.0"))
+
+@st.cache_resource
+def initialize_app():
+    """One-time process setup, cached across reruns and sessions."""
+    # Initialize the database
+    init_db()
+    # Expose API call metrics when OTTER_METRICS_PORT is set
+    start_metrics_server()
+    return True
+
+@st.cache_resource
+def spotify_service():
+    """Imports the Spotify service (and builds its genre indexes) once per process."""
+    return importlib.import_module('services.spotify_service')
 
-# Initialize the database
-init_db()
+@st.cache_resource
+def youtube_service():
+    """Imports the YouTube Music service (and compiles its matchers) once per process."""
+    return importlib.import_module('services.youtube_service')
+
+initialize_app()
+# Close provider clients (and their pooled connections) left idle by finished sessions
+get_client_registry().evict_idle()
 
 # Initialize session state variables if they don't exist
 if 'authenticated_spotify' not in st.session_state:
@@ -52,6 +73,12 @@ if 'working' not in st.session_state:
     st.session_state.working = False
 if 'done' not in st.session_state:
     st.session_state.done = False
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'job_events_seen' not in st.session_state:
+    st.session_state.job_events_seen = 0
+if 'job_events' not in st.session_state:
+    st.session_state.job_events = []
 
 # Environment variables (loaded by Streamlit automatically from .env file)
 SPOTIFY_SCOPE = "playlist-modify-public user-library-read user-top-read"
@@ -73,7 +100,7 @@ def set_service(service_name):
 
 def authenticate_spotify():
     """Start Spotify authentication flow"""
-    auth_url = get_spotify_auth_url(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, SPOTIFY_SCOPE)
+    auth_url = spotify_service().get_spotify_auth_url(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, SPOTIFY_SCOPE)
     st.session_state.working = True
     st.markdown(f"""
     ### Connecting to Spotify...
@@ -88,7 +115,7 @@ def authenticate_spotify():
 def authenticate_youtube():
     """Start YouTube authentication flow"""
     try:
-        auth_info = get_authenticated_service()
+        auth_info = youtube_service().get_authenticated_service()
         st.session_state.youtube_flow_state = auth_info['state']
         st.session_state.working = True
         st.markdown(f"""
@@ -110,7 +137,7 @@ def process_spotify_callback():
         code = query_params.get("code", [""])[0]
         
         if code:
-            token_info = get_spotify_token(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, SPOTIFY_SCOPE, code)
+            token_info = spotify_service().get_spotify_token(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, SPOTIFY_SCOPE, code)
             st.session_state.spotify_token = token_info
             st.session_state.authenticated_spotify = True
             st.session_state.callback_processed = True
@@ -138,7 +165,7 @@ def process_youtube_callback():
                 
             # Note: This assumes create_anti_playlist_main_flow handles the callback
             # as the original youtube_service import didn't include get_youtube_credentials_from_callback
-            credentials = create_anti_playlist_main_flow.process_callback(
+            credentials = youtube_service().create_anti_playlist_main_flow.process_callback(
                 code,
                 YOUTUBE_CLIENT_ID,
                 YOUTUBE_CLIENT_SECRET,
@@ -158,56 +185,30 @@ def process_youtube_callback():
         st.error(f"Error processing YouTube callback: {str(e)}")
         st.session_state.working = False
 
+def _job_dedupe_key(platform, secret):
+    """Keys jobs by platform and account token, so repeated clicks attach to the running job."""
+    return f"{platform}:{hashlib.sha1(secret.encode('utf-8')).hexdigest()}"
+
+def _start_job(dedupe_key, platform, func, *args):
+    # DEBUG also profiles each run (otherwise OTTER_PROFILE decides); profiles are saved under data/profiles
+    st.session_state.job_id = jobs.submit_job(dedupe_key, platform, func, *args, profile=DEBUG or None)
+    st.session_state.job_events_seen = 0
+    st.session_state.job_events = []
+    st.session_state.working = True
+    st.experimental_rerun()
+
 def create_spotify_anti_playlist():
     """Create an anti-playlist on Spotify"""
     if not st.session_state.authenticated_spotify or not st.session_state.spotify_token:
         st.error("Please authenticate with Spotify first.")
         return
     
-    try:
-        st.session_state.working = True
-        
-        with st.spinner("Creating your Spotify anti-playlist..."):
-            spotify_client = get_spotify_client_from_token(
-                st.session_state.spotify_token,
-                SPOTIFY_CLIENT_ID,
-                SPOTIFY_CLIENT_SECRET,
-                SPOTIFY_REDIRECT_URI,
-                SPOTIFY_SCOPE
-            )
-            
-            spotify_user = spotify_client.me()
-            spotify_user_id = spotify_user['id']
-            history = load_history(spotify_user_id, 'spotify')
-            
-            progress_container = st.empty()
-            progress_container.info("Analyzing your music preferences...")
-            
-            top_genres = analyze_user_genres(spotify_client)
-            if top_genres:
-                progress_container.info(f"Found your top genres: {', '.join([g for g, _ in top_genres[:3]])}")
-            
-            progress_container.info("Searching for music opposite to your taste...")
-            track_ids = find_opposite_tracks(spotify_client, top_genres, history)
-            
-            if not track_ids:
-                progress_container.error("Could not find enough contrasting tracks.")
-                st.session_state.working = False
-                st.session_state.done = True
-                return
-            
-            progress_container.info(f"Found {len(track_ids)} unique contrasting tracks. Creating playlist...")
-            result_message = create_anti_playlist(spotify_client)
-            
-            save_history(spotify_user_id, 'spotify', track_ids)
-            progress_container.success(result_message)
-            st.balloons()
-        
-        st.session_state.working = False
-        st.session_state.done = True
-    except Exception as e:
-        st.error(f"Error creating Spotify anti-playlist: {str(e)}")
-        st.session_state.working = False
+    token_info = st.session_state.spotify_token
+    secret = token_info.get('refresh_token') or token_info.get('access_token') or json.dumps(token_info, sort_keys=True)
+    _start_job(
+        _job_dedupe_key('spotify', secret), 'spotify', spotify_service().run_spotify_generation,
+        token_info, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, SPOTIFY_SCOPE
+    )
 
 def create_youtube_anti_playlist():
     """Create an anti-playlist on YouTube Music"""
@@ -215,28 +216,46 @@ def create_youtube_anti_playlist():
         st.error("Please authenticate with YouTube first.")
         return
     
-    try:
-        st.session_state.working = True
-        
-        with st.spinner("Creating your YouTube Music anti-playlist..."):
-            # Using the original create_anti_playlist_main_flow function
-            result = create_anti_playlist_main_flow(
-                st.session_state.youtube_credentials,
-                YOUTUBE_CLIENT_ID,
-                YOUTUBE_CLIENT_SECRET
-            )
-            
-            if result:
-                st.success("Successfully created YouTube Music anti-playlist!")
-                st.balloons()
-            else:
-                st.error("Failed to create YouTube Music anti-playlist")
-        
-        st.session_state.working = False
-        st.session_state.done = True
-    except Exception as e:
-        st.error(f"Error creating YouTube anti-playlist: {str(e)}")
+    credentials = st.session_state.youtube_credentials
+    secret = getattr(credentials, 'refresh_token', None) or getattr(credentials, 'token', None) or repr(credentials)
+    _start_job(_job_dedupe_key('youtube', secret), 'youtube', youtube_service().run_youtube_generation, credentials)
+
+def show_job_progress():
+    """Renders the running job's stage updates, polling until it finishes."""
+    job = jobs.get_job(st.session_state.job_id, st.session_state.job_events_seen)
+    if job is None:
+        st.session_state.job_id = None
         st.session_state.working = False
+        return
+    
+    # Only new events are read on each poll; earlier ones are kept in the session.
+    # A 'progress' event only updates the spinner until the next event replaces it.
+    events = st.session_state.job_events
+    for event in job['events']:
+        if events and events[-1][0] == 'progress':
+            events.pop()
+        events.append((event['stage'], event['message']))
+    if job['events']:
+        st.session_state.job_events_seen = job['events'][-1]['id']
+    
+    platform_name = "Spotify" if job['platform'] == 'spotify' else "YouTube Music"
+    for stage, message in events[:-1]:
+        st.write(f"✓ {message}")
+    
+    if jobs.is_active(job):
+        with st.spinner(events[-1][1] if events else f"Creating your {platform_name} anti-playlist..."):
+            time.sleep(JOB_POLL_SECONDS)
+        st.experimental_rerun()
+    
+    if job['status'] == 'succeeded':
+        st.success(job['result']['message'])
+        st.balloons()
+    else:
+        st.error(f"Error creating {platform_name} anti-playlist: {job['error']}")
+    
+    st.session_state.job_id = None
+    st.session_state.working = False
+    st.session_state.done = True
 
 # Main app UI
 def main():
@@ -285,6 +304,9 @@ def main():
     elif "code" in query_params and "callback/youtube" in callback_path and not st.session_state.callback_processed:
         process_youtube_callback()
     
+    if st.session_state.job_id:
+        show_job_progress()
+    
     if not st.session_state.working and not st.session_state.done:
         col1, col2 = st.columns(2)
         
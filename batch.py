@@ -0,0 +1,200 @@
+"""
+Regenerates anti-playlists for many users from stored tokens.
+
+    python batch.py manifest.jsonl [--run-id 2024-05] [--spotify-concurrency 4] ...
+
+The manifest has one JSON object per line:
+
+    {"user": "alice", "platform": "spotify", "token": {...spotipy token_info...}}
+    {"user": "bob", "platform": "youtube", "token": {...google authorized-user info...}}
+
+Users are spread over a process pool. Each user's status is recorded in the
+batch_runs table under the run ID (the current month by default), so running
+the same command again after an interruption only retries users that did not
+succeed.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import database
+from services.rate_limiter import DEFAULT_BUDGETS
+
+PLATFORMS = ('spotify', 'youtube')
+
+# --- Batch Configuration ---
+# Users generated at once per provider, across all worker processes
+DEFAULT_CONCURRENCY = {
+    'spotify': int(os.environ.get('OTTER_BATCH_SPOTIFY_CONCURRENCY', '4')),
+    'youtube': int(os.environ.get('OTTER_BATCH_YOUTUBE_CONCURRENCY', '2')),
+}
+
+def load_manifest(path):
+    """Reads and validates the manifest, returning a list of entries."""
+    entries = []
+    seen = set()
+    with open(path, 'r') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_no}: invalid JSON ({e})")
+            user, platform, token = entry.get('user'), entry.get('platform'), entry.get('token')
+            if not user or platform not in PLATFORMS or not isinstance(token, dict):
+                raise ValueError(f"{path}:{line_no}: expected 'user', 'platform' ({'/'.join(PLATFORMS)}) and a 'token' object")
+            if (platform, user) in seen:
+                print(f"   ⚠ {path}:{line_no}: duplicate entry for {platform}/{user}, ignoring")
+                continue
+            seen.add((platform, user))
+            entries.append({'user': str(user), 'platform': platform, 'token': token})
+    return entries
+
+def _init_worker(concurrency):
+    """
+    Splits each provider's rate budget between the processes that may call it
+    concurrently, since every process has its own limiter. Explicit
+    OTTER_RATE_* overrides are divided the same way.
+    """
+    from services.rate_limiter import _budget_for
+    for (provider, backend) in DEFAULT_BUDGETS:
+        share = max(1, concurrency.get(provider, 1))
+        rate, capacity = _budget_for(provider, backend)
+        os.environ[f"OTTER_RATE_{provider.upper()}_{backend.upper()}"] = f"{rate / share}/{max(1, int(capacity // share))}"
+
+def _youtube_credentials(info):
+    """Builds refreshed google-auth credentials from stored authorized-user info."""
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
+    from services.youtube_service import SCOPES
+    credentials = Credentials.from_authorized_user_info(info, SCOPES)
+    if not credentials.valid and credentials.refresh_token:
+        credentials.refresh(Request())
+    return credentials
+
+def _generate(platform, token, profile=None):
+    """Runs one user's generation in a worker process; returns a JSON-serializable summary."""
+    if platform == 'spotify':
+        from services.spotify_service import (
+            run_spotify_generation, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, SPOTIFY_SCOPE
+        )
+        result = run_spotify_generation(token, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REDIRECT_URI, SPOTIFY_SCOPE,
+                                        profile=profile)
+    else:
+        from services.youtube_service import run_youtube_generation
+        result = run_youtube_generation(_youtube_credentials(token), profile=profile)
+    # History was written by the service; only the summary is kept in the report
+    return {'playlist_id': result['playlist_id'], 'url': result['url'], 'track_count': len(result['track_ids'])}
+
+def run_batch(entries, run_id, concurrency, workers=None, profile=None):
+    """
+    Generates playlists for every entry not already successful in run_id.
+    At most concurrency[platform] users per provider run at once.
+    Returns the number of users that failed in this invocation.
+    """
+    statuses = database.load_batch_statuses(run_id)
+    pending = {platform: [] for platform in PLATFORMS}
+    skipped = 0
+    for entry in entries:
+        if statuses.get((entry['platform'], entry['user'])) == 'succeeded':
+            skipped += 1
+        else:
+            pending[entry['platform']].append(entry)
+
+    total = sum(len(queue) for queue in pending.values())
+    print(f"🚀 Batch run '{run_id}': {total} users to generate, {skipped} already done")
+    if not total:
+        return 0
+
+    limits = {platform: max(1, concurrency[platform]) for platform in PLATFORMS}
+    workers = workers or min(os.cpu_count() or 1, sum(limits[p] for p in PLATFORMS if pending[p]))
+    in_flight = {} # future -> entry
+    running = {platform: 0 for platform in PLATFORMS}
+    failed = 0
+    done = 0
+
+    # spawn: workers must not inherit the parent's SQLite connections
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(limits,)) as executor:
+        while in_flight or any(pending.values()):
+            for platform in PLATFORMS:
+                while pending[platform] and running[platform] < limits[platform]:
+                    entry = pending[platform].pop(0)
+                    database.mark_batch_running(run_id, platform, entry['user'])
+                    in_flight[executor.submit(_generate, platform, entry['token'], profile)] = entry
+                    running[platform] += 1
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                entry = in_flight.pop(future)
+                running[entry['platform']] -= 1
+                done += 1
+                label = f"{entry['platform']}/{entry['user']}"
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    error = str(e) or e.__class__.__name__
+                    database.save_batch_outcome(run_id, entry['platform'], entry['user'], 'failed', error=error)
+                    print(f"   ❌ [{done}/{total}] {label}: {error}")
+                else:
+                    database.save_batch_outcome(run_id, entry['platform'], entry['user'], 'succeeded', result=result)
+                    print(f"   ✓ [{done}/{total}] {label}: {result['track_count']} tracks, {result['url']}")
+    return failed
+
+def write_report(run_id, path):
+    """Writes every user's outcome for the run as JSON and prints a summary."""
+    outcomes = database.load_batch_outcomes(run_id)
+    counts = {}
+    for outcome in outcomes:
+        counts[outcome['status']] = counts.get(outcome['status'], 0) + 1
+    report = {
+        'run_id': run_id,
+        'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'counts': counts,
+        'users': outcomes
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📋 Report written to {path}: " + ', '.join(f"{n} {status}" for status, n in sorted(counts.items())))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate anti-playlists for every user in a token manifest.")
+    parser.add_argument('manifest', help="JSON Lines file of {user, platform, token} entries")
+    parser.add_argument('--run-id', default=datetime.date.today().strftime('%Y-%m'),
+                        help="Resume key; users that already succeeded under it are skipped (default: current month)")
+    parser.add_argument('--spotify-concurrency', type=int, default=DEFAULT_CONCURRENCY['spotify'])
+    parser.add_argument('--youtube-concurrency', type=int, default=DEFAULT_CONCURRENCY['youtube'])
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count, capped by the concurrency limits)")
+    parser.add_argument('--profile', action='store_true', default=None,
+                        help="Save stage spans and a cProfile for every user under data/profiles")
+    parser.add_argument('--report', default=None, help="Report path (default: data/batch_report_<run-id>.json)")
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    try:
+        entries = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read manifest: {e}")
+        return 2
+
+    started = time.perf_counter()
+    concurrency = {'spotify': args.spotify_concurrency, 'youtube': args.youtube_concurrency}
+    try:
+        failed = run_batch(entries, args.run_id, concurrency, args.workers, args.profile)
+    except KeyboardInterrupt:
+        print("\n⚠ Interrupted. Run the same command again to resume.")
+        failed = None
+    print(f"⏱ Finished in {time.perf_counter() - started:.1f}s")
+    write_report(args.run_id, args.report or database.DATA_DIR / f"batch_report_{args.run_id}.json")
+    return 1 if failed is None or failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
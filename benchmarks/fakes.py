@@ -0,0 +1,197 @@
+"""
+Deterministic in-process stand-ins for spotipy.Spotify and ytmusicapi.YTMusic.
+
+Responses are generated from a seed and the call arguments, so the same
+query always returns the same results. Every call sleeps for `latency`
+seconds (to model network round trips) and is counted in `calls`.
+"""
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+
+# Raw genre strings in the style Spotify returns for artists
+GENRE_STEMS = [
+    'pop', 'rock', 'hip hop', 'rap', 'edm', 'house', 'techno', 'r&b', 'soul', 'jazz', 'blues',
+    'country', 'folk', 'indie', 'metal', 'punk', 'classical', 'reggae', 'latin', 'k-pop', 'lo-fi',
+    'trap', 'drill', 'ambient', 'disco', 'funk', 'gospel', 'grunge', 'emo', 'shoegaze'
+]
+GENRE_PREFIXES = ['', 'dance ', 'indie ', 'modern ', 'alternative ', 'uk ', 'latin ', 'dark ', 'art ', 'chill ']
+
+# Title fragments for YouTube search results; some trip the authenticity filter
+TITLE_WORDS = [
+    'traditional', 'live', 'official audio', 'instrumental', 'folk song', 'dance cover', 'tutorial',
+    'reaction', 'remix', 'lyrics', 'karaoke', 'original', 'classical', 'festival', 'shorts', 'ceremony'
+]
+
+class _FakeClient:
+    def __init__(self, latency=0.0, seed=0):
+        self.latency = latency
+        self.seed = seed
+        self.calls = Counter()
+        self.search_queries = [] # Every query passed to search(), in call order
+        self._lock = threading.Lock()
+
+    def _call(self, method):
+        with self._lock:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _rng(self, *key):
+        """A Random seeded by the client seed and the call arguments."""
+        return random.Random(zlib.crc32(repr((self.seed,) + key).encode('utf-8')))
+
+class FakeSpotify(_FakeClient):
+    """Implements the spotipy.Spotify methods used by spotify_service."""
+    def __init__(self, latency=0.0, seed=0, user_id='bench-user', artists_per_range=50):
+        super().__init__(latency, seed)
+        self.user_id = user_id
+        self.artists_per_range = artists_per_range
+        self.playlists = {}
+        self.playlist_meta = [] # Playlists as listed by current_user_playlists
+
+    def me(self):
+        self._call('me')
+        return {'id': self.user_id, 'display_name': self.user_id}
+
+    def current_user_top_artists(self, limit=20, offset=0, time_range='medium_term'):
+        self._call('current_user_top_artists')
+        rng = self._rng('top', time_range)
+        items = []
+        for i in range(min(limit, self.artists_per_range)):
+            genres = [rng.choice(GENRE_PREFIXES) + rng.choice(GENRE_STEMS) for _ in range(rng.randint(0, 5))]
+            items.append({'id': f"artist-{time_range}-{i}", 'name': f"Artist {i}", 'genres': genres})
+        return {'items': items}
+
+    def search(self, q, limit=10, offset=0, type='track', market=None):
+        self._call('search')
+        self.search_queries.append(q)
+        rng = self._rng('search', q, type)
+        items = []
+        for i in range(limit):
+            track_id = f"sp{zlib.crc32(q.encode('utf-8')):08x}{i:02d}"
+            items.append({
+                'id': track_id,
+                'name': f"{q.title()} Track {i}",
+                'artists': [{'id': f"artist-{track_id}", 'name': f"{q.title()} Artist {rng.randint(1, 9)}"}],
+                'duration_ms': rng.randint(90, 420) * 1000,
+                'popularity': rng.randint(0, 100),
+                'album': {'id': f"album-{track_id}", 'name': f"{q.title()} Album"},
+            })
+        return {'tracks': {'items': items, 'total': limit}}
+
+    def user_playlist_create(self, user, name, public=True, collaborative=False, description=''):
+        self._call('user_playlist_create')
+        playlist_id = f"pl{len(self.playlists):04d}"
+        self.playlists[playlist_id] = []
+        playlist = {'id': playlist_id, 'name': name, 'description': description, 'owner': {'id': user},
+                    'external_urls': {'spotify': f"https://open.spotify.com/playlist/{playlist_id}"}}
+        self.playlist_meta.append(playlist)
+        return dict(playlist)
+
+    def playlist_add_items(self, playlist_id, items, position=None):
+        self._call('playlist_add_items')
+        if len(items) > 100:
+            raise ValueError("Spotify accepts at most 100 items per call")
+        self.playlists[playlist_id].extend(items)
+        return {'snapshot_id': f"{playlist_id}-{len(self.playlists[playlist_id])}"}
+
+    def current_user_playlists(self, limit=50, offset=0):
+        self._call('current_user_playlists')
+        return self._page('playlists', [dict(p) for p in self.playlist_meta], limit, offset)
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, market=None, additional_types=('track',)):
+        self._call('playlist_items')
+        items = [{'track': {'id': track_id}} for track_id in self.playlists[playlist_id]]
+        return self._page(('items', playlist_id), items, limit, offset)
+
+    def next(self, result):
+        self._call('next')
+        kind, items, limit, offset = result['_page']
+        return self._page(kind, items, limit, offset + limit) if result['next'] else None
+
+    @staticmethod
+    def _page(kind, items, limit, offset):
+        """A spotipy-style paging object; 'next' is truthy while more items remain."""
+        has_next = offset + limit < len(items)
+        return {'items': items[offset:offset + limit], 'next': f"{kind}?offset={offset + limit}" if has_next else None,
+                '_page': (kind, items, limit, offset)}
+
+class FakeYTMusic(_FakeClient):
+    """Implements the ytmusicapi.YTMusic methods used by youtube_service."""
+    def __init__(self, latency=0.0, seed=0, account='bench-account', history_size=200,
+                 anti_playlists=6, other_playlists=20, playlist_size=25):
+        super().__init__(latency, seed)
+        self.account = account
+        self.history_size = history_size
+        self.library = []
+        self.playlists = {}
+        self.descriptions = {} # As returned by get_playlist; library listings carry only the subtitle
+        for i in range(anti_playlists + other_playlists):
+            playlist_id = f"{account}-PL{i:03d}"
+            title = f"Anti Playlist {i}" if i < anti_playlists else f"Playlist {i}"
+            self.library.append(self._listing(playlist_id, title, playlist_size))
+            self.playlists[playlist_id] = [f"{account}-v{i:03d}{j:03d}" for j in range(playlist_size)]
+
+    @staticmethod
+    def _listing(playlist_id, title, count):
+        """A get_library_playlists entry; like ytmusicapi, 'description' is the subtitle text."""
+        return {'playlistId': playlist_id, 'title': title, 'description': f"Playlist • {count} tracks",
+                'count': str(count)}
+
+    def get_account_info(self):
+        self._call('get_account_info')
+        return {'accountName': self.account, 'channelHandle': f"@{self.account}"}
+
+    def get_history(self):
+        self._call('get_history')
+        rng = self._rng('history', self.account)
+        tracks = []
+        for i in range(self.history_size):
+            stem = rng.choice(GENRE_STEMS)
+            tracks.append({
+                'videoId': f"{self.account}-h{i:04d}",
+                'title': f"{rng.choice(GENRE_PREFIXES)}{stem} song {i}",
+                'artists': [{'name': f"{stem} artist {rng.randint(1, 40)}"}],
+                'album': {'name': f"{rng.choice(GENRE_STEMS)} album"} if rng.random() < 0.7 else None,
+            })
+        return tracks
+
+    def get_library_playlists(self, limit=25):
+        self._call('get_library_playlists')
+        return [dict(playlist) for playlist in self.library]
+
+    def get_playlist(self, playlistId, limit=100, related=False, suggestions_limit=0):
+        self._call('get_playlist')
+        return {'id': playlistId, 'description': self.descriptions.get(playlistId),
+                'tracks': [{'videoId': video_id} for video_id in self.playlists[playlistId][:limit]]}
+
+    def search(self, query, filter=None, scope=None, limit=20, ignore_spelling=False):
+        self._call('search')
+        self.search_queries.append(query)
+        rng = self._rng('search', query, filter)
+        results = []
+        for i in range(limit):
+            results.append({
+                'resultType': 'song',
+                'videoId': f"yt{zlib.crc32(query.encode('utf-8')):08x}{i:02d}",
+                'title': f"{query} {rng.choice(TITLE_WORDS)} {i}",
+                'artists': [{'name': f"{query} artist"}],
+                'duration_seconds': rng.randint(30, 600),
+            })
+        return results
+
+    def create_playlist(self, title, description, privacy_status='PRIVATE', video_ids=None, source_playlist=None):
+        self._call('create_playlist')
+        playlist_id = f"{self.account}-NEW{len(self.playlists):03d}"
+        self.playlists[playlist_id] = list(video_ids or [])
+        self.descriptions[playlist_id] = description
+        self.library.append(self._listing(playlist_id, title, len(self.playlists[playlist_id])))
+        return playlist_id
+
+    def add_playlist_items(self, playlistId, videoIds=None, source_playlist=None, duplicates=False):
+        self._call('add_playlist_items')
+        self.playlists[playlistId].extend(videoIds or [])
+        return {'status': 'STATUS_SUCCEEDED'}
@@ -0,0 +1,116 @@
+"""
+Checks module import times against a budget, each in a fresh interpreter.
+
+    python -m benchmarks.import_time [--output import_times.json]
+
+Also checks that the modules app.py imports on every script run do not pull
+in the provider SDKs, which app.py loads lazily. Exits non-zero when any
+check fails, so it can gate CI.
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# module -> budget in milliseconds (cumulative import time, cold)
+IMPORT_BUDGETS_MS = {
+    'database': 50,
+    'services.metrics': 100,
+    'services.taxonomy': 60,
+    'jobs': 150,
+    'services.spotify_service': 1500,
+    'services.youtube_service': 1500,
+}
+# Scale every budget, e.g. OTTER_IMPORT_BUDGET_SCALE=2 on slow CI machines
+BUDGET_SCALE = float(os.environ.get('OTTER_IMPORT_BUDGET_SCALE', '1.0'))
+
+# Must not be imported by app.py's startup path
+PROVIDER_MODULES = ('spotipy', 'ytmusicapi', 'google_auth_oauthlib',
+                    'services.spotify_service', 'services.youtube_service')
+
+# __import__ goes through the C import path, which -X importtime reports on
+_PROBE = '''
+import json, sys
+__import__(sys.argv[1])
+print(json.dumps(sorted(sys.modules)))
+'''
+
+def measure_import(module, cwd):
+    """Imports module in a fresh interpreter; returns (cumulative ms, loaded module names)."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE, module],
+        cwd=cwd, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=os.pathsep.join(
+            filter(None, [str(ROOT), os.environ.get('PYTHONPATH')])))
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative_us = int(fields[1])
+    return (cumulative_us or 0) / 1000, json.loads(proc.stdout)
+
+def app_startup_imports(path=ROOT / 'app.py'):
+    """Returns the project modules app.py imports at module level."""
+    modules = []
+    for node in ast.parse(path.read_text()).body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            modules.append(node.module)
+    return [m for m in modules if (ROOT / (m.replace('.', '/') + '.py')).exists()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check import times against their budgets.")
+    parser.add_argument('--output', help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    # Imports create the data directory relative to the working directory
+    workdir = tempfile.mkdtemp(prefix='otter-imports-')
+    results = []
+    failures = []
+    for module, budget_ms in IMPORT_BUDGETS_MS.items():
+        budget_ms *= BUDGET_SCALE
+        try:
+            elapsed_ms, _ = measure_import(module, workdir)
+        except RuntimeError as e:
+            failures.append(str(e))
+            results.append({'module': module, 'budget_ms': budget_ms, 'error': str(e)})
+            continue
+        ok = elapsed_ms <= budget_ms
+        results.append({'module': module, 'import_ms': elapsed_ms, 'budget_ms': budget_ms, 'ok': ok})
+        print(f"{'✓' if ok else '❌'} {module:<28} {elapsed_ms:8.1f} ms (budget {budget_ms:.0f} ms)")
+        if not ok:
+            failures.append(f"{module} took {elapsed_ms:.1f} ms, over its {budget_ms:.0f} ms budget")
+
+    startup_modules = app_startup_imports()
+    leaked = set()
+    for module in startup_modules:
+        _, loaded = measure_import(module, workdir)
+        leaked.update(m for m in PROVIDER_MODULES if m in loaded)
+    leaked.update(m for m in PROVIDER_MODULES if m in startup_modules)
+    print(f"{'✓' if not leaked else '❌'} app.py startup imports {', '.join(startup_modules) or 'nothing'}"
+          + (f" (pulls in {', '.join(sorted(leaked))})" if leaked else " (no provider SDKs)"))
+    if leaked:
+        failures.append(f"app.py startup imports load {', '.join(sorted(leaked))}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'imports': results, 'app_startup_modules': startup_modules,
+                       'provider_modules_loaded_at_startup': sorted(leaked), 'failures': failures}, f, indent=2)
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
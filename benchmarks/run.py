@@ -0,0 +1,217 @@
+"""
+Benchmarks the CPU hot paths and end-to-end flows against the fake clients.
+
+    python -m benchmarks.run [--latency-ms 20] [--iterations 5] [--output results.json]
+
+Prints (or writes) JSON with wall time, API call counts per iteration and
+peak traced memory for each benchmark. Runs in a temporary data directory
+so the real databases and caches are never touched.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.fakes import FakeSpotify, FakeYTMusic, GENRE_PREFIXES, GENRE_STEMS, TITLE_WORDS
+
+# Provider budgets are lifted so benchmarks measure our code, not the limiter
+# (pass --rate-limits to keep them).
+UNLIMITED_RATE = '100000/100000'
+RATE_LIMITED_BACKENDS = [('SPOTIFY', b) for b in ('DEFAULT', 'SEARCH', 'WRITE')] + \
+                        [('YOUTUBE', b) for b in ('DEFAULT', 'SEARCH', 'LIBRARY', 'WRITE')]
+
+def _services():
+    """Imports the services lazily, after the working directory and env are set up."""
+    from services import spotify_service, youtube_service
+    from services.search_cache import get_search_cache
+    from services.catalog import get_catalog
+    return spotify_service, youtube_service, get_search_cache(), get_catalog()
+
+class Benchmark:
+    """
+    One benchmark: setup(i) builds fresh state for iteration i (untimed) and
+    returns (run, clients); run() is the timed body; clients are the fakes
+    whose calls are counted.
+    """
+    def __init__(self, name, setup):
+        self.name = name
+        self.setup = setup
+
+    def measure(self, iterations, seed):
+        wall_times = []
+        calls = Counter()
+        for i in range(iterations):
+            run, clients = self.setup(i)
+            random.seed(seed + i)
+            started = time.perf_counter()
+            run()
+            wall_times.append(time.perf_counter() - started)
+            for client in clients:
+                calls.update(client.calls)
+
+        # Peak memory is taken from one extra traced run, since tracing slows everything down
+        run, _ = self.setup(iterations)
+        random.seed(seed)
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'name': self.name,
+            'iterations': iterations,
+            'wall_seconds': {
+                'min': min(wall_times),
+                'median': statistics.median(wall_times),
+                'mean': statistics.fmean(wall_times),
+                'max': max(wall_times),
+            },
+            'api_calls_per_iteration': {method: count / iterations for method, count in sorted(calls.items())},
+            'peak_memory_bytes': peak,
+        }
+
+def build_benchmarks(latency, seed):
+    spotify_service, youtube_service, search_cache, catalog = _services()
+
+    def spotify_client(i, user='bench-user'):
+        return FakeSpotify(latency=latency, seed=seed, user_id=f"{user}-{i}")
+
+    def ytmusic_client(i, account='bench-account'):
+        return FakeYTMusic(latency=latency, seed=seed, account=f"{account}-{i}")
+
+    def analyze_user_genres(i):
+        sp = spotify_client(i)
+        return (lambda: spotify_service.analyze_user_genres(sp)), [sp]
+
+    def analyze_recent_genres(i):
+        ytmusic = ytmusic_client(i)
+        # No user_id: always scores the full history instead of reading a stored profile
+        return (lambda: youtube_service.analyze_recent_genres(ytmusic)), [ytmusic]
+
+    titles = [f"song {n} {' '.join(random.Random(n).sample(TITLE_WORDS, 3))}" for n in range(5000)]
+    def is_authentic_music(i):
+        return (lambda: youtube_service.classify_many(titles)), []
+
+    cultures = [culture for culture, _ in youtube_service.AUTHENTIC_MUSIC_SEARCHES]
+    candidates = [{'id': f"v{n}", 'culture': cultures[n % len(cultures)], 'title': f"song {n}"} for n in range(2000)]
+    def select_final_tracks(i):
+        return (lambda: youtube_service.select_final_tracks(candidates)), []
+
+    # A synthetic genre space over every fake genre; needs numpy
+    from services import genre_space
+    genre_rng = random.Random(seed)
+    fake_genres = [prefix + stem for prefix in GENRE_PREFIXES for stem in GENRE_STEMS]
+    space = genre_space.build_genre_space([genre_rng.sample(fake_genres, genre_rng.randint(1, 5)) for _ in range(20000)])
+    user_genres = [(genre, genre_rng.randint(1, 20)) for genre in genre_rng.sample(fake_genres, 40)]
+    def genre_space_most_opposite(i):
+        return (lambda: space.most_opposite(user_genres, spotify_service.LEARNED_OPPOSITE_POOL)), []
+
+    def spotify_end_to_end(i):
+        # Cold search cache, no catalog and a fresh user, so every iteration does the full work
+        search_cache.clear()
+        catalog.clear()
+        sp = spotify_client(i)
+        return (lambda: spotify_service.generate_anti_playlist(sp)), [sp]
+
+    def youtube_end_to_end(i):
+        search_cache.clear()
+        catalog.clear()
+        ytmusic = ytmusic_client(i)
+        return (lambda: youtube_service.create_anti_playlist_main_flow(ytmusic)), [ytmusic]
+
+    def spotify_catalog_end_to_end(i):
+        # Candidates come from a fully harvested catalog; the harvest itself is not timed.
+        # Own users, so the profiles and history of the runs above are not reused.
+        search_cache.clear()
+        catalog.clear()
+        spotify_service.harvest_catalog(spotify_client(i, 'bench-catalog-user'), max_age=0)
+        sp = spotify_client(i, 'bench-catalog-user')
+        return (lambda: spotify_service.generate_anti_playlist(sp)), [sp]
+
+    def youtube_catalog_end_to_end(i):
+        search_cache.clear()
+        catalog.clear()
+        youtube_service.harvest_catalog(ytmusic_client(i, 'bench-catalog-account'), max_age=0)
+        ytmusic = ytmusic_client(i, 'bench-catalog-account')
+        return (lambda: youtube_service.create_anti_playlist_main_flow(ytmusic)), [ytmusic]
+
+    return [
+        Benchmark('analyze_user_genres', analyze_user_genres),
+        Benchmark('analyze_recent_genres', analyze_recent_genres),
+        Benchmark('is_authentic_music', is_authentic_music),
+        Benchmark('select_final_tracks', select_final_tracks),
+        *([Benchmark('genre_space_most_opposite', genre_space_most_opposite)] if space is not None else []),
+        Benchmark('spotify_end_to_end', spotify_end_to_end),
+        Benchmark('youtube_end_to_end', youtube_end_to_end),
+        Benchmark('spotify_catalog_end_to_end', spotify_catalog_end_to_end),
+        Benchmark('youtube_catalog_end_to_end', youtube_catalog_end_to_end),
+    ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Otter against in-process fake provider clients.")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Simulated latency per API call")
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', help="Benchmark names to run (default: all)")
+    parser.add_argument('--rate-limits', action='store_true', help="Keep the real provider rate budgets")
+    parser.add_argument('--output', help="Write JSON results to this file instead of stdout")
+    parser.add_argument('--verbose', action='store_true', help="Show the services' progress output")
+    args = parser.parse_args(argv)
+
+    if not args.rate_limits:
+        for provider, backend in RATE_LIMITED_BACKENDS:
+            os.environ[f"OTTER_RATE_{provider}_{backend}"] = UNLIMITED_RATE
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='otter-bench-') as workdir:
+        # database.DATA_DIR is relative to the working directory
+        os.chdir(workdir)
+        results = []
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            benchmarks = build_benchmarks(args.latency_ms / 1000, args.seed)
+            for benchmark in benchmarks:
+                if args.only and benchmark.name not in args.only:
+                    continue
+                results.append(benchmark.measure(args.iterations, args.seed))
+        os.chdir(cwd)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'latency_ms': args.latency_ms,
+            'iterations': args.iterations,
+            'seed': args.seed,
+            'rate_limits': args.rate_limits,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        for result in results:
+            print(f"{result['name']:<24} median {result['wall_seconds']['median'] * 1000:9.2f} ms  "
+                  f"peak {result['peak_memory_bytes'] / 1024:9.1f} KiB")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,9 @@
 import sqlite3
 import os
 import json
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 # Create a data directory if it doesn't exist
@@ -10,13 +13,18 @@ DATA_DIR.mkdir(exist_ok=True)
 # Database path
 DB_PATH = DATA_DIR / 'anti_playlist.db'
 
-def init_db():
-    """Initialize database tables"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Create history table
-    c.execute('''
+# --- Connection Settings ---
+# Applied to every connection opened through get_connection().
+BUSY_TIMEOUT_MS = int(os.environ.get('OTTER_DB_BUSY_TIMEOUT_MS', '10000'))
+CACHE_SIZE_KIB = int(os.environ.get('OTTER_DB_CACHE_SIZE_KIB', '16384')) # Page cache per connection
+MMAP_SIZE_BYTES = int(os.environ.get('OTTER_DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+
+# Stored taste profiles younger than this are reused without calling the provider
+PROFILE_TTL_SECONDS = int(os.environ.get('OTTER_PROFILE_TTL', str(24 * 3600)))
+
+# Schema for DB_PATH, created once per process by init_db()
+SCHEMA = [
+    '''
     CREATE TABLE IF NOT EXISTS history (
         id INTEGER PRIMARY KEY,
         user_id TEXT NOT NULL,
@@ -25,40 +33,571 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         UNIQUE(user_id, platform, song_id)
     )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS genre_map (
+        raw_genre TEXT NOT NULL,
+        taxonomy_version TEXT NOT NULL,
+        genre TEXT,
+        PRIMARY KEY (raw_genre, taxonomy_version)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS artist_genres (
+        artist_id TEXT PRIMARY KEY,
+        genres TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS playlist_snapshots (
+        playlist_id TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        video_ids TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS taste_profiles (
+        user_id TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        genres TEXT NOT NULL,
+        last_item TEXT,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (user_id, platform)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS profile_windows (
+        user_id TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        items TEXT NOT NULL,
+        PRIMARY KEY (user_id, platform)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        dedupe_key TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        status TEXT NOT NULL,
+        stage TEXT,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, status)',
+    '''
+    CREATE TABLE IF NOT EXISTS job_leases (
+        job_id TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        heartbeat_at REAL NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS job_events (
+        id INTEGER PRIMARY KEY,
+        job_id TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        message TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, id)',
+    '''
+    CREATE TABLE IF NOT EXISTS playlist_writes (
+        write_id TEXT PRIMARY KEY,
+        platform TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        track_ids TEXT NOT NULL,
+        meta TEXT,
+        playlist_id TEXT,
+        written INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_playlist_writes_user ON playlist_writes (platform, user_id, status)',
+    '''
+    CREATE TABLE IF NOT EXISTS batch_runs (
+        run_id TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        user_key TEXT NOT NULL,
+        status TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (run_id, platform, user_key)
+    )
+    ''',
+]
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def _configure(conn):
+    """Applies WAL journaling and tuned pragmas to a new connection."""
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL') # Safe with WAL, avoids an fsync per commit
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE_BYTES}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+def get_connection(path=DB_PATH):
+    """
+    Returns the calling thread's connection to `path`, opening and configuring
+    it on first use. Connections are reused for the lifetime of the thread.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    key = str(path)
+    conn = connections.get(key)
+    if conn is None:
+        # isolation_level=None: transactions are managed explicitly by transaction()
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        _configure(conn)
+        connections[key] = conn
+    return conn
+
+@contextmanager
+def transaction(path=DB_PATH):
+    """
+    Runs a write transaction on this thread's connection. BEGIN IMMEDIATE takes
+    the write lock up front, so contention is resolved by the busy timeout
+    instead of failing mid-transaction with "database is locked".
+    """
+    conn = get_connection(path)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
+
+def close_connections():
+    """Closes every connection opened by the calling thread."""
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+def init_db():
+    """Initialize database tables (runs once per process; later calls are no-ops)"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        _schema_ready = True
 
 def save_history(user_id, platform, song_ids):
     """Save new song IDs to history"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
+    init_db()
+
     # Prepare data for batch insert
     data = [(user_id, platform, song_id) for song_id in song_ids]
-    
+
     # Insert or ignore (to handle duplicates)
-    c.executemany('''
-    INSERT OR IGNORE INTO history (user_id, platform, song_id)
-    VALUES (?, ?, ?)
-    ''', data)
-    
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.executemany('''
+        INSERT OR IGNORE INTO history (user_id, platform, song_id)
+        VALUES (?, ?, ?)
+        ''', data)
 
 def load_history(user_id, platform):
     """Load all song IDs for a user/platform from history"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''
+    init_db()
+
+    c = get_connection().execute('''
     SELECT song_id FROM history
     WHERE user_id = ? AND platform = ?
     ''', (user_id, platform))
-    
+
     # Extract song IDs and return as a set
-    results = c.fetchall()
-    conn.close()
-    
-    return set(row[0] for row in results)
+    return set(row[0] for row in c.fetchall())
+
+# SQLite limits bound parameters per statement; stay well below the minimum (999)
+HISTORY_LOOKUP_CHUNK_SIZE = 500
+
+def find_known_songs(user_id, platform, song_ids):
+    """
+    Return the subset of song_ids that are already in a user's history.
+    Cost scales with the number of IDs checked, not with the size of the history.
+    """
+    init_db()
+
+    song_ids = list(dict.fromkeys(song_ids)) # Deduplicate, keep order
+    known = set()
+    conn = get_connection()
+    for i in range(0, len(song_ids), HISTORY_LOOKUP_CHUNK_SIZE):
+        chunk = song_ids[i:i + HISTORY_LOOKUP_CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        c = conn.execute(f'''
+        SELECT song_id FROM history
+        WHERE user_id = ? AND platform = ? AND song_id IN ({placeholders})
+        ''', [user_id, platform] + chunk)
+        known.update(row[0] for row in c.fetchall())
+    return known
+
+def load_genre_map(taxonomy_version):
+    """Load the raw genre -> taxonomy genre index for a taxonomy version (None = unmapped)"""
+    init_db()
+
+    c = get_connection().execute('''
+    SELECT raw_genre, genre FROM genre_map WHERE taxonomy_version = ?
+    ''', (taxonomy_version,))
+    return dict(c.fetchall())
+
+def save_genre_map(taxonomy_version, mapping):
+    """Persist new raw genre -> taxonomy genre entries"""
+    init_db()
+
+    data = [(raw_genre, taxonomy_version, genre) for raw_genre, genre in mapping.items()]
+    with transaction() as conn:
+        conn.executemany('''
+        INSERT OR REPLACE INTO genre_map (raw_genre, taxonomy_version, genre)
+        VALUES (?, ?, ?)
+        ''', data)
+
+def save_artist_genres(artists):
+    """Store raw Spotify genres per artist, given as {artist_id: [genre, ...]}"""
+    init_db()
+
+    now = time.time()
+    data = [(artist_id, json.dumps(sorted(set(genres))), now) for artist_id, genres in artists.items() if genres]
+    with transaction() as conn:
+        conn.executemany('''
+        INSERT OR REPLACE INTO artist_genres (artist_id, genres, updated_at)
+        VALUES (?, ?, ?)
+        ''', data)
+
+def load_artist_genres():
+    """Load every stored artist's genre list, one list per artist"""
+    init_db()
+
+    c = get_connection().execute('SELECT genres FROM artist_genres')
+    return [json.loads(genres) for (genres,) in c]
+
+def count_artist_genres():
+    """Number of artists with stored genres"""
+    init_db()
+
+    (count,) = get_connection().execute('SELECT COUNT(*) FROM artist_genres').fetchone()
+    return count
+
+def load_playlist_snapshots(playlist_ids):
+    """Load stored track lists for playlists: {playlist_id: (fingerprint, video_ids)}"""
+    init_db()
+
+    playlist_ids = list(playlist_ids)
+    snapshots = {}
+    conn = get_connection()
+    for i in range(0, len(playlist_ids), HISTORY_LOOKUP_CHUNK_SIZE):
+        chunk = playlist_ids[i:i + HISTORY_LOOKUP_CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        c = conn.execute(f'''
+        SELECT playlist_id, fingerprint, video_ids FROM playlist_snapshots
+        WHERE playlist_id IN ({placeholders})
+        ''', chunk)
+        for playlist_id, fingerprint, video_ids in c.fetchall():
+            snapshots[playlist_id] = (fingerprint, json.loads(video_ids))
+    return snapshots
+
+def save_playlist_snapshots(snapshots):
+    """Store playlist track lists, given as (playlist_id, fingerprint, video_ids) tuples"""
+    init_db()
+
+    data = [(playlist_id, fingerprint, json.dumps(list(video_ids)))
+            for playlist_id, fingerprint, video_ids in snapshots]
+    with transaction() as conn:
+        conn.executemany('''
+        INSERT OR REPLACE INTO playlist_snapshots (playlist_id, fingerprint, video_ids, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', data)
+
+def load_taste_profile(user_id, platform):
+    """Load a user's stored genre vector: {'genres': [(genre, score)], 'last_item', 'updated_at'} or None"""
+    init_db()
+
+    row = get_connection().execute('''
+    SELECT genres, last_item, updated_at FROM taste_profiles
+    WHERE user_id = ? AND platform = ?
+    ''', (user_id, platform)).fetchone()
+    if row is None:
+        return None
+    genres, last_item, updated_at = row
+    return {
+        'genres': [tuple(pair) for pair in json.loads(genres)],
+        'last_item': last_item,
+        'updated_at': updated_at
+    }
+
+def save_taste_profile(user_id, platform, genres, last_item=None, window=None):
+    """
+    Store a user's genre vector, stamped with the current time. window, if
+    given, replaces the stored [(item_id, [(genre, score)])] list it was computed from.
+    """
+    init_db()
+
+    with transaction() as conn:
+        conn.execute('''
+        INSERT OR REPLACE INTO taste_profiles (user_id, platform, genres, last_item, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, platform, json.dumps([list(pair) for pair in genres]), last_item, time.time()))
+        if window is not None:
+            items = [[item_id, [list(pair) for pair in scores]] for item_id, scores in window]
+            conn.execute('''
+            INSERT OR REPLACE INTO profile_windows (user_id, platform, items) VALUES (?, ?, ?)
+            ''', (user_id, platform, json.dumps(items, separators=(',', ':'))))
+
+def load_profile_window(user_id, platform):
+    """Load the per-item genre scores behind a user's profile: {item_id: [(genre, score)]}"""
+    init_db()
+
+    row = get_connection().execute('''
+    SELECT items FROM profile_windows WHERE user_id = ? AND platform = ?
+    ''', (user_id, platform)).fetchone()
+    if row is None:
+        return {}
+    return {
+        item_id: [tuple(pair) for pair in scores]
+        for item_id, scores in json.loads(row[0])
+        if item_id is not None
+    }
+
+def is_profile_fresh(profile, ttl=PROFILE_TTL_SECONDS):
+    """True if a stored taste profile is younger than the TTL"""
+    return profile is not None and time.time() - profile['updated_at'] < ttl
+
+# --- Generation Jobs ---
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+def create_job(job_id, dedupe_key, platform, owner):
+    """Insert a new queued job, leased to the owning process"""
+    init_db()
+
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('''
+        INSERT INTO jobs (job_id, dedupe_key, platform, status, created_at, updated_at)
+        VALUES (?, ?, ?, 'queued', ?, ?)
+        ''', (job_id, dedupe_key, platform, now, now))
+        conn.execute('''
+        INSERT OR REPLACE INTO job_leases (job_id, owner, heartbeat_at) VALUES (?, ?, ?)
+        ''', (job_id, owner, now))
+
+def heartbeat_jobs(owner):
+    """Refresh the lease of every queued or running job owned by a process"""
+    init_db()
+
+    with transaction() as conn:
+        conn.execute('''
+        UPDATE job_leases SET heartbeat_at = ?
+        WHERE owner = ? AND job_id IN (SELECT job_id FROM jobs WHERE status IN (?, ?))
+        ''', (time.time(), owner) + ACTIVE_JOB_STATUSES)
+
+def load_active_job_owners():
+    """Return the owners of queued or running jobs"""
+    init_db()
+
+    rows = get_connection().execute('''
+    SELECT DISTINCT l.owner FROM job_leases l JOIN jobs j ON j.job_id = l.job_id
+    WHERE j.status IN (?, ?)
+    ''', ACTIVE_JOB_STATUSES).fetchall()
+    return {row[0] for row in rows}
+
+def find_active_job(dedupe_key):
+    """Return the ID of a queued or running job for dedupe_key, if any"""
+    init_db()
+
+    row = get_connection().execute('''
+    SELECT job_id FROM jobs
+    WHERE dedupe_key = ? AND status IN (?, ?)
+    ORDER BY created_at DESC LIMIT 1
+    ''', (dedupe_key,) + ACTIVE_JOB_STATUSES).fetchone()
+    return row[0] if row else None
+
+def update_job(job_id, status, result=None, error=None):
+    """Set a job's status, and its result or error once it has finished"""
+    init_db()
+
+    with transaction() as conn:
+        conn.execute('''
+        UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?
+        WHERE job_id = ?
+        ''', (status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+
+def add_job_event(job_id, stage, message):
+    """Append a stage progress update to a job"""
+    init_db()
+
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('''
+        INSERT INTO job_events (job_id, stage, message, created_at) VALUES (?, ?, ?, ?)
+        ''', (job_id, stage, message, now))
+        conn.execute('UPDATE jobs SET stage = ?, updated_at = ? WHERE job_id = ?', (stage, now, job_id))
+
+def load_job(job_id, events_after=0):
+    """Load a job and its stage events with id > events_after, or None"""
+    init_db()
+
+    conn = get_connection()
+    row = conn.execute('''
+    SELECT j.job_id, j.dedupe_key, j.platform, j.status, j.stage, j.result, j.error, j.created_at, j.updated_at,
+           l.owner, COALESCE(l.heartbeat_at, j.updated_at)
+    FROM jobs j LEFT JOIN job_leases l ON l.job_id = j.job_id WHERE j.job_id = ?
+    ''', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(zip(('job_id', 'dedupe_key', 'platform', 'status', 'stage', 'result', 'error',
+                    'created_at', 'updated_at', 'owner', 'heartbeat_at'), row))
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['events'] = [
+        {'id': event_id, 'stage': stage, 'message': message, 'created_at': created_at}
+        for event_id, stage, message, created_at in conn.execute('''
+        SELECT id, stage, message, created_at FROM job_events
+        WHERE job_id = ? AND id > ? ORDER BY id
+        ''', (job_id, events_after)).fetchall()
+    ]
+    return job
+
+def fail_abandoned_jobs(error, stale_before, dead_owners=()):
+    """
+    Mark queued or running jobs as failed when their owner is in dead_owners or
+    their last heartbeat (their last update, for jobs without a lease) is older
+    than stale_before. Jobs of live processes elsewhere are left alone.
+    """
+    init_db()
+
+    dead_owners = list(dead_owners)
+    owner_clause = f" OR l.owner IN ({', '.join('?' * len(dead_owners))})" if dead_owners else ''
+    with transaction() as conn:
+        return conn.execute(f'''
+        UPDATE jobs SET status = 'failed', error = ?, updated_at = ?
+        WHERE status IN (?, ?) AND job_id IN (
+            SELECT j.job_id FROM jobs j LEFT JOIN job_leases l ON l.job_id = j.job_id
+            WHERE COALESCE(l.heartbeat_at, j.updated_at) < ?{owner_clause}
+        )
+        ''', [error, time.time(), *ACTIVE_JOB_STATUSES, stale_before, *dead_owners]).rowcount
+
+def load_batch_statuses(run_id):
+    """Return {(platform, user_key): status} for every user recorded in a batch run"""
+    init_db()
+
+    rows = get_connection().execute(
+        'SELECT platform, user_key, status FROM batch_runs WHERE run_id = ?', (run_id,)
+    ).fetchall()
+    return {(platform, user_key): status for platform, user_key, status in rows}
+
+def mark_batch_running(run_id, platform, user_key):
+    """Record that a user's generation has started, counting the attempt"""
+    init_db()
+
+    with transaction() as conn:
+        conn.execute('''
+        INSERT INTO batch_runs (run_id, platform, user_key, status, attempts, updated_at)
+        VALUES (?, ?, ?, 'running', 1, ?)
+        ON CONFLICT (run_id, platform, user_key) DO UPDATE SET
+            status = 'running', error = NULL, attempts = attempts + 1, updated_at = excluded.updated_at
+        ''', (run_id, platform, user_key, time.time()))
+
+def save_batch_outcome(run_id, platform, user_key, status, result=None, error=None):
+    """Record a user's final status and its result or error"""
+    init_db()
+
+    with transaction() as conn:
+        conn.execute('''
+        UPDATE batch_runs SET status = ?, result = ?, error = ?, updated_at = ?
+        WHERE run_id = ? AND platform = ? AND user_key = ?
+        ''', (status, json.dumps(result) if result is not None else None, error, time.time(),
+              run_id, platform, user_key))
+
+def load_batch_outcomes(run_id):
+    """Return every user's outcome for a batch run, ordered by platform and user"""
+    init_db()
+
+    rows = get_connection().execute('''
+    SELECT platform, user_key, status, result, error, attempts, updated_at
+    FROM batch_runs WHERE run_id = ? ORDER BY platform, user_key
+    ''', (run_id,)).fetchall()
+    return [
+        {'platform': platform, 'user': user_key, 'status': status,
+         'result': json.loads(result) if result else None, 'error': error,
+         'attempts': attempts, 'updated_at': updated_at}
+        for platform, user_key, status, result, error, attempts, updated_at in rows
+    ]
+
+def create_playlist_write(write_id, platform, user_id, title, description, track_ids, meta=None):
+    """Persist the chosen tracks for a playlist before anything is written"""
+    init_db()
+
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('''
+        INSERT INTO playlist_writes
+            (write_id, platform, user_id, title, description, track_ids, meta, status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+        ''', (write_id, platform, user_id, title, description, json.dumps(list(track_ids)),
+              json.dumps(meta) if meta is not None else None, now, now))
+
+_PLAYLIST_WRITE_COLUMNS = ('write_id', 'platform', 'user_id', 'title', 'description', 'track_ids', 'meta',
+                           'playlist_id', 'written', 'status', 'attempts', 'created_at', 'updated_at')
+
+def find_unfinished_playlist_write(platform, user_id):
+    """Return the user's most recent playlist write that has not completed, or None"""
+    init_db()
+
+    row = get_connection().execute(f'''
+    SELECT {', '.join(_PLAYLIST_WRITE_COLUMNS)} FROM playlist_writes
+    WHERE platform = ? AND user_id = ? AND status NOT IN ('done', 'abandoned')
+    ORDER BY created_at DESC LIMIT 1
+    ''', (platform, user_id)).fetchone()
+    if row is None:
+        return None
+    write = dict(zip(_PLAYLIST_WRITE_COLUMNS, row))
+    write['track_ids'] = json.loads(write['track_ids'])
+    write['meta'] = json.loads(write['meta']) if write['meta'] else None
+    return write
+
+def update_playlist_write(write_id, **fields):
+    """Checkpoint a playlist write: playlist_id, written, status and/or attempts"""
+    init_db()
+
+    allowed = {'playlist_id', 'written', 'status', 'attempts'}
+    if not fields or not set(fields) <= allowed:
+        raise ValueError(f"Can only update {sorted(allowed)}")
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    with transaction() as conn:
+        conn.execute(f'''
+        UPDATE playlist_writes SET {assignments}, updated_at = ? WHERE write_id = ?
+        ''', list(fields.values()) + [time.time(), write_id])
+
+def complete_playlist_write(write_id, user_id, platform, track_ids):
+    """Record the written tracks in history and mark the write done, atomically"""
+    init_db()
+
+    with transaction() as conn:
+        conn.executemany('''
+        INSERT OR IGNORE INTO history (user_id, platform, song_id)
+        VALUES (?, ?, ?)
+        ''', [(user_id, platform, song_id) for song_id in track_ids])
+        conn.execute('''
+        UPDATE playlist_writes SET status = 'done', updated_at = ? WHERE write_id = ?
+        ''', (time.time(), write_id))
@@ -0,0 +1,88 @@
+"""
+Harvests the curated search keywords into the local candidate catalog.
+
+    python harvest.py [--platform spotify youtube] [--max-age-hours 168] [--stats]
+
+Run it periodically (e.g. from cron). Generation then serves every harvested
+keyword from data/catalog.db instead of searching live, so it only waits on
+the playlist write; see OTTER_CATALOG_MODE in services/catalog.py. Each run
+also rebuilds the genre space once enough new artists have been collected.
+
+Spotify searches use the app's client credentials (SPOTIFY_CLIENT_ID /
+SPOTIFY_CLIENT_SECRET); YouTube Music searches need no account.
+"""
+import argparse
+import json
+import sys
+import time
+
+import database
+from services import catalog, genre_space, metrics
+
+PLATFORMS = ('spotify', 'youtube')
+
+def _spotify_client():
+    """A client-credentials Spotify client; search needs no user."""
+    import spotipy
+    from spotipy.oauth2 import SpotifyClientCredentials
+    from services.spotify_service import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET
+    if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
+        raise RuntimeError("SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET must be set")
+    auth = SpotifyClientCredentials(client_id=SPOTIFY_CLIENT_ID, client_secret=SPOTIFY_CLIENT_SECRET)
+    return metrics.instrument(spotipy.Spotify(client_credentials_manager=auth), 'spotify')
+
+def _youtube_client():
+    """An unauthenticated YTMusic client; search needs no account."""
+    from ytmusicapi import YTMusic
+    return metrics.instrument(YTMusic(), 'youtube')
+
+def harvest(platform, max_age=None, terms_per_culture=None):
+    """Harvests one platform; returns (harvested, failed)."""
+    if platform == 'spotify':
+        from services.spotify_service import harvest_catalog
+        with metrics.stage('spotify', 'harvest'):
+            return harvest_catalog(_spotify_client(), max_age=max_age)
+    from services.youtube_service import harvest_catalog
+    with metrics.stage('youtube', 'harvest'):
+        return harvest_catalog(_youtube_client(), max_age=max_age, terms_per_culture=terms_per_culture)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Harvest curated search keywords into the local candidate catalog.")
+    parser.add_argument('--platform', nargs='+', choices=PLATFORMS, default=list(PLATFORMS))
+    parser.add_argument('--max-age-hours', type=float, default=None,
+                        help="Re-harvest keywords older than this (default: OTTER_CATALOG_REFRESH, 7 days); 0 refreshes everything")
+    parser.add_argument('--terms-per-culture', type=int, default=None,
+                        help="Only harvest the first N search terms of each YouTube culture (default: all)")
+    parser.add_argument('--stats', action='store_true', help="Print catalog statistics and exit")
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    if args.stats:
+        print(json.dumps(catalog.get_catalog().stats(), indent=2))
+        return 0
+
+    max_age = None if args.max_age_hours is None else args.max_age_hours * 3600
+    started = time.perf_counter()
+    failed = 0
+    for platform in args.platform:
+        try:
+            _, platform_failed = harvest(platform, max_age, args.terms_per_culture)
+        except Exception as e:
+            print(f"❌ Couldn't harvest {platform}: {e}")
+            platform_failed = 1
+        except KeyboardInterrupt:
+            print("\n⚠ Interrupted. Run the same command again to resume; finished keywords are kept.")
+            return 1
+        failed += platform_failed
+    try:
+        # Rebuilt here rather than in a user's generation run (see OTTER_GENRE_SPACE_BACKGROUND_REBUILD)
+        genre_space.rebuild_genre_space()
+    except Exception as e:
+        print(f"❌ Couldn't rebuild the genre space: {e}")
+        failed += 1
+    print(f"⏱ Finished in {time.perf_counter() - started:.1f}s")
+    metrics.export_metrics()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from services import metrics
+
+# --- Job Configuration ---
+# Playlist generation runs on a bounded pool inside the process, so Streamlit
+# script runs only enqueue work and poll its progress.
+JOB_WORKERS = int(os.environ.get('OTTER_JOB_WORKERS', '4'))
+# Several processes (Streamlit workers, the batch runner) share the jobs table. Each
+# leases the jobs it runs and refreshes their heartbeat; a job is only failed as
+# interrupted once its owner has exited or its heartbeat is JOB_STALE_SECONDS old.
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('OTTER_JOB_HEARTBEAT_SECONDS', '15'))
+JOB_STALE_SECONDS = JOB_HEARTBEAT_SECONDS * 4
+INTERRUPTED_ERROR = "Interrupted by a server restart. Please try again."
+
+# host:pid:token; the token tells this process from an earlier one that had the same pid
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_executor = None
+_lock = threading.Lock()
+
+def _owner_is_dead(owner):
+    """
+    True if a job owner is a process on this host that no longer runs.
+    Owners on other hosts are judged by their heartbeat alone.
+    """
+    try:
+        host, pid, _ = owner.rsplit(':', 2)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname():
+        return False
+    if pid == os.getpid():
+        return owner != OWNER
+    if os.name != 'posix': # os.kill(pid, 0) is not a liveness probe on Windows
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError: # Alive, owned by another user
+        return False
+    return False
+
+def fail_abandoned_jobs():
+    """Fails queued or running jobs whose owning process is gone; returns how many."""
+    dead_owners = [owner for owner in database.load_active_job_owners() if _owner_is_dead(owner)]
+    failed = database.fail_abandoned_jobs(INTERRUPTED_ERROR, time.time() - JOB_STALE_SECONDS, dead_owners)
+    if failed:
+        print(f"   ⚠ Marked {failed} interrupted generation job(s) as failed.")
+    return failed
+
+def _heartbeat():
+    """Keeps this process's job leases fresh while it runs."""
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            database.heartbeat_jobs(OWNER)
+        except Exception as e:
+            print(f"   ⚠ Couldn't refresh job heartbeats: {e}")
+
+def _get_executor():
+    """Creates the worker pool and its heartbeat on first use, failing jobs left by dead processes."""
+    global _executor
+    if _executor is None:
+        fail_abandoned_jobs()
+        _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="otter-job")
+        threading.Thread(target=_heartbeat, name="otter-job-heartbeat", daemon=True).start()
+    return _executor
+
+class JobReporter:
+    """Progress callback handed to job functions: report(stage, message)."""
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def __call__(self, stage, message):
+        print(f"   [{stage}] {message}")
+        try:
+            database.add_job_event(self.job_id, stage, message)
+        except Exception as e:
+            print(f"   ⚠ Couldn't record progress for job {self.job_id}: {e}")
+
+def _run_job(job_id, func, args, kwargs):
+    try:
+        database.update_job(job_id, 'running')
+        result = func(*args, report=JobReporter(job_id), **kwargs)
+    except Exception as e:
+        traceback.print_exc()
+        database.update_job(job_id, 'failed', error=str(e) or e.__class__.__name__)
+    else:
+        database.update_job(job_id, 'succeeded', result=result)
+    try:
+        metrics.export_metrics()
+    except OSError as e:
+        print(f"   ⚠ Couldn't write metrics: {e}")
+
+def submit_job(dedupe_key, platform, func, *args, **kwargs):
+    """
+    Enqueues func(*args, report=..., **kwargs) and returns its job ID.
+    If a job with the same dedupe_key is still queued or running, its ID is
+    returned instead, so duplicate clicks attach to the running job.
+    The function's return value must be JSON-serializable.
+    """
+    with _lock:
+        executor = _get_executor()
+        active_job_id = database.find_active_job(dedupe_key)
+        if active_job_id and fail_abandoned_jobs():
+            # Don't attach to a job whose process died
+            active_job_id = database.find_active_job(dedupe_key)
+        if active_job_id:
+            return active_job_id
+        job_id = uuid.uuid4().hex
+        database.create_job(job_id, dedupe_key, platform, OWNER)
+    executor.submit(_run_job, job_id, func, args, kwargs)
+    return job_id
+
+def get_job(job_id, events_after=0):
+    """
+    Returns a job's status, result/error and stage events newer than events_after.
+    An active job whose owner has died is failed first, so pollers stop waiting for it.
+    """
+    job = database.load_job(job_id, events_after)
+    if is_active(job) and (time.time() - job['heartbeat_at'] > JOB_STALE_SECONDS
+                           or (job['owner'] and _owner_is_dead(job['owner']))):
+        fail_abandoned_jobs()
+        job = database.load_job(job_id, events_after)
+    return job
+
+def is_active(job):
+    return job is not None and job['status'] in database.ACTIVE_JOB_STATUSES
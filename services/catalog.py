@@ -0,0 +1,192 @@
+import os
+import json
+import threading
+import time
+
+from database import DATA_DIR, get_connection, transaction
+
+# Harvested candidates live next to anti_playlist.db
+CATALOG_DB_PATH = DATA_DIR / 'catalog.db'
+
+# --- Catalog Configuration ---
+# 'auto': serve keywords the harvester has covered from the catalog and search the rest live;
+# 'only': never search live (keywords missing from the catalog are skipped); 'off': always search live.
+CATALOG_MODE = os.environ.get('OTTER_CATALOG_MODE', 'auto').lower()
+CATALOG_MODES = ('auto', 'only', 'off')
+# Harvested keywords older than this are ignored by generation
+CATALOG_MAX_AGE_SECONDS = int(os.environ.get('OTTER_CATALOG_MAX_AGE', str(30 * 24 * 3600)))
+# The harvester re-crawls keywords older than this
+HARVEST_REFRESH_SECONDS = int(os.environ.get('OTTER_CATALOG_REFRESH', str(7 * 24 * 3600)))
+
+def catalog_mode(mode=None):
+    """Returns the effective catalog mode, falling back to 'auto' for unknown values."""
+    mode = (mode or CATALOG_MODE).lower()
+    if mode not in CATALOG_MODES:
+        print(f"   ⚠ Unknown catalog mode {mode!r}, using 'auto'")
+        return 'auto'
+    return mode
+
+class Catalog:
+    """
+    SQLite catalog of harvested search results, keyed by platform, culture
+    (empty for Spotify) and keyword. Each keyword is replaced as a whole when
+    it is re-harvested; tracks are stored once per platform with their
+    precomputed authenticity verdict and duration.
+    """
+    def __init__(self, path=CATALOG_DB_PATH):
+        self.path = path
+        self._init_schema()
+
+    def _init_schema(self):
+        with transaction(self.path) as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_keywords (
+                platform TEXT NOT NULL,
+                culture TEXT NOT NULL DEFAULT '',
+                keyword TEXT NOT NULL,
+                track_count INTEGER NOT NULL,
+                harvested_at REAL NOT NULL,
+                PRIMARY KEY (platform, culture, keyword)
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_entries (
+                platform TEXT NOT NULL,
+                culture TEXT NOT NULL DEFAULT '',
+                keyword TEXT NOT NULL,
+                query TEXT NOT NULL,
+                track_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                PRIMARY KEY (platform, culture, keyword, query, track_id)
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_tracks (
+                platform TEXT NOT NULL,
+                track_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                artist TEXT,
+                duration_seconds INTEGER,
+                authentic INTEGER, -- is_authentic_music verdict; NULL where it doesn't apply
+                payload TEXT, -- Provider-shaped track JSON, when generation needs more than the columns
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (platform, track_id)
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_catalog_entries_culture ON catalog_entries (platform, culture)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_catalog_entries_keyword ON catalog_entries (platform, keyword)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_catalog_tracks_duration ON catalog_tracks (platform, authentic, duration_seconds)')
+
+    def store(self, platform, keyword, tracks, culture=''):
+        """
+        Replaces one keyword's harvested results. tracks is a list of dicts with
+        'id', 'title', 'query' and optionally 'artist', 'duration_seconds',
+        'authentic' and 'payload'; list order is kept as the result position.
+        """
+        now = time.time()
+        with transaction(self.path) as conn:
+            conn.execute('DELETE FROM catalog_entries WHERE platform = ? AND culture = ? AND keyword = ?',
+                         (platform, culture, keyword))
+            conn.executemany('''
+            INSERT OR REPLACE INTO catalog_tracks
+                (platform, track_id, title, artist, duration_seconds, authentic, payload, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(platform, track['id'], track['title'], track.get('artist'), track.get('duration_seconds'),
+                   None if track.get('authentic') is None else int(track['authentic']),
+                   json.dumps(track['payload'], separators=(',', ':')) if track.get('payload') is not None else None,
+                   now) for track in tracks])
+            conn.executemany('''
+            INSERT OR IGNORE INTO catalog_entries (platform, culture, keyword, query, track_id, position)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(platform, culture, keyword, track['query'], track['id'], position)
+                  for position, track in enumerate(tracks)])
+            conn.execute('''
+            INSERT OR REPLACE INTO catalog_keywords (platform, culture, keyword, track_count, harvested_at)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (platform, culture, keyword, len(tracks), now))
+
+    def fresh_keywords(self, platform, max_age=CATALOG_MAX_AGE_SECONDS):
+        """Returns {(culture, keyword)} harvested within max_age seconds."""
+        rows = get_connection(self.path).execute('''
+        SELECT culture, keyword FROM catalog_keywords WHERE platform = ? AND harvested_at >= ?
+        ''', (platform, time.time() - max_age)).fetchall()
+        return set(rows)
+
+    def lookup(self, platform, keywords=None, cultures=None, authentic_only=False, min_duration=None,
+               sample=None, max_age=CATALOG_MAX_AGE_SECONDS):
+        """
+        Returns harvested tracks of fresh keywords, optionally restricted to
+        keywords or cultures. min_duration drops tracks with a known duration
+        at or below it; tracks of unknown duration are kept, as in live search.
+        sample returns at most that many rows, picked at random.
+        Each row is a dict with keyword, culture, query, position and the track columns.
+        """
+        sql = '''
+        SELECT e.keyword, e.culture, e.query, e.position, t.track_id, t.title, t.artist,
+               t.duration_seconds, t.authentic, t.payload
+        FROM catalog_entries e
+        JOIN catalog_keywords k ON k.platform = e.platform AND k.culture = e.culture AND k.keyword = e.keyword
+        JOIN catalog_tracks t ON t.platform = e.platform AND t.track_id = e.track_id
+        WHERE e.platform = ? AND k.harvested_at >= ?
+        '''
+        params = [platform, time.time() - max_age]
+        if keywords is not None:
+            keywords = list(keywords)
+            if not keywords:
+                return []
+            sql += f" AND e.keyword IN ({','.join('?' * len(keywords))})"
+            params.extend(keywords)
+        if cultures is not None:
+            cultures = list(cultures)
+            if not cultures:
+                return []
+            sql += f" AND e.culture IN ({','.join('?' * len(cultures))})"
+            params.extend(cultures)
+        if authentic_only:
+            sql += ' AND t.authentic = 1'
+        if min_duration is not None:
+            sql += ' AND (t.duration_seconds IS NULL OR t.duration_seconds = 0 OR t.duration_seconds > ?)'
+            params.append(min_duration)
+        if sample is not None:
+            sql += ' ORDER BY random() LIMIT ?'
+            params.append(sample)
+        else:
+            sql += ' ORDER BY e.culture, e.keyword, e.position'
+        return [
+            {'keyword': keyword, 'culture': culture, 'query': query, 'position': position, 'id': track_id,
+             'title': title, 'artist': artist, 'duration_seconds': duration_seconds,
+             'authentic': None if authentic is None else bool(authentic),
+             'payload': json.loads(payload) if payload else None}
+            for keyword, culture, query, position, track_id, title, artist, duration_seconds, authentic, payload
+            in get_connection(self.path).execute(sql, params)
+        ]
+
+    def stats(self):
+        """Returns per-platform keyword and track counts plus the oldest harvest time."""
+        conn = get_connection(self.path)
+        stats = {}
+        for platform, keywords, oldest in conn.execute(
+                'SELECT platform, COUNT(*), MIN(harvested_at) FROM catalog_keywords GROUP BY platform'):
+            stats[platform] = {'keywords': keywords, 'oldest_harvest': oldest}
+        for platform, tracks in conn.execute('SELECT platform, COUNT(*) FROM catalog_tracks GROUP BY platform'):
+            stats.setdefault(platform, {'keywords': 0, 'oldest_harvest': None})['tracks'] = tracks
+        return stats
+
+    def clear(self, platform=None):
+        with transaction(self.path) as conn:
+            for table in ('catalog_entries', 'catalog_keywords', 'catalog_tracks'):
+                if platform is None:
+                    conn.execute(f'DELETE FROM {table}')
+                else:
+                    conn.execute(f'DELETE FROM {table} WHERE platform = ?', (platform,))
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    """Returns the process-wide Catalog."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
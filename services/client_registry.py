@@ -0,0 +1,115 @@
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# --- Client Registry Configuration ---
+# Keep-alive pool per session: enough connections for the concurrent searches
+# (SPOTIFY_SEARCH_CONCURRENCY / YOUTUBE_SEARCH_CONCURRENCY) plus a little headroom.
+POOL_CONNECTIONS = int(os.environ.get('OTTER_HTTP_POOL_CONNECTIONS', '4')) # Distinct hosts kept per session
+POOL_MAXSIZE = int(os.environ.get('OTTER_HTTP_POOL_MAXSIZE', '16')) # Connections kept per host
+CLIENT_IDLE_SECONDS = int(os.environ.get('OTTER_CLIENT_IDLE_SECONDS', '1800'))
+MAX_CLIENTS = int(os.environ.get('OTTER_MAX_CLIENTS', '256'))
+
+def make_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """
+    Returns a requests.Session with a sized keep-alive pool. Transport retries
+    are off: throttling and transient errors are retried by the rate limiter.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def registry_key(kind, *parts):
+    """Builds a registry key; secrets such as tokens are only kept as a hash."""
+    digest = hashlib.sha1('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f"{kind}:{digest}"
+
+class _Entry:
+    __slots__ = ('client', 'session', 'last_used')
+
+    def __init__(self, client, session):
+        self.client = client
+        self.session = session
+        self.last_used = time.monotonic()
+
+class ClientRegistry:
+    """
+    Process-wide store of authenticated provider clients and their HTTP
+    sessions, so TLS connections and OAuth state survive Streamlit reruns.
+    Entries unused for idle_seconds are dropped, as are the least recently
+    used beyond max_clients. Dropped sessions are not closed: a running job
+    may still hold the client, and the session's pool is released once the
+    last reference goes.
+    """
+    def __init__(self, idle_seconds=CLIENT_IDLE_SECONDS, max_clients=MAX_CLIENTS):
+        self.idle_seconds = idle_seconds
+        self.max_clients = max_clients
+        self._entries = OrderedDict() # key -> _Entry, least recently used first
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, factory):
+        """
+        Returns the client stored under key, or builds one with factory(session)
+        on a new pooled session and stores it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(key)
+                return entry.client
+        # Build outside the lock: factories may do network I/O
+        session = make_session()
+        try:
+            client = factory(session)
+        except Exception:
+            session.close()
+            raise
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                # Another thread won the race; keep its client
+                session.close()
+                existing.last_used = time.monotonic()
+                return existing.client
+            self._entries[key] = _Entry(client, session)
+            self._evict_locked()
+        return client
+
+    def _evict_locked(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        evicted = [key for key, entry in self._entries.items() if entry.last_used < cutoff]
+        overflow = len(self._entries) - len(evicted) - self.max_clients
+        if overflow > 0:
+            evicted += [key for key in self._entries if key not in evicted][:overflow]
+        return [self._entries.pop(key) for key in evicted]
+
+    def evict_idle(self):
+        """Drops clients idle for longer than idle_seconds; returns how many were dropped."""
+        with self._lock:
+            return len(self._evict_locked())
+
+    def discard(self, key):
+        """Drops one client, e.g. after its credentials were revoked."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_client_registry():
+    """Returns the process-wide ClientRegistry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
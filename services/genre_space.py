@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+from collections import Counter
+
+import database
+from database import DATA_DIR
+
+# The built matrix is saved next to anti_playlist.db
+SPACE_PATH = DATA_DIR / 'genre_space.npz'
+
+# --- Genre Space Configuration ---
+# Genres are embedded from artist-genre co-occurrence (PPMI + truncated SVD) and
+# compared by cosine distance. Until enough artists have been collected, or when
+# numpy is missing, callers fall back to the static GENRE_OPPOSITES mapping.
+MIN_GENRE_ARTISTS = int(os.environ.get('OTTER_GENRE_MIN_ARTISTS', '3')) # Rarer genres are left out
+MAX_GENRES = int(os.environ.get('OTTER_GENRE_SPACE_MAX_GENRES', '2000')) # Caps the matrix at MAX_GENRES² float32
+EMBEDDING_DIM = int(os.environ.get('OTTER_GENRE_EMBEDDING_DIM', '48'))
+MIN_SPACE_GENRES = 50 # Smaller vocabularies are too sparse to beat the static mapping
+REBUILD_GROWTH = 0.1 # Rebuild once the number of collected artists has grown by this fraction
+CHECK_INTERVAL_SECONDS = 600 # How often a process looks for new artists or a newer saved matrix
+# Rebuilds never run inside a generation request. With this off, only harvest.py rebuilds.
+BACKGROUND_REBUILD = os.environ.get('OTTER_GENRE_SPACE_BACKGROUND_REBUILD', 'true').lower() == 'true'
+
+def _numpy():
+    """numpy is optional; without it the static opposites are used."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+class GenreSpace:
+    """
+    A genre vocabulary with a dense, symmetric cosine-distance matrix between
+    every pair of genres, built from `artist_count` collected artists.
+    """
+    def __init__(self, genres, distances, artist_count):
+        self.genres = list(genres)
+        self.index = {genre: i for i, genre in enumerate(self.genres)}
+        self.distances = distances
+        self.artist_count = artist_count
+
+    def __len__(self):
+        return len(self.genres)
+
+    def most_opposite(self, weighted_genres, k):
+        """
+        Returns up to k (genre, distance) pairs, most distant first, scoring the
+        user's whole weighted genre vector against every genre in one
+        matrix-vector product. Genres the user already has are never returned.
+        Returns [] when none of the user's genres are in the vocabulary.
+        """
+        np = _numpy()
+        weights = np.zeros(len(self.genres), dtype=np.float32)
+        for genre, weight in weighted_genres:
+            i = self.index.get(genre)
+            if i is not None:
+                weights[i] += weight
+        total = weights.sum()
+        if not total or k <= 0:
+            return []
+        # Weighted mean distance from the user's genres to each genre (the matrix is symmetric)
+        scores = self.distances @ weights / total
+        scores[weights > 0] = -np.inf
+        k = min(k, int((weights == 0).sum()))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.genres[i], float(scores[i])) for i in top]
+
+    def save(self, path=SPACE_PATH):
+        np = _numpy()
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, genres=np.array(self.genres), distances=self.distances,
+                     artist_count=np.array(self.artist_count))
+        os.replace(tmp_path, path) # Readers never see a half-written file
+
+    @classmethod
+    def load(cls, path=SPACE_PATH):
+        """Loads a saved space, or returns None if there is none."""
+        np = _numpy()
+        if np is None or not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['genres'].tolist(), data['distances'], int(data['artist_count']))
+
+def build_genre_space(artist_genres=None):
+    """
+    Builds a GenreSpace from collected artist genre lists (default: every
+    artist in the database). Returns None without numpy or when fewer than
+    MIN_SPACE_GENRES genres have been seen on MIN_GENRE_ARTISTS artists.
+    """
+    np = _numpy()
+    if np is None:
+        return None
+    if artist_genres is None:
+        artist_genres = database.load_artist_genres()
+    counts = Counter(genre for genres in artist_genres for genre in set(genres))
+    vocabulary = [genre for genre, count in counts.most_common(MAX_GENRES) if count >= MIN_GENRE_ARTISTS]
+    n = len(vocabulary)
+    if n < MIN_SPACE_GENRES:
+        return None
+    index = {genre: i for i, genre in enumerate(vocabulary)}
+
+    # Co-occurrence: every ordered pair of distinct genres sharing an artist
+    pairs = []
+    for genres in artist_genres:
+        ids = sorted({index[genre] for genre in genres if genre in index})
+        pairs.extend(a * n + b for a in ids for b in ids if a != b)
+    cooccurrence = np.bincount(np.array(pairs, dtype=np.int64), minlength=n * n).reshape(n, n).astype(np.float64)
+    total = cooccurrence.sum()
+    if not total:
+        return None
+
+    # Positive pointwise mutual information
+    marginals = cooccurrence.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pmi = np.log(cooccurrence * total / np.outer(marginals, marginals))
+    ppmi = np.where(cooccurrence > 0, np.maximum(pmi, 0.0), 0.0)
+
+    # Truncated SVD (PPMI is symmetric), then unit-length rows for cosine distance
+    u, s, _ = np.linalg.svd(ppmi, hermitian=True)
+    dim = min(EMBEDDING_DIM, n)
+    embedding = u[:, :dim] * np.sqrt(s[:dim])
+    norms = np.linalg.norm(embedding, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embedding /= norms
+    distances = (1.0 - embedding @ embedding.T).astype(np.float32)
+    np.fill_diagonal(distances, 0.0)
+    return GenreSpace(vocabulary, distances, len(artist_genres))
+
+_space = None
+_checked_at = None
+_loaded_mtime = None # mtime of the saved matrix last loaded here
+_attempted_count = 0 # Artist count of the last build attempt, successful or not
+_rebuild_thread = None
+_space_lock = threading.Lock()
+
+def rebuild_genre_space():
+    """
+    Rebuilds and saves the genre space in the calling thread once REBUILD_GROWTH
+    more artists have been collected than it (or the last attempt) was built
+    from, so a vocabulary that is still too small is not retried on every
+    check. harvest.py calls this; the app runs it in the background.
+    Returns the current space.
+    """
+    global _space, _attempted_count, _loaded_mtime
+    if _numpy() is None:
+        return None
+    artist_count = database.count_artist_genres()
+    with _space_lock:
+        built_from = max(_space.artist_count if _space is not None else 0, _attempted_count)
+        if artist_count <= built_from * (1 + REBUILD_GROWTH):
+            return _space
+        _attempted_count = artist_count
+
+    started = time.perf_counter()
+    rebuilt = build_genre_space()
+    if rebuilt is None:
+        print(f"   🧭 Not enough genres for a genre space yet ({artist_count} artists); "
+              f"retrying once {REBUILD_GROWTH:.0%} more are collected.")
+        return _space
+    rebuilt.save()
+    with _space_lock:
+        _loaded_mtime = SPACE_PATH.stat().st_mtime_ns
+        if _space is None or rebuilt.artist_count >= _space.artist_count:
+            _space = rebuilt
+    print(f"   🧭 Rebuilt genre space: {len(rebuilt)} genres from {artist_count} artists "
+          f"in {time.perf_counter() - started:.1f}s")
+    return _space
+
+def _rebuild_in_background():
+    try:
+        rebuild_genre_space()
+    except Exception as e:
+        print(f"   ⚠ Couldn't rebuild the genre space: {e}")
+
+def _start_rebuild():
+    """Starts a background rebuild unless one is already running."""
+    global _rebuild_thread
+    with _space_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            return
+        _rebuild_thread = threading.Thread(target=_rebuild_in_background, name="genre-space-rebuild", daemon=True)
+        _rebuild_thread.start()
+
+def get_genre_space():
+    """
+    Returns the process-wide GenreSpace, or None while it is unavailable.
+    Never builds in the caller's thread: at most every CHECK_INTERVAL_SECONDS
+    the saved matrix is reloaded if another process rebuilt it, and (with
+    BACKGROUND_REBUILD) a background rebuild is started, which is a no-op
+    until REBUILD_GROWTH more artists have been collected.
+    """
+    global _space, _checked_at, _loaded_mtime
+    with _space_lock:
+        now = time.monotonic()
+        if _checked_at is not None and now - _checked_at < CHECK_INTERVAL_SECONDS:
+            return _space
+        _checked_at = now
+    if _numpy() is None:
+        return None
+    try:
+        mtime = SPACE_PATH.stat().st_mtime_ns if SPACE_PATH.exists() else None
+        saved = GenreSpace.load() if mtime is not None and mtime != _loaded_mtime else None
+        with _space_lock:
+            _loaded_mtime = mtime
+            if saved is not None and (_space is None or saved.artist_count > _space.artist_count):
+                _space = saved
+    except Exception as e:
+        print(f"   ⚠ Couldn't load the genre space: {e}")
+    if BACKGROUND_REBUILD:
+        _start_rebuild()
+    return _space
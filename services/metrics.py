@@ -0,0 +1,238 @@
+import os
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from database import DATA_DIR
+from services.rate_limiter import is_throttled
+from services import profiling
+
+# --- Metrics Configuration ---
+# Histogram bucket upper bounds, in seconds (a +Inf bucket is always added)
+CALL_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_LATENCY_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+# Prometheus text is written here, with a JSON snapshot next to it (.json)
+METRICS_FILE = os.environ.get('OTTER_METRICS_FILE', str(DATA_DIR / 'metrics.prom'))
+# Serve /metrics and /metrics.json on this port when set
+METRICS_PORT = os.environ.get('OTTER_METRICS_PORT')
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def cumulative(self):
+        """Returns [(upper_bound, cumulative_count)] including +Inf."""
+        running = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+class MetricsRegistry:
+    """Thread-safe store of API call and pipeline stage metrics for this process."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}     # (provider, method) -> count
+        self.errors = {}    # (provider, method) -> count
+        self.throttles = {} # (provider, method) -> count
+        self.call_latency = {}  # (provider, method) -> Histogram
+        self.stage_latency = {} # (provider, stage) -> Histogram
+        self.stage_failures = {} # (provider, stage) -> count
+
+    def record_call(self, provider, method, seconds, error=None):
+        key = (provider, method)
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            if key not in self.call_latency:
+                self.call_latency[key] = Histogram(CALL_LATENCY_BUCKETS)
+            self.call_latency[key].observe(seconds)
+            if error is not None:
+                self.errors[key] = self.errors.get(key, 0) + 1
+                if is_throttled(error):
+                    self.throttles[key] = self.throttles.get(key, 0) + 1
+
+    def record_stage(self, provider, stage, seconds, failed=False):
+        key = (provider, stage)
+        with self._lock:
+            if key not in self.stage_latency:
+                self.stage_latency[key] = Histogram(STAGE_LATENCY_BUCKETS)
+            self.stage_latency[key].observe(seconds)
+            if failed:
+                self.stage_failures[key] = self.stage_failures.get(key, 0) + 1
+
+    def snapshot(self):
+        """Returns every metric as plain JSON-serializable data."""
+        def histogram(h):
+            return {'count': h.count, 'sum': h.total,
+                    'buckets': {('+Inf' if bound == float('inf') else str(bound)): n for bound, n in h.cumulative()}}
+        with self._lock:
+            return {
+                'generated_at': time.time(),
+                'calls': [
+                    {'provider': provider, 'method': method, 'count': count,
+                     'errors': self.errors.get((provider, method), 0),
+                     'throttles': self.throttles.get((provider, method), 0),
+                     'latency_seconds': histogram(self.call_latency[(provider, method)])}
+                    for (provider, method), count in sorted(self.calls.items())
+                ],
+                'stages': [
+                    {'provider': provider, 'stage': stage,
+                     'failures': self.stage_failures.get((provider, stage), 0),
+                     'latency_seconds': histogram(h)}
+                    for (provider, stage), h in sorted(self.stage_latency.items())
+                ],
+            }
+
+    def render_prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        def counter(name, help_text, values, label):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (provider, key), value in sorted(values.items()):
+                lines.append(f'{name}{{provider="{provider}",{label}="{key}"}} {value}')
+        def histogram(name, help_text, histograms, label):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (provider, key), h in sorted(histograms.items()):
+                labels = f'provider="{provider}",{label}="{key}"'
+                for bound, n in h.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {n}')
+                lines.append(f'{name}_sum{{{labels}}} {h.total}')
+                lines.append(f'{name}_count{{{labels}}} {h.count}')
+        with self._lock:
+            counter('otter_api_calls_total', "Provider API calls made, including retries.", self.calls, 'method')
+            counter('otter_api_errors_total', "Provider API calls that raised.", self.errors, 'method')
+            counter('otter_api_throttles_total', "Provider API calls rejected by rate limiting.", self.throttles, 'method')
+            histogram('otter_api_call_duration_seconds', "Provider API call latency.", self.call_latency, 'method')
+            histogram('otter_stage_duration_seconds', "Generation pipeline stage duration.", self.stage_latency, 'stage')
+            counter('otter_stage_failures_total', "Generation pipeline stages that raised.", self.stage_failures, 'stage')
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+class InstrumentedClient:
+    """
+    Transparent proxy around a Spotify or YTMusic client that times every
+    method call and records it in the registry. Errors are counted and re-raised.
+    """
+    def __init__(self, client, provider, metrics=None):
+        object.__setattr__(self, '_client', client)
+        object.__setattr__(self, '_provider', provider)
+        object.__setattr__(self, '_metrics', metrics or registry)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        provider, metrics = self._provider, self._metrics
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                metrics.record_call(provider, name, time.perf_counter() - started, error=e)
+                raise
+            metrics.record_call(provider, name, time.perf_counter() - started)
+            return result
+        timed.__name__ = name
+        return timed
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)
+
+def instrument(client, provider):
+    """Wraps a provider client so its calls are recorded; None passes through."""
+    if client is None or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client, provider)
+
+@contextmanager
+def stage(provider, name):
+    """
+    Times a pipeline stage: `with metrics.stage('spotify', 'candidates'): ...`
+    The timing is also added as a span to the current profiling run, if any.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        seconds = time.perf_counter() - started
+        registry.record_stage(provider, name, seconds, failed=True)
+        profiling.record_span(name, started, seconds, failed=True)
+        raise
+    seconds = time.perf_counter() - started
+    registry.record_stage(provider, name, seconds)
+    profiling.record_span(name, started, seconds)
+
+def export_metrics(path=METRICS_FILE):
+    """Writes the Prometheus text to `path` and a JSON snapshot to `path`.json, atomically."""
+    for target, content in ((path, registry.render_prometheus()),
+                            (f"{path}.json", json.dumps(registry.snapshot(), indent=2))):
+        tmp = f"{target}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(content)
+        os.replace(tmp, target)
+
+def _metrics_handler():
+    """Builds the HTTP handler class; http.server is only imported when serving."""
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = registry.render_prometheus(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(registry.snapshot()), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass # Scrapes are too frequent to log
+
+    return MetricsHandler
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=None, host='0.0.0.0'):
+    """
+    Serves /metrics (Prometheus text) and /metrics.json from a daemon thread.
+    Uses OTTER_METRICS_PORT when no port is given; does nothing if neither is set.
+    Safe to call on every Streamlit rerun: only the first call starts a server.
+    """
+    global _server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            from http.server import ThreadingHTTPServer
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), _metrics_handler())
+            except OSError as e:
+                print(f"   ⚠ Couldn't start metrics server on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="otter-metrics", daemon=True).start()
+            print(f"📈 Serving metrics on http://{host}:{port}/metrics")
+        return _server
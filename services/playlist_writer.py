@@ -0,0 +1,159 @@
+import os
+import time
+import uuid
+
+import database
+from services.rate_limiter import backoff_delay, is_transient
+
+# --- Writer Configuration ---
+# Both Spotify's playlist_add_items and YTMusic's add_playlist_items accept 100 IDs per call.
+# Pacing between batches comes from the provider's 'write' rate limit bucket.
+MAX_BATCH_SIZE = 100
+# An unfinished write is resumed at most this many times before a fresh run starts over
+MAX_WRITE_ATTEMPTS = int(os.environ.get('OTTER_PLAYLIST_WRITE_ATTEMPTS', '3'))
+# Creates and adds are not idempotent, so the rate limiter never retries their transient
+# failures; the writer retries them this many times after checking what was applied.
+MAX_CALL_RETRIES = int(os.environ.get('OTTER_PLAYLIST_WRITE_RETRIES', '2'))
+
+class PlaylistOps:
+    """
+    Provider callbacks used by the writer:
+      create(title, description) -> playlist ID
+      add_items(playlist_id, track_ids)
+      find(title, marker) -> playlist ID of an existing playlist, or None
+      list_items(playlist_id) -> track IDs currently in the playlist
+    """
+    def __init__(self, create, add_items, find, list_items):
+        self.create = create
+        self.add_items = add_items
+        self.find = find
+        self.list_items = list_items
+
+def write_marker(write_id):
+    """Short reference appended to the description, so a retry can recognise its own playlist."""
+    return f"[ref {write_id[:8]}]"
+
+def start_write(platform, user_id, title, description, track_ids, meta=None):
+    """Persists the chosen tracks before anything is created; returns the write record."""
+    write_id = uuid.uuid4().hex
+    description = f"{description} {write_marker(write_id)}"
+    track_ids = list(track_ids)
+    database.create_playlist_write(write_id, platform, user_id, title, description, track_ids, meta)
+    return {'write_id': write_id, 'platform': platform, 'user_id': user_id, 'title': title,
+            'description': description, 'track_ids': track_ids, 'meta': meta,
+            'playlist_id': None, 'written': 0, 'status': 'pending', 'attempts': 1}
+
+def find_resumable_write(platform, user_id):
+    """
+    Returns the user's unfinished write if it should be resumed instead of
+    generating a new playlist. Writes that have used up their attempts are
+    abandoned so the user is not stuck with them.
+    """
+    write = database.find_unfinished_playlist_write(platform, user_id)
+    if write is None:
+        return None
+    if write['attempts'] >= MAX_WRITE_ATTEMPTS:
+        print(f"   ⚠ Giving up on unfinished playlist '{write['title']}' after {write['attempts']} attempts.")
+        database.update_playlist_write(write['write_id'], status='abandoned')
+        return None
+    database.update_playlist_write(write['write_id'], attempts=write['attempts'] + 1)
+    write['attempts'] += 1
+    return write
+
+def _create_playlist(write, ops, limiter):
+    """
+    Creates the write's playlist. A failed create may still have been applied
+    (e.g. a timeout after the provider created it), so the playlist is looked
+    up by title and marker before creating it again.
+    """
+    marker = write_marker(write['write_id'])
+    attempt = 0
+    while True:
+        try:
+            return limiter.call('write', ops.create, write['title'], write['description'])
+        except Exception as e:
+            try:
+                playlist_id = limiter.call('library', ops.find, write['title'], marker)
+            except Exception as find_error:
+                # Without the lookup a retry could duplicate the playlist; surface the create failure
+                print(f"   ❌ Could not check whether the failed create went through: {find_error}")
+                raise e from None
+            if playlist_id:
+                print(f"   ✓ The failed create went through after all (ID: {playlist_id})")
+                return playlist_id
+            if attempt >= MAX_CALL_RETRIES or not is_transient(e):
+                raise
+            print(f"   ⚠ Creating the playlist failed ({e}); retrying...")
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+def _add_batch(playlist_id, batch, ops, limiter):
+    """
+    Adds one batch of tracks. After a failure the playlist is re-read and only
+    the tracks that did not arrive are added again, so nothing is added twice.
+    """
+    attempt = 0
+    while True:
+        try:
+            limiter.call('write', ops.add_items, playlist_id, batch)
+            return
+        except Exception as e:
+            try:
+                present = set(limiter.call('library', ops.list_items, playlist_id))
+            except Exception as list_error:
+                print(f"   ❌ Could not check which tracks the failed add wrote: {list_error}")
+                raise e from None
+            batch = [track_id for track_id in batch if track_id not in present]
+            if not batch:
+                return
+            if attempt >= MAX_CALL_RETRIES or not is_transient(e):
+                raise
+            print(f"   ⚠ Adding tracks failed ({e}); retrying {len(batch)} tracks...")
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+def execute_write(write, ops, limiter, resuming=False):
+    """
+    Creates the playlist (once) and adds the write's tracks in MAX_BATCH_SIZE
+    batches, checkpointing after each committed batch. When resuming, an
+    unrecorded earlier create is found by title and marker, and tracks already
+    in the playlist are skipped. A failed create or add is checked against the
+    provider before it is retried. Finishes by recording the tracks in history.
+    Returns the playlist ID; provider errors propagate with progress saved.
+    """
+    write_id = write['write_id']
+    track_ids = write['track_ids']
+    playlist_id = write['playlist_id']
+
+    if playlist_id is None and resuming:
+        # A previous attempt may have created the playlist and failed before checkpointing it
+        playlist_id = limiter.call('library', ops.find, write['title'], write_marker(write_id))
+        if playlist_id:
+            print(f"   ✓ Found the playlist created by an earlier attempt (ID: {playlist_id})")
+            database.update_playlist_write(write_id, playlist_id=playlist_id, status='created')
+    if playlist_id is None:
+        print("   🏗️ Creating playlist...")
+        playlist_id = _create_playlist(write, ops, limiter)
+        database.update_playlist_write(write_id, playlist_id=playlist_id, status='created')
+        print(f"   ✓ Playlist created successfully (ID: {playlist_id})")
+        remaining = track_ids
+    elif resuming:
+        # The checkpoint may lag behind the last batch that reached the provider
+        present = set(limiter.call('library', ops.list_items, playlist_id))
+        remaining = [track_id for track_id in track_ids if track_id not in present]
+    else:
+        remaining = track_ids[write['written']:]
+
+    written = len(track_ids) - len(remaining)
+    if remaining:
+        print(f"   ➕ Adding {len(remaining)} tracks to playlist...")
+    for i in range(0, len(remaining), MAX_BATCH_SIZE):
+        batch = remaining[i:i + MAX_BATCH_SIZE]
+        _add_batch(playlist_id, batch, ops, limiter)
+        written += len(batch)
+        database.update_playlist_write(write_id, written=written)
+
+    database.update_playlist_write(write_id, written=written, status='written')
+    # History and completion are recorded together, so a retry never sees one without the other
+    database.complete_playlist_write(write_id, write['user_id'], write['platform'], track_ids)
+    return playlist_id
@@ -0,0 +1,123 @@
+import os
+import cProfile
+import contextvars
+import datetime
+import json
+import re
+import time
+from contextlib import contextmanager
+
+from database import DATA_DIR
+
+# --- Profiling Configuration ---
+# Off unless DEBUG=true (as in app.py) or OTTER_PROFILE=true; callers can also
+# switch it per run with profile_run(..., enabled=True).
+PROFILE_ENABLED = (os.environ.get('DEBUG', 'false').lower() == 'true'
+                   or os.environ.get('OTTER_PROFILE', 'false').lower() == 'true')
+# Also capture a cProfile of the run's own thread (stage spans are always kept)
+CAPTURE_CPROFILE = os.environ.get('OTTER_PROFILE_CPROFILE', 'true').lower() == 'true'
+# Profiles are saved next to the database
+PROFILE_DIR = DATA_DIR / 'profiles'
+
+_current_run = contextvars.ContextVar('otter_profile_run', default=None)
+
+class ProfileRun:
+    """
+    Timing spans for one generation run, plus an optional cProfile.
+    cProfile only sees the thread that started the run; time spent in search
+    worker threads shows up as waiting inside the enclosing stage span.
+    """
+    def __init__(self, name, capture=CAPTURE_CPROFILE):
+        self.name = name
+        self.spans = [] # (name, start offset, seconds, failed)
+        self.profiler = cProfile.Profile() if capture else None
+        self.started = None
+        self.wall_seconds = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.profiler:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler:
+            self.profiler.disable()
+        self.wall_seconds = time.perf_counter() - self.started
+
+    def add_span(self, name, started, seconds, failed=False):
+        self.spans.append((name, started - self.started, seconds, failed))
+
+    def save(self, directory=PROFILE_DIR):
+        """Writes <timestamp>-<name>.json (spans) and .prof (cProfile); returns the JSON path."""
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', self.name)}"
+        summary = {
+            'name': self.name,
+            'wall_seconds': self.wall_seconds,
+            'spans': [{'name': name, 'offset_seconds': offset, 'seconds': seconds, 'failed': failed}
+                      for name, offset, seconds, failed in self.spans],
+        }
+        if self.profiler:
+            prof_path = directory / f"{stem}.prof"
+            self.profiler.dump_stats(str(prof_path))
+            summary['cprofile'] = str(prof_path)
+            # Top functions by cumulative time, so the JSON alone is useful
+            import pstats # Only needed when a profile is saved
+            stats = pstats.Stats(self.profiler)
+            summary['top_functions'] = [
+                {'function': f"{filename}:{line}({func})", 'calls': nc, 'cumulative_seconds': ct}
+                for (filename, line, func), (_, nc, _, ct, _) in
+                sorted(stats.stats.items(), key=lambda item: -item[1][3])[:25]
+            ]
+        json_path = directory / f"{stem}.json"
+        with open(json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        return json_path
+
+    def print_summary(self):
+        print(f"⏱ Profile '{self.name}': {self.wall_seconds:.2f}s")
+        for name, offset, seconds, failed in self.spans:
+            print(f"   • {name:<12} {seconds:7.2f}s (at +{offset:.2f}s){' ❌' if failed else ''}")
+
+@contextmanager
+def profile_run(name, enabled=None):
+    """
+    Profiles the enclosed generation run when enabled (default: PROFILE_ENABLED).
+    Stage spans recorded on this thread while it is active belong to the run.
+    """
+    if not (PROFILE_ENABLED if enabled is None else enabled):
+        yield None
+        return
+    run = ProfileRun(name)
+    token = _current_run.set(run)
+    run.start()
+    try:
+        yield run
+    finally:
+        run.stop()
+        _current_run.reset(token)
+        run.print_summary()
+        try:
+            print(f"   💾 Profile saved to {run.save()}")
+        except OSError as e:
+            print(f"   ⚠ Couldn't save profile: {e}")
+
+def record_span(name, started, seconds, failed=False):
+    """Adds a span to the current run, if this thread is profiling one."""
+    run = _current_run.get()
+    if run is not None:
+        run.add_span(name, started, seconds, failed)
+
+@contextmanager
+def span(name):
+    """Times a block as a span of the current run; a no-op when not profiling."""
+    if _current_run.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        record_span(name, started, time.perf_counter() - started, failed=True)
+        raise
+    record_span(name, started, time.perf_counter() - started)
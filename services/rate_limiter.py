@@ -0,0 +1,218 @@
+import os
+import random
+import re
+import threading
+import time
+import email.utils
+
+# --- Rate Limit Budgets ---
+# (provider, backend) -> (requests per second, burst capacity).
+# A backend groups calls that share a quota, e.g. searches vs playlist writes.
+# Override any entry with an env var such as OTTER_RATE_SPOTIFY_SEARCH="8/16".
+DEFAULT_BUDGETS = {
+    ('spotify', 'default'): (10.0, 20),
+    ('spotify', 'search'): (8.0, 16),
+    ('spotify', 'write'): (4.0, 8),
+    ('youtube', 'default'): (5.0, 10),
+    ('youtube', 'search'): (5.0, 10),
+    ('youtube', 'library'): (5.0, 10),
+    ('youtube', 'write'): (2.0, 4),
+}
+
+# Backends whose calls are not idempotent. A timeout or 5xx may come after the
+# provider applied the call (e.g. created the playlist), so only throttling,
+# which is rejected before anything happens, is retried automatically.
+NON_IDEMPOTENT_BACKENDS = frozenset({'write'})
+
+MAX_RETRIES = int(os.environ.get('OTTER_RATE_LIMIT_RETRIES', '4'))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 30.0
+MAX_RETRY_AFTER_SECONDS = 120.0 # Never sleep longer than this on a single Retry-After
+
+# ytmusicapi reports HTTP failures only in the message, e.g. "Server returned HTTP 429: ..."
+_HTTP_STATUS_IN_MESSAGE = re.compile(r'\bHTTP (\d{3})\b')
+
+def _budget_for(provider, backend):
+    """Returns (rate, capacity) for a provider/backend, honouring env overrides."""
+    override = os.environ.get(f"OTTER_RATE_{provider.upper()}_{backend.upper()}")
+    if override:
+        try:
+            rate, _, capacity = override.partition('/')
+            rate = float(rate)
+            return rate, int(capacity) if capacity else max(1, int(rate * 2))
+        except ValueError:
+            print(f"   ⚠ Ignoring invalid rate limit override for {provider}/{backend}: {override!r}")
+    if (provider, backend) in DEFAULT_BUDGETS:
+        return DEFAULT_BUDGETS[(provider, backend)]
+    return DEFAULT_BUDGETS.get((provider, 'default'), (5.0, 10))
+
+def _status_code(exc):
+    """Extracts an HTTP status code from spotipy / requests / ytmusicapi style exceptions."""
+    status = getattr(exc, 'http_status', None)
+    if status is None:
+        response = getattr(exc, 'response', None)
+        status = getattr(response, 'status_code', None)
+    if status is None:
+        match = _HTTP_STATUS_IN_MESSAGE.search(str(exc))
+        status = match.group(1) if match else None
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def retry_after_seconds(exc):
+    """Returns the Retry-After delay carried by an exception, or None."""
+    headers = getattr(exc, 'headers', None)
+    if not headers:
+        response = getattr(exc, 'response', None)
+        headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except (TypeError, ValueError):
+        # Retry-After may also be an HTTP date
+        try:
+            delay = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+def is_throttled(exc):
+    """
+    True if an exception signals that the provider is throttling us.
+    An exhausted daily quota (quotaExceeded) is not throttling: retrying
+    can't succeed before the quota resets, so it fails fast.
+    """
+    if _status_code(exc) == 429:
+        return True
+    message = str(exc).lower()
+    return 'rate limit' in message or 'too many requests' in message
+
+def is_transient(exc):
+    """True for server-side and connection errors that are worth retrying."""
+    status = _status_code(exc)
+    if status is not None:
+        return status >= 500
+    # requests.RequestException and the builtin connection errors are OSErrors
+    return isinstance(exc, OSError)
+
+def is_query_error(exc):
+    """True if the provider rejected the query itself (400/404), for any caller."""
+    return _status_code(exc) in (400, 404)
+
+def backoff_delay(attempt):
+    """Full jitter: a random delay up to the exponential backoff cap for this attempt."""
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+class TokenBucket:
+    """
+    Thread-safe token bucket with AIMD rate adaptation.
+    The rate is halved on throttling and recovers gradually on success.
+    """
+    def __init__(self, rate, capacity):
+        self.max_rate = float(rate)
+        self.min_rate = max(self.max_rate / 16, 0.1)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, delay):
+        """Pauses the bucket for `delay` seconds and halves its rate."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.blocked_until = max(self.blocked_until, now + delay)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def reward(self):
+        """Additively recovers the rate after a successful call."""
+        if self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class RateLimiter:
+    """Routes API calls for one provider through per-backend token buckets."""
+    def __init__(self, provider, max_retries=MAX_RETRIES):
+        self.provider = provider
+        self.max_retries = max_retries
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, backend):
+        with self._lock:
+            if backend not in self._buckets:
+                self._buckets[backend] = TokenBucket(*_budget_for(self.provider, backend))
+            return self._buckets[backend]
+
+    def call(self, backend, func, *args, **kwargs):
+        """
+        Calls func(*args, **kwargs) once a token is available for `backend`.
+        Throttled and transient failures are retried with jittered exponential
+        backoff (or the server's Retry-After); other errors propagate immediately.
+        Transient failures of NON_IDEMPOTENT_BACKENDS propagate too, so the
+        caller can check what was applied before trying again.
+        """
+        bucket = self.bucket(backend)
+        retry_transient = backend not in NON_IDEMPOTENT_BACKENDS
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttled(e)
+                if attempt >= self.max_retries or not (throttled or (retry_transient and is_transient(e))):
+                    raise
+                delay = backoff_delay(attempt)
+                if throttled:
+                    retry_after = retry_after_seconds(e)
+                    if retry_after is not None:
+                        delay = retry_after + random.uniform(0, BACKOFF_BASE_SECONDS)
+                    # Pause every caller sharing this bucket, not just this thread
+                    bucket.penalize(delay)
+                else:
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            bucket.reward()
+            return result
+
+# One limiter per provider for the whole process, so budgets are shared
+# across every Streamlit session and worker thread.
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider):
+    """Returns the process-wide RateLimiter for a provider ('spotify' or 'youtube')."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = RateLimiter(provider)
+        return _limiters[provider]
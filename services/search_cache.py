@@ -0,0 +1,167 @@
+import os
+import json
+import threading
+import time
+
+from database import DATA_DIR, get_connection, transaction
+from services.rate_limiter import is_query_error
+
+# Search cache lives next to anti_playlist.db
+CACHE_DB_PATH = DATA_DIR / 'search_cache.db'
+
+# --- Cache Configuration ---
+# Positive entries (non-empty results) expire after a per-platform TTL;
+# negative entries (empty results or rejected queries) use a shorter TTL.
+CACHE_TTL_SECONDS = {
+    'spotify': int(os.environ.get('OTTER_SPOTIFY_SEARCH_TTL', str(7 * 24 * 3600))),
+    'youtube': int(os.environ.get('OTTER_YOUTUBE_SEARCH_TTL', str(3 * 24 * 3600))),
+}
+DEFAULT_TTL_SECONDS = 24 * 3600
+NEGATIVE_TTL_SECONDS = int(os.environ.get('OTTER_SEARCH_NEGATIVE_TTL', '3600'))
+MAX_CACHE_ENTRIES = int(os.environ.get('OTTER_SEARCH_CACHE_MAX_ENTRIES', '5000'))
+
+class SearchCache:
+    """
+    SQLite-backed cache for provider search responses, keyed by
+    platform/query/filter/limit, with TTL expiry and LRU eviction.
+    """
+    def __init__(self, path=CACHE_DB_PATH, max_entries=MAX_CACHE_ENTRIES,
+                 ttls=None, negative_ttl=NEGATIVE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(CACHE_TTL_SECONDS if ttls is None else ttls)
+        self.negative_ttl = negative_ttl
+        self._counters = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0,
+                          'stores': 0, 'negative_stores': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self):
+        with transaction(self.path) as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS search_cache (
+                platform TEXT NOT NULL,
+                query TEXT NOT NULL,
+                filter TEXT NOT NULL,
+                result_limit INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                negative INTEGER NOT NULL DEFAULT 0,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (platform, query, filter, result_limit)
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_search_cache_lru ON search_cache (last_access)')
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    @staticmethod
+    def _key(platform, query, filter, limit):
+        return (platform, query.strip().lower(), filter or '', int(limit))
+
+    def get(self, platform, query, filter, limit):
+        """
+        Returns (hit, items). A negative hit returns (True, []).
+        Expired entries count as misses.
+        """
+        key = self._key(platform, query, filter, limit)
+        now = time.time()
+        conn = get_connection(self.path)
+        row = conn.execute('''
+        SELECT payload, negative, expires_at FROM search_cache
+        WHERE platform = ? AND query = ? AND filter = ? AND result_limit = ?
+        ''', key).fetchone()
+        if row is None:
+            self._count('misses')
+            return False, None
+        payload, negative, expires_at = row
+        if expires_at <= now:
+            self._count('misses')
+            self._count('expired')
+            return False, None
+        conn.execute('''
+        UPDATE search_cache SET last_access = ?
+        WHERE platform = ? AND query = ? AND filter = ? AND result_limit = ?
+        ''', (now,) + key)
+        if negative:
+            self._count('negative_hits')
+            return True, []
+        self._count('hits')
+        return True, json.loads(payload)
+
+    def put(self, platform, query, filter, limit, items):
+        """Stores a result list; empty lists are stored as negative entries."""
+        key = self._key(platform, query, filter, limit)
+        negative = not items
+        now = time.time()
+        ttl = self.negative_ttl if negative else self.ttls.get(platform, DEFAULT_TTL_SECONDS)
+        payload = '[]' if negative else json.dumps(items, separators=(',', ':'))
+        with transaction(self.path) as conn:
+            conn.execute('''
+            INSERT OR REPLACE INTO search_cache
+                (platform, query, filter, result_limit, payload, negative, expires_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', key + (payload, int(negative), now + ttl, now))
+            evicted = self._evict(conn)
+        self._count('negative_stores' if negative else 'stores')
+        if evicted:
+            self._count('evictions', evicted)
+
+    def _evict(self, conn):
+        """Drops expired rows, then least recently used rows above max_entries."""
+        evicted = conn.execute('DELETE FROM search_cache WHERE expires_at <= ?', (time.time(),)).rowcount
+        (total,) = conn.execute('SELECT COUNT(*) FROM search_cache').fetchone()
+        if total > self.max_entries:
+            evicted += conn.execute('''
+            DELETE FROM search_cache WHERE rowid IN (
+                SELECT rowid FROM search_cache ORDER BY last_access ASC LIMIT ?
+            )
+            ''', (total - self.max_entries,)).rowcount
+        return evicted
+
+    def get_or_fetch(self, platform, query, filter, limit, fetch):
+        """
+        Returns cached items for the query, calling fetch() on a miss.
+        Queries the provider rejects (400/404) are negatively cached and the
+        error is re-raised. Other errors (throttling, outages, one user's
+        expired token, bugs in fetch) are never cached, since the cache is
+        shared by every user.
+        """
+        hit, items = self.get(platform, query, filter, limit)
+        if hit:
+            return items
+        try:
+            items = fetch()
+        except Exception as e:
+            if is_query_error(e):
+                self.put(platform, query, filter, limit, [])
+            raise
+        self.put(platform, query, filter, limit, items)
+        return items
+
+    def stats(self):
+        """Returns hit/miss counters plus the current entry count and hit rate."""
+        with self._lock:
+            stats = dict(self._counters)
+        (stats['entries'],) = get_connection(self.path).execute('SELECT COUNT(*) FROM search_cache').fetchone()
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        return stats
+
+    def clear(self):
+        with transaction(self.path) as conn:
+            conn.execute('DELETE FROM search_cache')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """Returns the process-wide SearchCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
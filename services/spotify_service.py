@@ -6,36 +6,73 @@ import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import time
 import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from contextlib import closing
+
+from services.rate_limiter import get_rate_limiter
+import database
+from services.search_cache import get_search_cache
+from services.text_match import KeywordMatcher
+from services import metrics, profiling
+from services.client_registry import get_client_registry, registry_key
+from services import playlist_writer
+from services import catalog
+from services import genre_space
+from services.taxonomy import get_taxonomy
+from services.streaming import gather_candidates
+
+def _get_app_oauth(client_id, client_secret, redirect_uri, scope):
+    """
+    Returns the shared OAuth manager used for the authorize URL and code exchange.
+    It never serves tokens from its cache, so one manager is safe for every user.
+    """
+    def factory(session):
+        return SpotifyOAuth(
+            client_id=client_id,
+            client_secret=client_secret,
+            redirect_uri=redirect_uri,
+            scope=scope,
+            show_dialog=True,
+            cache_handler=spotipy.cache_handler.MemoryCacheHandler(),
+            requests_session=session
+        )
+    return get_client_registry().get_or_create(
+        registry_key('spotify-oauth', client_id, client_secret, redirect_uri, scope), factory)
+
 def get_spotify_auth_url(client_id, client_secret, redirect_uri, scope):
     """Generate Spotify OAuth 2.0 authorization URL"""
-    sp_oauth = SpotifyOAuth(
-        client_id=client_id,
-        client_secret=client_secret,
-        redirect_uri=redirect_uri,
-        scope=scope,
-        show_dialog=True
-    )
-    return sp_oauth.get_authorize_url()
+    return _get_app_oauth(client_id, client_secret, redirect_uri, scope).get_authorize_url()
 
 def get_spotify_token(client_id, client_secret, redirect_uri, scope, code):
     """Exchange authorization code for access token"""
-    sp_oauth = SpotifyOAuth(
-        client_id=client_id,
-        client_secret=client_secret,
-        redirect_uri=redirect_uri,
-        scope=scope
-    )
-    return sp_oauth.get_access_token(code)
+    # check_cache=False: the shared manager must never hand back another user's token
+    return _get_app_oauth(client_id, client_secret, redirect_uri, scope).get_access_token(code, check_cache=False)
 
 def get_spotify_client_from_token(token_info, client_id, client_secret, redirect_uri, scope):
-    """Create Spotify client from token info"""
-    return spotipy.Spotify(auth_manager=SpotifyOAuth(
-        client_id=client_id,
-        client_secret=client_secret,
-        redirect_uri=redirect_uri,
-        scope=scope,
-        cache_handler=spotipy.cache_handler.MemoryCacheHandler(token_info)
-    ))
+    """
+    Returns the user's Spotify client, reused from the client registry when
+    possible so its HTTP connections and refreshed token survive reruns.
+    Its API calls are recorded in the metrics registry.
+    """
+    # The refresh token stays the same when the access token is refreshed
+    user_secret = token_info.get('refresh_token') or token_info.get('access_token')
+    def factory(session):
+        return metrics.instrument(spotipy.Spotify(
+            auth_manager=SpotifyOAuth(
+                client_id=client_id,
+                client_secret=client_secret,
+                redirect_uri=redirect_uri,
+                scope=scope,
+                cache_handler=spotipy.cache_handler.MemoryCacheHandler(token_info),
+                requests_session=session
+            ),
+            requests_session=session
+        ), 'spotify')
+    return get_client_registry().get_or_create(
+        registry_key('spotify', client_id, user_secret), factory)
 
 # --- Spotify Configuration ---
 # IMPORTANT: Replace with your actual Spotify Client ID and Secret
@@ -45,179 +82,76 @@ SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET')
 SPOTIFY_REDIRECT_URI = 'https://otter-anti.streamlit.app' # Must match your Spotify Developer Dashboard redirect URI
 SPOTIFY_SCOPE = 'playlist-modify-public user-library-read user-top-read'
 
-# --- Genre Opposition Mapping ---
-# As provided in your prompt.
-GENRE_OPPOSITES = {
-    'pop': [
-        'classical symphony', 'gregorian chant', 'gamelan', 'throat singing', 'ambient',
-        'death metal', 'noise music', 'tuvan overtone', 'balinese kecak', 'tibetan ritual',
-        'inuit katajjaq', 'baroque fugue', 'renaissance madrigal', 'medieval chant'
-    ],
-    'rock': [
-        'bossa nova', 'qawwali', 'fado', 'kora music', 'tabla solo', 'enka', 'free jazz',
-        'african mbira', 'persian santur', 'andean pan flute', 'drone ambient', 'lowercase music',
-        'silence composition'
-    ],
-    'hip hop': [
-        'bluegrass', 'opera aria', 'celtic harp', 'flamenco', 'sitar', 'opera', 'celtic folk',
-        'gregorian chant', 'georgian polyphony', 'arabic maqam', 'hindustani dhrupad',
-        'unaccompanied kora', 'solo shakuhachi', 'handpan meditation'
-    ],
-    'electronic': [
-        'acoustic folk', 'chamber music', 'handpan', 'didgeridoo', 'erhu', 'sitar raga', 'flamenco',
-        'field recordings', 'natural soundscapes', 'forest ambiance', 'bone flute', 'lithophone',
-        'prehistoric music'
-    ],
-    'indie': [
-        'traditional japanese', 'african drums', 'mongolian music', 'oud music', 'steel drum',
-        'bollywood', 'mariachi', 'afrobeat', 'j-pop', 'cumbia', 'berber ahwash', 'sami joik',
-        'australian didgeridoo', 'circuit bending', 'broken music', 'power electronics'
-    ],
-    'jazz': [
-        'techno', 'drum and bass', 'minimal synth', 'noise rock', 'eurodance',
-        'algorithmic music', 'trap', 'EDM festival mix', 'computer-generated music'
-    ],
-    'classical': [
-        'punk rock', 'gabber', 'breakcore', 'glitch hop', 'lo-fi phonk',
-        'auto-tuned rap', 'chiptune', 'footwork', 'trap metal'
-    ],
-    'metal': [
-        'binaural beats', 'lo-fi chillhop', 'nature sounds', 'harp concerto', 'soft jazz trio',
-        'meditative ambient', 'bossa nova', 'seashore field recordings'
-    ],
-    'reggae': [
-        'industrial noise', 'black metal', 'military march', 'hard techno', 'cold wave',
-        'atonal serialism', 'cybergrind', 'marching band'
-    ],
-    'folk': [
-        'synthwave', 'future bass', 'dubstep', 'trance', 'eurobeat',
-        'hyperpop', 'trap soul', 'auto-tuned mumble rap'
-    ],
-    'blues': [
-        'psytrance', 'ambient glitch', 'vaporwave', 'hardstyle EDM', 'deep house',
-        'sound collage', 'electro swing remix'
-    ],
-    'country': [
-        'k-pop', 'electro house', 'glitchcore', 'drill rap', 'nightcore',
-        'vaportrap', 'future funk', 'russian rave'
-    ],
-    'techno': [
-        'string quartet', 'acoustic flamenco', 'gospel choir', 'carnatic vocal',
-        'baroque ensemble', 'folkloric lullaby', 'woodland flute trio'
-    ],
-    'lo-fi': [
-        'marching band', 'symphonic metal', 'big band swing', 'post-hardcore', 'grindcore',
-        'math rock', 'melodic death metal'
-    ]
-}
-
-# --- World Music Categories / Authentic Genres for Spotify ---
-# This list is flattened from the AUTHENTIC_MUSIC_SEARCHES in your prompt.
-WORLD_MUSIC_CATEGORIES = [
-    'j-pop', 'japanese music', 'anime songs', 'japanese rock', 'city pop', 'enka', 'shakuhachi', 'koto pop',
-    'k-pop', 'korean ballad', 'korean rock', 'korean ost', 'trot', 'pansori', 'k-hiphop',
-    'c-pop', 'mandarin songs', 'chinese ballad', 'cantopop', 'chinese rock', 'guqin', 'erhu fusion',
-    'bollywood', 'punjabi music', 'tamil songs', 'hindi songs', 'indian classical', 'dhrupad', 'sitar',
-    'thai pop', 'thai rock', 'luk thung', 'thai ost', 'piphat', 'mor lam',
-    'vpop', 'vietnamese ballad', 'vietnamese rock', 'dan tranh', 'ca trù',
-    'qawwali', 'pakistani pop', 'coke studio', 'sufi rock',
-    'afghan traditional', 'rubab music', 'afghan pop',
-    'dombra music', 'kazakh folk', 'modern kazakh pop',
-    'arabic music', 'arabic pop', 'lebanese music', 'egyptian music', 'oud taqsim',
-    'persian music', 'iranian pop', 'persian classical', 'santur',
-    'turkish pop', 'turkish rock', 'arabesque', 'turkish folk', 'ney',
-    'israeli music', 'hebrew songs', 'mizrahi music', 'klezmer',
-    'afrobeats', 'nigerian music', 'nollywood songs', 'highlife', 'juju',
-    'azonto', 'highlife', 'ghana gospel',
-    'south african music', 'amapiano', 'kwaito', 'afrikaans music', 'mbube',
-    'ethiopian music', 'ethiopian jazz', 'traditional ethiopian', 'krar',
-    'kenyan music', 'benga', 'kenyan pop', 'nyatiti',
-    'rai', 'chaabi', 'gnawa',
-    'french music', 'chanson', 'french pop', 'french rock', 'musique concrète',
-    'german music', 'deutschpop', 'neue deutsche welle', 'schlager', 'krautrock',
-    'italian music', 'italian pop', 'neapolitan songs', 'opera',
-    'spanish music', 'spanish pop', 'flamenco', 'spanish rock', 'sephardic',
-    'russian music', 'russian pop', 'russian rock', 'chanson', 'balalaika',
-    'portuguese music', 'fado', 'portuguese pop', 'cante alentejano',
-    'swedish music', 'norwegian music', 'danish music', 'finnish music', 'kulning',
-    'balkan brass', 'gypsy music', 'sevdah', 'turbo folk',
-    'laïko', 'rembetiko', 'greek folk', 'bouzouki',
-    'mexican music', 'mariachi', 'ranchera', 'mexican rock', 'son jarocho',
-    'brazilian music', 'bossa nova', 'samba', 'mpb', 'forró',
-    'tango', 'argentinian music', 'rock nacional', 'chacarera',
-    'vallenato', 'cumbia', 'colombian music', 'champeta', 'bambuco',
-    'huayno', 'criolla', 'afro-peruvian',
-    'reggaeton', 'latin trap', 'dembow', 'perreo', 'plena',
-    'throat singing', 'tuvan folk', 'igil music',
-    'long song', 'morin khuur', 'overtone singing',
-    'powwow', 'navajo chant', 'iroquois social dance',
-    'didgeridoo', 'clapsticks', 'dreamtime music',
-    'katajjaq', 'throat singing inuit', 'drum dance',
-    'joik', 'northern sami music',
-    'didgeridoo music', 'aboriginal music',
-    'ukulele instrumental', 'steel guitar hawaii', 'hula music',
-    'maori music', 'taonga pūoro', 'waiata',
-    'xenharmonic', 'just intonation', '72-EDO',
-    'harsh noise wall', 'power electronics', 'merzbow',
-    'aleatoric music', 'spectralism', 'fluxus',
-    'dark ambient', 'space music', 'drone ambient',
-    'acousmatic', 'sound collage', 'musique concrète',
-    'georgian polyphony', 'traditional georgian music', 'panduri songs',
-    'duduk music', 'armenian folk', 'ashugh songs',
-    'mugham', 'azerbaijani pop', 'tar music',
-    'shashmaqam', 'dutar music', 'uzbek traditional',
-    'komuz music', 'epic poetry songs', 'kyrgyz folk',
-    'tajik pop', 'rubab music', 'traditional tajik music',
-    'saung music', 'burmese classical', 'pat waing',
-    'mor lam lao', 'laotian traditional music',
-    'pinpeat', 'cambodian rock', 'khmer traditional music',
-    'meke music', 'fijian choral',
-    'garamut drum', 'sing-sing music',
-    'samoan slap dance', 'polynesian harmonies',
-    'trikitixa', 'basque folk music',
-    'joik', 'laplandic chants',
-    'gypsy jazz', 'romani violin',
-    'tatar folk music', 'kubyz', 'tatar throat singing',
-    'canadian indie', 'first nations chants', 'québécois folk',
-    'inuit drum dance', 'yupik chants',
-    'haitian compas', 'rara music', 'vodou drumming',
-    'bachata', 'merengue', 'dominican dembow',
-    'son cubano', 'rumba', 'cuban trova',
-    'bomba y plena', 'reggaeton', 'jíbaro music',
-    'charango music', 'andino folk', 'bolivian morenada',
-    'nueva canción', 'cueca', 'mapuche music',
-    'arpa paraguaya', 'polca paraguaya',
-    'joropo', 'cuatro music', 'gaita zuliana',
-    'candombe', 'murga', 'tango uruguayo',
-    'kora music', 'ngoni', 'griot storytelling',
-    'sabar drums', 'mbalax',
-    'coupé-décalé', 'zoblazo',
-    'soukous', 'ndombolo', 'rumba congolese',
-    'mbira dzavadzimu', 'chimurenga music',
-    'valiha music', 'salegy',
-    'gnawa', 'chaabi marocain', 'andalusi music',
-    'rai', 'kabyle music', 'malouf',
-    'muwashshah', 'syrian oud music',
-    'maqam al-iraqi', 'joza music',
-    'tenores di bitti', 'cantu a tenore',
-    'polyphonic corsican chant', 'paghjella',
-    'singing bowls', 'tibetan horn', 'chanting monks',
-    'khomus music', 'yakutian throat singing',
-    'ethno jazz', 'worldbeat', 'balkan fusion',
-    'folktronica', 'synth-folk', 'digital cumbia',
-    'afro house', 'deep tribal beats', 'ancestral rhythms'
-]
+# --- Search Configuration ---
+# Number of keyword searches allowed in flight at once in iter_opposite_tracks.
+SPOTIFY_SEARCH_CONCURRENCY = int(os.environ.get('SPOTIFY_SEARCH_CONCURRENCY', '8'))
+MAX_SEARCH_CANDIDATES = 50 # Stop searching once this many candidates are collected
+MAX_PLAYLIST_TRACKS = 25 # Tracks returned for the final playlist
+SEARCH_PAGE_SIZE = 20 # Tracks used per keyword, live or from the catalog
+HARVEST_PAGE_SIZE = 50 # Tracks the catalog harvester keeps per keyword (Spotify's maximum)
+LEARNED_OPPOSITES = 15 # Genres searched from the learned genre space...
+LEARNED_OPPOSITE_POOL = 45 # ...sampled from this many most distant genres, so runs vary
+
+# Every Spotify API call goes through the process-wide limiter
+_limiter = get_rate_limiter('spotify')
+# Keyword search responses are shared across users through the search cache
+_search_cache = get_search_cache()
+
+# --- Taxonomy ---
+# Genre opposites and culture search terms are shared with youtube_service (services/taxonomy.json)
+_taxonomy = get_taxonomy()
+GENRE_OPPOSITES = _taxonomy.genre_opposites
+# Every culture search term, used as broad world music keywords
+WORLD_MUSIC_CATEGORIES = _taxonomy.world_terms
+
+# --- Raw Genre Mapping Index ---
+# Raw Spotify genres ("dance pop", "uk hip hop") map to the first GENRE_OPPOSITES
+# key they contain. Mappings are memoized in-process and persisted in the
+# genre_map table, shared by every user and invalidated when the keys change.
+_GENRE_KEY_MATCHER = KeywordMatcher(GENRE_OPPOSITES)
+_GENRE_KEY_RANK = {genre: rank for rank, genre in enumerate(GENRE_OPPOSITES)}
+GENRE_MAP_VERSION = hashlib.sha1('|'.join(GENRE_OPPOSITES).encode('utf-8')).hexdigest()[:12]
+_genre_map = None
+_genre_map_lock = threading.Lock()
+
+def _match_genre_key(genre_raw):
+    """Returns the first GENRE_OPPOSITES key contained in a raw genre, or None."""
+    matches = _GENRE_KEY_MATCHER.find(genre_raw.lower())
+    return min(matches, key=_GENRE_KEY_RANK.__getitem__) if matches else None
+
+def map_raw_genres(raw_genres):
+    """
+    Maps raw Spotify genres to taxonomy genres (None when no key matches).
+    Known genres are a dictionary lookup; new ones are matched once and persisted.
+    """
+    global _genre_map
+    with _genre_map_lock:
+        if _genre_map is None:
+            try:
+                _genre_map = database.load_genre_map(GENRE_MAP_VERSION)
+            except Exception as e:
+                print(f"   ⚠ Couldn't load genre mapping index: {e}")
+                _genre_map = {}
+        new_entries = {raw: _match_genre_key(raw) for raw in raw_genres if raw not in _genre_map}
+        _genre_map.update(new_entries)
+        mapping = {raw: _genre_map[raw] for raw in raw_genres}
+    if new_entries:
+        try:
+            database.save_genre_map(GENRE_MAP_VERSION, new_entries)
+        except Exception as e:
+            print(f"   ⚠ Couldn't persist genre mapping index: {e}")
+    return mapping
 
 def get_spotify_client():
     """Authenticates with Spotify using OAuth 2.0."""
     print("🔐 Authenticating with Spotify...")
     try:
-        sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
+        sp = metrics.instrument(spotipy.Spotify(auth_manager=SpotifyOAuth(
             client_id=SPOTIFY_CLIENT_ID,
             client_secret=SPOTIFY_CLIENT_SECRET,
             redirect_uri=SPOTIFY_REDIRECT_URI,
             scope=SPOTIFY_SCOPE
-        ))
+        )), 'spotify')
         print("✅ Spotify authentication successful!")
         return sp
     except Exception as e:
@@ -225,25 +159,34 @@ def get_spotify_client():
         print("Please check your Client ID, Client Secret, and Redirect URI in the Spotify Developer Dashboard.")
         return None
 
-def analyze_user_genres(sp):
-    """Analyzes user's top genres from their listening history on Spotify."""
-    print("🎧 Analyzing your music preferences...")
-    
+TOP_ARTIST_TIME_RANGES = ['short_term', 'medium_term', 'long_term']
+
+def _fetch_top_artists(sp, term):
+    """Fetches the user's top artists for one time range; errors yield an empty list."""
+    try:
+        print(f"   🔍 Fetching top artists for {term}...")
+        results = _limiter.call('default', sp.current_user_top_artists, time_range=term, limit=50) # Increased limit for better genre coverage
+        return results['items']
+    except spotipy.SpotifyException as e:
+        print(f"   ⚠ Couldn't get {term} top artists: {e}")
+    except Exception as e:
+        print(f"   ❌ An unexpected error occurred fetching {term} top artists: {e}")
+    return []
+
+def fetch_raw_genres(sp):
+    """
+    Counts the raw Spotify genres of the user's top artists across all time
+    ranges; returns [(raw_genre, count)], most frequent first.
+    """
     if not sp:
         print("   ❌ Spotify client not initialized. Skipping genre analysis.")
         return []
 
     top_artists = []
-    # Fetch top artists for different time ranges
-    for term in ['short_term', 'medium_term', 'long_term']:
-        try:
-            print(f"   🔍 Fetching top artists for {term}...")
-            results = sp.current_user_top_artists(time_range=term, limit=50) # Increased limit for better genre coverage
-            top_artists.extend(results['items'])
-        except spotipy.SpotifyException as e:
-            print(f"   ⚠ Couldn't get {term} top artists: {e}")
-        except Exception as e:
-            print(f"   ❌ An unexpected error occurred fetching {term} top artists: {e}")
+    # Fetch top artists for the different time ranges in parallel
+    with ThreadPoolExecutor(max_workers=len(TOP_ARTIST_TIME_RANGES), thread_name_prefix="spotify-top") as executor:
+        for items in executor.map(lambda term: _fetch_top_artists(sp, term), TOP_ARTIST_TIME_RANGES):
+            top_artists.extend(items)
     
     if not top_artists:
         print("   ⚠ No top artist data found for genre analysis.")
@@ -255,18 +198,25 @@ def analyze_user_genres(sp):
         for genre in artist.get('genres', []):
             genre_counter[genre] += 1
     
+    # Artists' genre lists are pooled across users to learn the genre space
+    try:
+        database.save_artist_genres({artist['id']: artist.get('genres') for artist in top_artists if artist.get('id')})
+    except Exception as e:
+        print(f"   ⚠ Couldn't record artist genres: {e}")
+    
+    return sorted(genre_counter.items(), key=lambda x: -x[1])
+
+def map_genre_counts(raw_genres):
+    """
+    Maps [(raw_genre, count)] onto our predefined genres; unmatched raw genres
+    are kept as-is. Returns [(genre, count)], most frequent first.
+    """
     # Map raw Spotify genres to our predefined genres for opposition mapping
+    genre_index = map_raw_genres([genre_raw for genre_raw, _ in raw_genres])
     mapped_genres = defaultdict(int)
-    for genre_raw, count in genre_counter.items():
-        found_match = False
-        for our_genre in GENRE_OPPOSITES:
-            if our_genre in genre_raw.lower(): # Check if our broad genre is in Spotify's specific genre tag
-                mapped_genres[our_genre] += count
-                found_match = True
-                break
+    for genre_raw, count in raw_genres:
         # If no direct match to our broad categories, add as-is to see other popular genres
-        if not found_match:
-            mapped_genres[genre_raw] += count
+        mapped_genres[genre_index[genre_raw] or genre_raw] += count
 
     sorted_genres = sorted(mapped_genres.items(), key=lambda x: -x[1])
     
@@ -279,138 +229,505 @@ def analyze_user_genres(sp):
     
     return sorted_genres
 
-def find_opposite_tracks(sp, top_genres, existing_tracks=None):
+def analyze_user_genres(sp):
+    """Analyzes user's top genres from their listening history on Spotify."""
+    print("🎧 Analyzing your music preferences...")
+    return map_genre_counts(fetch_raw_genres(sp))
+
+def _slim_track(track):
+    """Keeps only the track fields we use, so cached search results stay small."""
+    return {
+        'id': track['id'],
+        'name': track['name'],
+        'artists': [{'id': a.get('id'), 'name': a.get('name')} for a in track.get('artists') or []],
+        'duration_ms': track.get('duration_ms'),
+        'popularity': track.get('popularity'),
+    }
+
+def _search_keyword(sp, genre_keyword):
+    """Runs a single keyword search (served from the search cache when possible) and returns track items."""
+    # Note: Spotify's 'genre' search is often limited to its own defined genre seeds.
+    # Using broader keyword searches might yield more results for niche/world music.
+    def fetch():
+        results = _limiter.call('search', sp.search, q=genre_keyword, type='track', limit=SEARCH_PAGE_SIZE)
+        return [_slim_track(track) for track in results['tracks']['items'] if track and track.get('id')]
+    return _search_cache.get_or_fetch('spotify', genre_keyword, 'track', SEARCH_PAGE_SIZE, fetch)
+
+def _keyword_candidates(genre_keyword, items, existing_tracks, seen_filter=None):
+    """Turns one keyword's results into candidates, skipping existing and already-seen tracks."""
+    # One batched history lookup per keyword's results instead of loading the whole history
+    known = seen_filter([track['id'] for track in items]) if seen_filter and items else ()
+    return [
+        {
+            'id': track['id'],
+            'name': track['name'],
+            'artist': track['artists'][0]['name'] if track['artists'] else 'Unknown Artist',
+            'genre_keyword': genre_keyword # Store the keyword used to find it
+        }
+        for track in items
+        if track['id'] not in existing_tracks and track['id'] not in known
+    ]
+
+def _catalog_coverage(mode=None):
     """
-    Finds tracks that are opposite to user's preferred genres,
-    prioritizing world music categories and general anti-genres.
+    Returns (keywords the harvested catalog can serve, whether the other
+    keywords are searched live) for a catalog mode.
     """
-    if existing_tracks is None:
-        existing_tracks = set()
+    mode = catalog.catalog_mode(mode)
+    if mode == 'off':
+        return set(), True
+    try:
+        return {keyword for _, keyword in catalog.get_catalog().fresh_keywords('spotify')}, mode != 'only'
+    except Exception as e:
+        print(f"   ⚠ Couldn't read the candidate catalog: {e}")
+        return set(), mode != 'only'
+
+def _catalog_results(genre_keyword):
+    """A random page of the keyword's harvested tracks (the catalog keeps more than a live search returns)."""
+    entries = catalog.get_catalog().lookup('spotify', keywords=[genre_keyword], sample=SEARCH_PAGE_SIZE)
+    return [entry['payload'] for entry in entries]
+
+def _iter_keyword_results(sp, keywords, concurrency, catalog_mode=None):
+    """
+    Yields (keyword, track items) as each keyword's results become available:
+    catalog-served keywords first, then live searches in completion order.
+    Live searches fan out over a thread pool when concurrency > 1; closing
+    the generator cancels the searches that have not started yet.
+    """
+    covered, search_live = _catalog_coverage(catalog_mode)
+    served = [keyword for keyword in keywords if keyword in covered]
+    live = [keyword for keyword in keywords if keyword not in covered] if search_live else []
+    if covered:
+        print(f"   📚 {len(served)} keywords served from the catalog, {len(live)} to search live.")
     
-    print("🔍 Searching for contrasting music tracks...")
-    candidates = []
+    for genre_keyword in served:
+        try:
+            items = _catalog_results(genre_keyword)
+        except Exception as e:
+            print(f"   ⚠ Couldn't read '{genre_keyword}' from the candidate catalog: {e}")
+            if search_live:
+                live.append(genre_keyword)
+            continue
+        yield genre_keyword, items
     
-    if not sp:
-        print("   ❌ Spotify client not initialized. Skipping track search.")
-        return candidates
+    if not live:
+        return
+    if concurrency <= 1:
+        # One search at a time (kept for debugging and very low quotas)
+        for genre_keyword in live:
+            try:
+                items = _search_keyword(sp, genre_keyword)
+            except spotipy.SpotifyException as e:
+                # Common for niche keywords; a rejected query (400/404) is negatively cached so it is not retried every run
+                print(f"   ⚠ Couldn't search for '{genre_keyword}': {e}")
+                continue
+            except Exception as e:
+                print(f"   ❌ Error searching for '{genre_keyword}': {e}")
+                continue
+            yield genre_keyword, items
+        return
+    
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="spotify-search")
+    try:
+        futures = {executor.submit(_search_keyword, sp, keyword): keyword for keyword in live}
+        for future in as_completed(futures):
+            genre_keyword = futures[future]
+            try:
+                items = future.result()
+            except spotipy.SpotifyException as e:
+                # Common for niche keywords; a rejected query (400/404) is negatively cached so it is not retried every run
+                print(f"   ⚠ Couldn't search for '{genre_keyword}': {e}")
+                continue
+            except Exception as e:
+                print(f"   ❌ Error searching for '{genre_keyword}': {e}")
+                continue
+            yield genre_keyword, items
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    # Get specific opposite genres from user's top genres (top 3 for strong signal)
+def _opposite_keywords(top_genres, raw_genres=None):
+    """
+    Picks the search keywords for a user: genres far from raw_genres (or
+    top_genres) in the learned genre space, or else the GENRE_OPPOSITES of the
+    top 3 genres, plus a sample of world music categories.
+    """
     opposite_genre_keywords = set()
-    for genre, _ in top_genres[:3]:
-        # Add directly mapped opposites
-        for opposite in GENRE_OPPOSITES.get(genre, []):
-            opposite_genre_keywords.add(opposite)
-        # Add a few random world music categories to broaden the search
-        # These are used as keywords for search, not necessarily Spotify's exact genres
+    space = genre_space.get_genre_space()
+    learned = space.most_opposite(raw_genres or top_genres, LEARNED_OPPOSITE_POOL) if space is not None else []
+    if learned:
+        # The whole genre vector is scored against every known genre
+        pool = [genre for genre, _ in learned]
+        opposite_genre_keywords.update(random.sample(pool, min(LEARNED_OPPOSITES, len(pool))))
+    else:
+        # Static fallback: mapped opposites of the user's top 3 genres
+        for genre, _ in top_genres[:3]:
+            for opposite in GENRE_OPPOSITES.get(genre, []):
+                opposite_genre_keywords.add(opposite)
     
     # Add a selection of diverse world music categories to ensure broader contrast
     num_world_genres_to_add = min(10, len(WORLD_MUSIC_CATEGORIES))
     opposite_genre_keywords.update(random.sample(WORLD_MUSIC_CATEGORIES, num_world_genres_to_add))
+    return list(opposite_genre_keywords)
+
+def iter_opposite_tracks(sp, top_genres, existing_tracks=None, concurrency=None, seen_filter=None, catalog_mode=None,
+                         raw_genres=None, fair_share=False):
+    """
+    Yields tracks opposite to the user's preferred genres as they are found,
+    up to MAX_SEARCH_CANDIDATES unique tracks.
+    
+    Keywords the catalog harvester has covered are served from the local
+    catalog first (see catalog.CATALOG_MODE, or pass catalog_mode); the rest
+    are searched live, concurrently on up to `concurrency` threads
+    (defaults to SPOTIFY_SEARCH_CONCURRENCY); pass concurrency=1 to search sequentially.
+    `seen_filter`, if given, is called with a list of track IDs and returns the
+    ones to exclude (e.g. database.find_known_songs bound to a user).
+    With fair_share, each keyword contributes at most its equal share of
+    MAX_SEARCH_CANDIDATES, so the candidates span every keyword instead of
+    the ones served first (catalog keywords, then the fastest searches).
+    Close the generator once you have enough: outstanding searches are cancelled.
+    """
+    if existing_tracks is None:
+        existing_tracks = set()
+    if concurrency is None:
+        concurrency = SPOTIFY_SEARCH_CONCURRENCY
+    
+    print("🔍 Searching for contrasting music tracks...")
+    
+    if not sp:
+        print("   ❌ Spotify client not initialized. Skipping track search.")
+        return
     
-    if not opposite_genre_keywords:
+    keywords = _opposite_keywords(top_genres, raw_genres)
+    if not keywords:
         print("   ⚠ No specific contrasting genres or world music categories to search for.")
-        return candidates
+        return
 
-    print(f"  🎵 Exploring approximately {len(opposite_genre_keywords)} contrasting genres/keywords.")
+    print(f"  🎵 Exploring approximately {len(keywords)} contrasting genres/keywords.")
     
-    # Iterate through selected genres/keywords to find tracks
-    # Use tqdm to show progress for this potentially long loop
-    for genre_keyword in tqdm(list(opposite_genre_keywords), desc="   Searching genres/keywords"):
-        try:
-            # Note: Spotify's 'genre' search is often limited to its own defined genre seeds.
-            # Using broader keyword searches might yield more results for niche/world music.
-            results = sp.search(q=genre_keyword, type='track', limit=20) # Get 20 tracks per keyword
-            for track in results['tracks']['items']:
-                if track['id'] not in existing_tracks:
-                    candidates.append({
-                        'id': track['id'],
-                        'name': track['name'],
-                        'artist': track['artists'][0]['name'] if track['artists'] else 'Unknown Artist',
-                        'genre_keyword': genre_keyword # Store the keyword used to find it
-                    })
-                if len(candidates) >= 50: # Limit total candidates to a reasonable number
+    max_per_keyword = -(-MAX_SEARCH_CANDIDATES // len(keywords)) if fair_share else None
+    found = set()
+    with closing(_iter_keyword_results(sp, keywords, concurrency, catalog_mode)) as results:
+        for genre_keyword, items in results:
+            taken = 0
+            for candidate in _keyword_candidates(genre_keyword, items, existing_tracks, seen_filter):
+                if max_per_keyword is not None and taken >= max_per_keyword:
                     break
-        except spotipy.SpotifyException as e:
-            # print(f"   ⚠ Couldn't search for '{genre_keyword}': {e}") # Too verbose in loop
-            pass # Suppress common "Invalid genre" errors for niche searches
-        except Exception as e:
-            print(f"   ❌ Error searching for '{genre_keyword}': {e}")
-        if len(candidates) >= 50:
-            break
-        time.sleep(0.1) # Small delay to respect API rate limits
+                if candidate['id'] in found:
+                    continue
+                found.add(candidate['id'])
+                taken += 1
+                yield candidate
+                if len(found) >= MAX_SEARCH_CANDIDATES: # Limit total candidates to a reasonable number
+                    return
 
+def find_opposite_tracks(sp, top_genres, existing_tracks=None, concurrency=None, seen_filter=None, catalog_mode=None,
+                         raw_genres=None):
+    """
+    Finds tracks that are opposite to user's preferred genres,
+    prioritizing world music categories and general anti-genres.
+    Collects iter_opposite_tracks (same arguments) and returns a random
+    MAX_PLAYLIST_TRACKS of the candidates.
+    """
+    candidates = list(iter_opposite_tracks(sp, top_genres, existing_tracks, concurrency, seen_filter,
+                                           catalog_mode, raw_genres))
     random.shuffle(candidates) # Shuffle final candidates for variety
-    return candidates[:25] # Return top 25 candidates for the playlist
+    return candidates[:MAX_PLAYLIST_TRACKS] # Return top 25 candidates for the playlist
 
-def create_anti_playlist(sp):
-    """Main function to create the anti-playlist on Spotify."""
-    print("🚀 Starting Anti-Playlist Creation for Spotify")
+# --- Catalog Harvesting ---
+
+def catalog_keywords():
+    """
+    Every keyword generation can search: all GENRE_OPPOSITES entries,
+    WORLD_MUSIC_CATEGORIES and, once it is built, the genre space vocabulary.
+    """
+    keywords = dict.fromkeys(opposite for opposites in GENRE_OPPOSITES.values() for opposite in opposites)
+    keywords.update(dict.fromkeys(WORLD_MUSIC_CATEGORIES))
+    space = genre_space.get_genre_space()
+    if space is not None:
+        keywords.update(dict.fromkeys(space.genres))
+    return list(keywords)
+
+def _harvest_keyword(sp, genre_keyword, limit):
+    """Searches one genre keyword for the catalog harvester, uncached, and returns the slimmed tracks."""
+    results = _limiter.call('search', sp.search, q=genre_keyword, type='track', limit=limit)
+    return [_slim_track(track) for track in results['tracks']['items'] if track and track.get('id')]
+
+def harvest_catalog(sp, keywords=None, max_age=None, concurrency=None, limit=HARVEST_PAGE_SIZE):
+    """
+    Crawls the curated keywords into the candidate catalog, skipping keywords
+    harvested within max_age seconds (default catalog.HARVEST_REFRESH_SECONDS).
+    Returns (keywords harvested, keywords failed).
+    """
+    keywords = catalog_keywords() if keywords is None else list(keywords)
+    max_age = catalog.HARVEST_REFRESH_SECONDS if max_age is None else max_age
+    store = catalog.get_catalog()
+    fresh = {keyword for _, keyword in store.fresh_keywords('spotify', max_age)}
+    pending = [keyword for keyword in keywords if keyword not in fresh]
+    print(f"🌾 Harvesting {len(pending)} Spotify keywords ({len(keywords) - len(pending)} still fresh)...")
     
+    harvested = failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency or SPOTIFY_SEARCH_CONCURRENCY),
+                            thread_name_prefix="spotify-harvest") as executor:
+        futures = {executor.submit(_harvest_keyword, sp, keyword, limit): keyword for keyword in pending}
+        for future in as_completed(futures):
+            genre_keyword = futures[future]
+            try:
+                tracks = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"   ⚠ Couldn't search for '{genre_keyword}': {e}")
+                continue
+            store.store('spotify', genre_keyword, [
+                {'id': track['id'], 'title': track['name'], 'query': genre_keyword,
+                 'artist': track['artists'][0]['name'] if track['artists'] else None,
+                 'duration_seconds': track['duration_ms'] // 1000 if track.get('duration_ms') else None,
+                 'payload': track}
+                for track in tracks
+            ])
+            harvested += 1
+    print(f"   ✅ Harvested {harvested} keywords, {failed} failed.")
+    return harvested, failed
+
+# --- Generation Pipeline ---
+# profile -> candidates -> playlist write. Each stage takes the previous stage's
+# output, so a caller can run every stage exactly once and record exactly the
+# tracks that were written.
+
+def build_user_profile(sp, refresh=False):
+    """
+    Stage 1: fetches the user's identity and their top genres.
+    A stored profile younger than the profile TTL is reused unless refresh=True.
+    Raw Spotify genre counts are stored; mapping them is idempotent, so
+    profiles saved with mapped genres still load.
+    """
     if not sp:
         print("❌ Cannot proceed: Spotify client not authenticated.")
-        return
-
-    # Step 1: Analyze user's music taste
-    top_genres = analyze_user_genres(sp)
-    
-    # Step 2: Find contrasting tracks
-    # For a real implementation, you might want to fetch existing anti-playlist songs from Spotify
-    # if you track them there (similar to YTMusic service). For now, we skip that.
-    candidates = find_opposite_tracks(sp, top_genres, existing_tracks=set())
+        return None
     
-    if not candidates:
-        print("❌ Couldn't find any suitable contrasting tracks. Playlist not created.")
-        return
+    user_info = _limiter.call('default', sp.me)
+    if not user_info or 'id' not in user_info:
+        print("   ❌ Could not retrieve user ID from Spotify.")
+        return None
     
-    print(f"✅ Found {len(candidates)} contrasting tracks for your playlist.")
+    user_id = user_info['id']
     
-    # Step 3: Create playlist
-    now = datetime.datetime.now()
-    playlist_name = f"Anti-Playlist {now.strftime('%B %Y')}"
-    playlist_desc = (
-        f"A unique collection of music designed to contrast your usual listening tastes. "
-        f"Generated on {now.strftime('%Y-%m-%d')}."
-    )
+    stored = None if refresh else _load_stored_profile(user_id)
+    if database.is_profile_fresh(stored):
+        print("🎧 Using your saved music profile...")
+        return {'user_id': user_id, 'top_genres': map_genre_counts(stored['genres']), 'raw_genres': stored['genres']}
     
+    print("🎧 Analyzing your music preferences...")
+    raw_genres = fetch_raw_genres(sp)
+    if raw_genres:
+        try:
+            database.save_taste_profile(user_id, 'spotify', raw_genres)
+        except Exception as e:
+            print(f"   ⚠ Couldn't save your music profile: {e}")
+    return {'user_id': user_id, 'top_genres': map_genre_counts(raw_genres), 'raw_genres': raw_genres}
+
+def _load_stored_profile(user_id):
     try:
-        print("   🏗️ Creating new Spotify playlist...")
-        user_info = sp.me()
-        if not user_info or 'id' not in user_info:
-            print("   ❌ Could not retrieve user ID from Spotify.")
-            return
-        user_id = user_info['id']
+        return database.load_taste_profile(user_id, 'spotify')
+    except Exception as e:
+        print(f"   ⚠ Couldn't read your saved music profile: {e}")
+        return None
+
+def stream_profile_candidates(sp, profile, existing_tracks=None, seen_filter=None, report=None):
+    """
+    Stage 2, streaming: gathers up to MAX_SEARCH_CANDIDATES candidates as they
+    are found, each keyword contributing at most its fair share, then stops the
+    remaining searches and picks MAX_PLAYLIST_TRACKS of them at random, like
+    find_opposite_tracks. Progress is sent to report.
+    """
+    candidates = gather_candidates(
+        iter_opposite_tracks(sp, profile['top_genres'], existing_tracks, seen_filter=seen_filter,
+                             raw_genres=profile.get('raw_genres'), fair_share=True),
+        MAX_SEARCH_CANDIDATES, report
+    )
+    random.shuffle(candidates) # Arrival order favours the catalog and the fastest searches
+    return candidates[:MAX_PLAYLIST_TRACKS]
 
+def _playlist_ops(sp, user_id):
+    """Spotify callbacks for the playlist writer."""
+    def create(title, description):
         playlist = sp.user_playlist_create(
             user=user_id,
-            name=playlist_name,
+            name=title,
             public=True, # Can be set to False for private playlist
-            description=playlist_desc
+            description=description
         )
-        print(f"   ✓ Playlist created successfully: '{playlist['name']}' (ID: {playlist['id']})")
-        
-        # Add tracks to playlist in batches (Spotify max 100 tracks per call)
-        track_ids = [track['id'] for track in candidates]
-        batch_size = 100 # Spotify's limit
-        for i in tqdm(range(0, len(track_ids), batch_size), desc="   Adding tracks"):
-            batch = track_ids[i:i+batch_size]
-            sp.playlist_add_items(playlist['id'], batch)
-            time.sleep(0.5) # Small delay for rate limits
-        
-        print(f"\n🎉 SUCCESS! Created playlist: '{playlist_name}'")
-        print(f"  • Contains {len(track_ids)} contrasting tracks.")
-        
-        # Collect and display genres/keywords included for user info
-        genres_included = set(track['genre_keyword'] for track in candidates)
-        if genres_included:
-            print(f"  • Genres/Keywords explored: {', '.join(sorted(genres_included))}")
-        
-        print(f"  • View your new playlist here: {playlist['external_urls']['spotify']}")
-        
+        return playlist['id']
+    
+    def find(title, marker):
+        results = sp.current_user_playlists(limit=50)
+        while results:
+            for playlist in results['items']:
+                if (playlist and playlist.get('name') == title and marker in (playlist.get('description') or '')
+                        and (playlist.get('owner') or {}).get('id') == user_id):
+                    return playlist['id']
+            results = sp.next(results) if results.get('next') else None
+        return None
+    
+    def list_items(playlist_id):
+        track_ids = []
+        results = sp.playlist_items(playlist_id, fields='items(track(id)),next', limit=100)
+        while results:
+            track_ids.extend(item['track']['id'] for item in results['items'] if item.get('track'))
+            results = sp.next(results) if results.get('next') else None
+        return track_ids
+    
+    return playlist_writer.PlaylistOps(create, sp.playlist_add_items, find, list_items)
+
+def _run_playlist_write(sp, write, resuming=False):
+    """Executes a persisted playlist write and returns the result dict, or None on failure."""
+    try:
+        playlist_id = playlist_writer.execute_write(write, _playlist_ops(sp, write['user_id']), _limiter, resuming)
     except spotipy.SpotifyException as e:
         print(f"❌ Spotify API error creating playlist: {e}")
         print("Please check your Spotify API permissions and try again.")
+        return None
     except Exception as e:
         print(f"❌ An unexpected error occurred during playlist creation: {e}")
+        return None
+    
+    track_ids = write['track_ids']
+    playlist_url = f"https://open.spotify.com/playlist/{playlist_id}"
+    print(f"\n🎉 SUCCESS! Created playlist: '{write['title']}'")
+    print(f"  • Contains {len(track_ids)} contrasting tracks.")
+    
+    # Collect and display genres/keywords included for user info
+    genres_included = (write['meta'] or {}).get('genre_keywords')
+    if genres_included:
+        print(f"  • Genres/Keywords explored: {', '.join(genres_included)}")
+    print(f"  • View your new playlist here: {playlist_url}")
+    
+    return {
+        'playlist_id': playlist_id,
+        'name': write['title'],
+        'url': playlist_url,
+        'track_ids': track_ids,
+        'message': f"Created '{write['title']}' with {len(track_ids)} contrasting tracks: {playlist_url}"
+    }
+
+def write_anti_playlist(sp, profile, candidates):
+    """
+    Stage 3: persists the chosen tracks, then creates the playlist and adds them
+    through the resumable playlist writer, which also records them in history.
+    Returns a dict with the playlist details and the written track IDs, or None on failure.
+    """
+    if not candidates:
+        print("❌ Couldn't find any suitable contrasting tracks. Playlist not created.")
+        return None
+    
+    now = datetime.datetime.now()
+    playlist_name = f"Anti-Playlist {now.strftime('%B %Y')}"
+    playlist_desc = (
+        f"A unique collection of music designed to contrast your usual listening tastes. "
+        f"Generated on {now.strftime('%Y-%m-%d')}."
+    )
+    
+    write = playlist_writer.start_write(
+        'spotify', profile['user_id'], playlist_name, playlist_desc,
+        [track['id'] for track in candidates],
+        meta={'genre_keywords': sorted(set(track['genre_keyword'] for track in candidates))}
+    )
+    return _run_playlist_write(sp, write)
+
+def resume_anti_playlist(sp, profile):
+    """
+    Finishes the user's unfinished playlist from a failed earlier run, if any,
+    without searching again. Returns the result dict, None if the resume
+    failed, or False if there was nothing to resume.
+    """
+    write = playlist_writer.find_resumable_write('spotify', profile['user_id'])
+    if write is None:
+        return False
+    print(f"🔁 Resuming unfinished playlist '{write['title']}' ({write['written']}/{len(write['track_ids'])} tracks written)...")
+    return _run_playlist_write(sp, write, resuming=True)
+
+def create_anti_playlist(sp, profile=None, candidates=None, existing_tracks=None):
+    """
+    Main function to create the anti-playlist on Spotify.
+    Runs only the pipeline stages whose output was not passed in, and returns
+    the result of write_anti_playlist.
+    """
+    print("🚀 Starting Anti-Playlist Creation for Spotify")
+    
+    if not sp:
+        print("❌ Cannot proceed: Spotify client not authenticated.")
+        return None
+
+    # Step 1: Analyze user's music taste
+    if profile is None:
+        profile = build_user_profile(sp)
+        if profile is None:
+            return None
+    
+    # Step 2: Find contrasting tracks
+    if candidates is None:
+        candidates = stream_profile_candidates(sp, profile, existing_tracks)
+    
+    if candidates:
+        print(f"✅ Found {len(candidates)} contrasting tracks for your playlist.")
+    
+    # Step 3: Create playlist
+    return write_anti_playlist(sp, profile, candidates)
+
+def generate_anti_playlist(sp, report=None):
+    """
+    Runs the whole pipeline for a background job: profile, candidates, write
+    (which also records the written tracks in the user's history). If an
+    earlier run left a playlist half-written, it is finished instead.
+    report(stage, message) is called as each stage starts and finishes.
+    Returns the write_anti_playlist result; raises RuntimeError on failure.
+    """
+    report = report or (lambda stage, message: None)
+    
+    report('profile', "Analyzing your music preferences...")
+    with metrics.stage('spotify', 'profile'):
+        profile = build_user_profile(sp)
+    if not profile:
+        raise RuntimeError("Could not read your Spotify profile.")
+    
+    user_id = profile['user_id']
+    top_genres = profile['top_genres']
+    if top_genres:
+        report('profile', f"Found your top genres: {', '.join([g for g, _ in top_genres[:3]])}")
+    
+    with metrics.stage('spotify', 'write'):
+        result = resume_anti_playlist(sp, profile)
+    if result is not False:
+        if not result:
+            raise RuntimeError("Could not finish your unfinished Spotify playlist. Please try again.")
+        report('done', result['message'])
+        return result
+    
+    report('candidates', "Searching for music opposite to your taste...")
+    # Only the candidate IDs are checked against history, not the whole history
+    seen_filter = partial(database.find_known_songs, user_id, 'spotify')
+    with metrics.stage('spotify', 'candidates'):
+        candidates = stream_profile_candidates(sp, profile, seen_filter=seen_filter, report=report)
+    if not candidates:
+        raise RuntimeError("Could not find enough contrasting tracks.")
+    
+    report('write', f"Found {len(candidates)} unique contrasting tracks. Creating playlist...")
+    with metrics.stage('spotify', 'write'):
+        result = write_anti_playlist(sp, profile, candidates)
+    if not result:
+        raise RuntimeError("Could not create the playlist on Spotify.")
+    
+    report('done', result['message'])
+    return result
+
+def run_spotify_generation(token_info, client_id, client_secret, redirect_uri, scope, report=None, profile=None):
+    """
+    Job entry point: builds a client from the session's token and runs generate_anti_playlist.
+    profile=True records stage spans and a cProfile for this run (default: DEBUG / OTTER_PROFILE).
+    """
+    with profiling.profile_run('spotify', enabled=profile):
+        with metrics.stage('spotify', 'auth'):
+            sp = get_spotify_client_from_token(token_info, client_id, client_secret, redirect_uri, scope)
+        return generate_anti_playlist(sp, report=report)
 
 def main():
     print("🚀 Starting Anti-Playlist Creator for Spotify")
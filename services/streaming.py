@@ -0,0 +1,23 @@
+from contextlib import closing
+
+# --- Streaming Configuration ---
+PROGRESS_EVERY = 5 # Candidates between progress updates
+
+def gather_candidates(candidates, limit, report=None, every=PROGRESS_EVERY):
+    """
+    Consumes a candidate generator until it runs out or `limit` candidates
+    were found, sending the running count as report('progress', message).
+    The generator is closed on return, which stops its outstanding searches.
+    """
+    report = report or (lambda stage, message: None)
+    gathered = []
+    with closing(candidates):
+        for candidate in candidates:
+            gathered.append(candidate)
+            if len(gathered) >= limit:
+                print(f"   ⏩ Found {len(gathered)} candidates, stopping the remaining searches.")
+                break
+            if len(gathered) % every == 0:
+                print(f"   … {len(gathered)} candidates so far")
+                report('progress', f"Found {len(gathered)} tracks so far...")
+    return gathered
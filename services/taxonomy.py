@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+import marshal
+import threading
+from pathlib import Path
+from types import MappingProxyType
+
+from database import DATA_DIR
+
+# The taxonomy ships next to this module; its compiled form is cached next to the database
+TAXONOMY_PATH = Path(__file__).with_name('taxonomy.json')
+# marshal, not pickle: loading it never runs code, and it is only used when its key
+# matches a hash of the JSON it was compiled from
+CACHE_PATH = DATA_DIR / 'taxonomy.marshal'
+COMPILER_VERSION = 2 # Bump when compile_taxonomy's output changes, to invalidate caches
+
+def compile_taxonomy(data):
+    """
+    Compiles the raw taxonomy JSON into plain, deduplicated structures and
+    their reverse indexes. A term listed under several cultures belongs to
+    the first one; repeated terms and opposites are dropped, order is kept.
+    """
+    genre_opposites = {
+        genre: tuple(dict.fromkeys(opposites))
+        for genre, opposites in data['genre_opposites'].items()
+    }
+
+    term_culture = {}
+    culture_terms = {}
+    for culture, terms in data['cultures'].items():
+        kept = culture_terms.setdefault(culture, [])
+        for term in terms:
+            if term not in term_culture:
+                term_culture[term] = culture
+                kept.append(term)
+    cultures = tuple((culture, tuple(terms)) for culture, terms in culture_terms.items() if terms)
+
+    # Reverse indexes: opposite keyword -> the genres it opposes, and the same
+    # keyed by the opposite's first word (used to score free text)
+    opposite_genres = {}
+    token_genres = {}
+    for genre, opposites in genre_opposites.items():
+        for opposite in opposites:
+            opposite_genres.setdefault(opposite, set()).add(genre)
+            token_genres.setdefault(opposite.split()[0], set()).add(genre)
+
+    return {
+        'genres': tuple(genre_opposites),
+        'genre_opposites': genre_opposites,
+        'cultures': cultures,
+        'world_terms': tuple(term_culture),
+        'term_culture': term_culture,
+        'opposite_genres': {opposite: frozenset(genres) for opposite, genres in opposite_genres.items()},
+        'token_genres': {token: frozenset(genres) for token, genres in token_genres.items()},
+    }
+
+class Taxonomy:
+    """
+    Read-only view of a compiled taxonomy:
+      genres            genre keys, in priority order
+      genre_opposites   genre -> opposite search keywords
+      cultures          (culture, search terms) pairs
+      culture_terms     culture -> search terms
+      world_terms       every culture search term, once
+      term_culture      search term -> culture
+      opposite_genres   opposite keyword -> genres it opposes
+      token_genres      first word of an opposite keyword -> genres it opposes
+    """
+    def __init__(self, compiled):
+        self.genres = compiled['genres']
+        self.genre_opposites = MappingProxyType(compiled['genre_opposites'])
+        self.cultures = compiled['cultures']
+        self.culture_terms = MappingProxyType(dict(compiled['cultures']))
+        self.world_terms = compiled['world_terms']
+        self.term_culture = MappingProxyType(compiled['term_culture'])
+        self.opposite_genres = MappingProxyType(compiled['opposite_genres'])
+        self.token_genres = MappingProxyType(compiled['token_genres'])
+
+def _source_key(source):
+    """Identifies a taxonomy version by its content and the compiler version."""
+    return f"{COMPILER_VERSION}:{hashlib.sha256(source).hexdigest()}"
+
+def load_taxonomy(path=TAXONOMY_PATH, cache_path=CACHE_PATH):
+    """
+    Returns the compiled Taxonomy for path, from the binary cache when it
+    was compiled from the same JSON, otherwise compiling the JSON and
+    refreshing the cache.
+    """
+    with open(path, 'rb') as f:
+        source = f.read()
+    key = _source_key(source)
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = marshal.load(f)
+        if isinstance(cached, tuple) and len(cached) == 2 and cached[0] == key and isinstance(cached[1], dict):
+            return Taxonomy(cached[1])
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"   ⚠ Ignoring unreadable taxonomy cache: {e}")
+
+    compiled = compile_taxonomy(json.loads(source))
+    try:
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((key, compiled), f)
+        os.replace(tmp_path, cache_path) # Concurrent loaders never see a partial cache
+    except OSError as e:
+        print(f"   ⚠ Couldn't write taxonomy cache: {e}")
+    return Taxonomy(compiled)
+
+_taxonomy = None
+_taxonomy_lock = threading.Lock()
+
+def get_taxonomy():
+    """Returns the process-wide Taxonomy, loaded once."""
+    global _taxonomy
+    with _taxonomy_lock:
+        if _taxonomy is None:
+            _taxonomy = load_taxonomy()
+        return _taxonomy
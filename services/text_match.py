@@ -0,0 +1,53 @@
+import re
+
+def _trie_pattern(keywords):
+    """
+    Builds a regex that matches any of the keywords, factored as a prefix trie
+    so the engine tests each character once instead of trying every keyword.
+    Longer keywords are preferred over their own prefixes.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A keyword ends here but longer ones continue: make the continuation optional (greedy)
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+class KeywordMatcher:
+    """
+    Finds which of a fixed set of keywords occur as substrings of a text,
+    in a single regex pass. Equivalent to {k for k in keywords if k in text}.
+    """
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(k for k in keywords if k))
+        # A zero-width lookahead reports the longest keyword at every start position,
+        # including overlapping ones ('remix' and 'mix').
+        self._pattern = re.compile('(?=(' + _trie_pattern(self.keywords) + '))') if self.keywords else None
+        # Keywords that are prefixes of the longest match at a position also occur there
+        self._implied = {
+            keyword: frozenset(other for other in self.keywords if keyword.startswith(other))
+            for keyword in self.keywords
+        }
+
+    def find(self, text):
+        """Returns the set of keywords occurring in text."""
+        found = set()
+        if self._pattern is None or not text:
+            return found
+        for match in self._pattern.finditer(text):
+            found |= self._implied[match.group(1)]
+        return found
+
+    def contains_any(self, text):
+        """True if any keyword occurs in text."""
+        return bool(text) and self._pattern is not None and self._pattern.search(text) is not None
@@ -4,216 +4,59 @@ import datetime
 import pickle
 import random
 import time
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from ytmusicapi import YTMusic
+from ytmusicapi import YTMusic, OAuthCredentials
+
+import database
+from services.rate_limiter import get_rate_limiter
+from services.search_cache import get_search_cache
+from services.text_match import KeywordMatcher
+from services import metrics, profiling
+from services.client_registry import get_client_registry, registry_key
+from services import playlist_writer
+from services import catalog
+from services.taxonomy import get_taxonomy
+from services.streaming import gather_candidates
 
 # --- Configuration Paths ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TOKEN_FILE = os.path.join(BASE_DIR, 'token.pickle')
 CLIENT_SECRETS_FILE = os.path.join(BASE_DIR, 'client_secret.json') # Ensure this file exists in the same directory
 SCOPES = ['https://www.googleapis.com/auth/youtube'] # Scope for YouTube Data API, used for ytmusicapi authentication
-HISTORY_FILE = os.path.join(BASE_DIR, 'anti_playlist_history.json')
-
-# --- Genre Opposition Mapping ---
-# This is a large, curated list as provided in your prompt.
-GENRE_OPPOSITES = {
-    'pop': [
-        'classical symphony', 'gregorian chant', 'gamelan', 'throat singing', 'ambient',
-        'death metal', 'noise music', 'tuvan overtone', 'balinese kecak', 'tibetan ritual',
-        'inuit katajjaq', 'baroque fugue', 'renaissance madrigal', 'medieval chant'
-    ],
-    'rock': [
-        'bossa nova', 'qawwali', 'fado', 'kora music', 'tabla solo', 'enka', 'free jazz',
-        'african mbira', 'persian santur', 'andean pan flute', 'drone ambient', 'lowercase music',
-        'silence composition'
-    ],
-    'hip hop': [
-        'bluegrass', 'opera aria', 'celtic harp', 'flamenco', 'sitar', 'opera', 'celtic folk',
-        'gregorian chant', 'georgian polyphony', 'arabic maqam', 'hindustani dhrupad',
-        'unaccompanied kora', 'solo shakuhachi', 'handpan meditation'
-    ],
-    'electronic': [
-        'acoustic folk', 'chamber music', 'handpan', 'didgeridoo', 'erhu', 'sitar raga', 'flamenco',
-        'field recordings', 'natural soundscapes', 'forest ambiance', 'bone flute', 'lithophone',
-        'prehistoric music'
-    ],
-    'indie': [
-        'traditional japanese', 'african drums', 'mongolian music', 'oud music', 'steel drum',
-        'bollywood', 'mariachi', 'afrobeat', 'j-pop', 'cumbia', 'berber ahwash', 'sami joik',
-        'australian didgeridoo', 'circuit bending', 'broken music', 'power electronics'
-    ],
-    'jazz': [
-        'techno', 'drum and bass', 'minimal synth', 'noise rock', 'eurodance',
-        'algorithmic music', 'trap', 'EDM festival mix', 'computer-generated music'
-    ],
-    'classical': [
-        'punk rock', 'gabber', 'breakcore', 'glitch hop', 'lo-fi phonk',
-        'auto-tuned rap', 'chiptune', 'footwork', 'trap metal'
-    ],
-    'metal': [
-        'binaural beats', 'lo-fi chillhop', 'nature sounds', 'harp concerto', 'soft jazz trio',
-        'meditative ambient', 'bossa nova', 'seashore field recordings'
-    ],
-    'reggae': [
-        'industrial noise', 'black metal', 'military march', 'hard techno', 'cold wave',
-        'atonal serialism', 'cybergrind', 'marching band'
-    ],
-    'folk': [
-        'synthwave', 'future bass', 'dubstep', 'trance', 'eurobeat',
-        'hyperpop', 'trap soul', 'auto-tuned mumble rap'
-    ],
-    'blues': [
-        'psytrance', 'ambient glitch', 'vaporwave', 'hardstyle EDM', 'deep house',
-        'sound collage', 'electro swing remix'
-    ],
-    'country': [
-        'k-pop', 'electro house', 'glitchcore', 'drill rap', 'nightcore',
-        'vaportrap', 'future funk', 'russian rave'
-    ],
-    'techno': [
-        'string quartet', 'acoustic flamenco', 'gospel choir', 'carnatic vocal',
-        'baroque ensemble', 'folkloric lullaby', 'woodland flute trio'
-    ],
-    'lo-fi': [
-        'marching band', 'symphonic metal', 'big band swing', 'post-hardcore', 'grindcore',
-        'math rock', 'melodic death metal'
-    ]
-}
-
-# --- Curated Authentic Music Searches ---
-# This is the full, extensive list from your prompt.
-AUTHENTIC_MUSIC_SEARCHES = [
-    # Asian
-    ('japanese', ['j-pop', 'japanese music', 'anime songs', 'japanese rock', 'city pop', 'enka', 'shakuhachi', 'koto pop']),
-    ('korean', ['k-pop', 'korean ballad', 'korean rock', 'korean ost', 'trot', 'pansori', 'k-hiphop']),
-    ('chinese', ['c-pop', 'mandarin songs', 'chinese ballad', 'cantopop', 'chinese rock', 'guqin', 'erhu fusion']),
-    ('indian', ['bollywood', 'punjabi music', 'tamil songs', 'hindi songs', 'indian classical', 'dhrupad', 'sitar']),
-    ('thai', ['thai pop', 'thai rock', 'luk thung', 'thai ost', 'piphat', 'mor lam']),
-    ('vietnamese', ['vpop', 'vietnamese ballad', 'vietnamese rock', 'dan tranh', 'ca trù']),
-
-    # Central & South Asian
-    ('pakistani', ['qawwali', 'pakistani pop', 'coke studio', 'sufi rock']),
-    ('afghan', ['afghan traditional', 'rubab music', 'afghan pop']),
-    ('kazakh', ['dombra music', 'kazakh folk', 'modern kazakh pop']),
-
-    # Middle Eastern & Central Asian
-    ('arabic', ['arabic music', 'arabic pop', 'lebanese music', 'egyptian music', 'oud taqsim']),
-    ('persian', ['persian music', 'iranian pop', 'persian classical', 'santur']),
-    ('turkish', ['turkish pop', 'turkish rock', 'arabesque', 'turkish folk', 'ney']),
-    ('hebrew', ['israeli music', 'hebrew songs', 'mizrahi music', 'klezmer']),
-
-    # African
-    ('nigerian', ['afrobeats', 'nigerian music', 'nollywood songs', 'highlife', 'juju']),
-    ('ghanaian', ['azonto', 'highlife', 'ghana gospel']),
-    ('south african', ['south african music', 'amapiano', 'kwaito', 'afrikaans music', 'mbube']),
-    ('ethiopian', ['ethiopian music', 'ethiopian jazz', 'traditional ethiopian', 'krar']),
-    ('kenyan', ['kenyan music', 'benga', 'kenyan pop', 'nyatiti']),
-    ('north african', ['rai', 'chaabi', 'gnawa']),
-
-    # European
-    ('french', ['french music', 'chanson', 'french pop', 'french rock', 'musique concrète']),
-    ('german', ['german music', 'deutschpop', 'neue deutsche welle', 'schlager', 'krautrock']),
-    ('italian', ['italian music', 'italian pop', 'neapolitan songs', 'opera']),
-    ('spanish', ['spanish music', 'spanish pop', 'flamenco', 'spanish rock', 'sephardic']),
-    ('russian', ['russian music', 'russian pop', 'russian rock', 'chanson', 'balalaika']),
-    ('portuguese', ['portuguese music', 'fado', 'portuguese pop', 'cante alentejano']),
-    ('nordic', ['swedish music', 'norwegian music', 'danish music', 'finnish music', 'kulning']),
-    ('balkan', ['balkan brass', 'gypsy music', 'sevdah', 'turbo folk']),
-    ('greek', ['laïko', 'rembetiko', 'greek folk', 'bouzouki']),
-
-    # Latin American
-    ('mexican', ['mexican music', 'mariachi', 'ranchera', 'mexican rock', 'son jarocho']),
-    ('brazilian', ['brazilian music', 'bossa nova', 'samba', 'mpb', 'forró']),
-    ('argentinian', ['tango', 'argentinian music', 'rock nacional', 'chacarera']),
-    ('colombian', ['vallenato', 'cumbia', 'colombian music', 'champeta', 'bambuco']),
-    ('peruvian', ['huayno', 'criolla', 'afro-peruvian']),
-    ('reggaeton', ['reggaeton', 'latin trap', 'dembow', 'perreo', 'plena']),
-
-    # Indigenous & Traditional
-    ('tuvan', ['throat singing', 'tuvan folk', 'igil music']),
-    ('mongolian', ['long song', 'morin khuur', 'overtone singing']),
-    ('native american', ['powwow', 'navajo chant', 'iroquois social dance']),
-    ('aboriginal', ['didgeridoo', 'clapsticks', 'dreamtime music']),
-    ('inuït', ['katajjaq', 'throat singing inuit', 'drum dance']),
-    ('sami', ['joik', 'northern sami music']),
-
-    # Oceanian & Polynesian
-    ('australian', ['didgeridoo music', 'aboriginal music']),
-    ('polynesian', ['ukulele instrumental', 'steel guitar hawaii', 'hula music']),
-    ('new zealand', ['maori music', 'taonga pūoro', 'waiata']) ,
-
-    # Experimental & Obscure
-    ('microtonal', ['xenharmonic', 'just intonation', '72-EDO']),
-    ('noise', ['harsh noise wall', 'power electronics', 'merzbow']),
-    ('avant-garde', ['aleatoric music', 'spectralism', 'fluxus']),
-    ('ambient', ['dark ambient', 'space music', 'drone ambient']),
-    ('electroacoustic', ['acousmatic', 'sound collage', 'musique concrète']),
-    ('georgian', ['georgian polyphony', 'traditional georgian music', 'panduri songs']),
-    ('armenian', ['duduk music', 'armenian folk', 'ashugh songs']),
-    ('azerbaijani', ['mugham', 'azerbaijani pop', 'tar music']),
-    ('uzbek', ['shashmaqam', 'dutar music', 'uzbek traditional']),
-    ('kyrgyz', ['komuz music', 'epic poetry songs', 'kyrgyz folk']),
-    ('tajik', ['tajik pop', 'rubab music', 'traditional tajik music']),
-
-    # Southeast Asia Expanded
-    ('burmese', ['saung music', 'burmese classical', 'pat waing']),
-    ('lao', ['mor lam lao', 'laotian traditional music']),
-    ('cambodian', ['pinpeat', 'cambodian rock', 'khmer traditional music']),
-
-    # Pacific Islands & Melanesia
-    ('fijian', ['meke music', 'fijian choral']),
-    ('papua new guinea', ['garamut drum', 'sing-sing music']),
-    ('samoan', ['samoan slap dance', 'polynesian harmonies']),
-
-    # Native and Ethnic Minorities
-    ('basque', ['trikitixa', 'basque folk music']),
-    ('sami', ['joik', 'laplandic chants']),
-    ('romani', ['gypsy jazz', 'romani violin']),
-    ('tatars', ['tatar folk music', 'kubyz', 'tatar throat singing']),
-
-    # North American Diversity
-    ('canadian', ['canadian indie', 'first nations chants', 'québécois folk']),
-    ('alaskan', ['inuit drum dance', 'yupik chants']),
-    ('haitian', ['haitian compas', 'rara music', 'vodou drumming']),
-    ('dominican', ['bachata', 'merengue', 'dominican dembow']),
-    ('cuban', ['son cubano', 'rumba', 'cuban trova']),
-    ('puerto rican', ['bomba y plena', 'reggaeton', 'jíbaro music']),
-
-    # South America Continued
-    ('bolivian', ['charango music', 'andino folk', 'bolivian morenada']),
-    ('chilean', ['nueva canción', 'cueca', 'mapuche music']),
-    ('paraguayan', ['arpa paraguaya', 'polca paraguaya']),
-    ('venezuelan', ['joropo', 'cuatro music', 'gaita zuliana']),
-    ('uruguayan', ['candombe', 'murga', 'tango uruguayo']),
-
-    # African Expansion
-    ('malian', ['kora music', 'ngoni', 'griot storytelling']),
-    ('senegalese', ['sabar drums', 'mbalax']),
-    ('ivorian', ['coupé-décalé', 'zoblazo']),
-    ('congolese', ['soukous', 'ndombolo', 'rumba congolese']),
-    ('zimbabwean', ['mbira dzavadzimu', 'chimurenga music']),
-    ('madagascan', ['valiha music', 'salegy']),
-
-    # Middle East & North Africa Add-ons
-    ('moroccan', ['gnawa', 'chaabi marocain', 'andalusi music']),
-    ('algerian', ['rai', 'kabyle music', 'malouf']),
-    ('syrian', ['muwashshah', 'syrian oud music']),
-    ('iraqi', ['maqam al-iraqi', 'joza music']),
-
-    # Rare & Archaic
-    ('sardinian', ['tenores di bitti', 'cantu a tenore']),
-    ('corsican', ['polyphonic corsican chant', 'paghjella']),
-    ('tibetan', ['singing bowls', 'tibetan horn', 'chanting monks']),
-    ('yakut', ['khomus music', 'yakutian throat singing']),
-
-    # Fusion/Modern Folk Hybrid
-    ('global fusion', ['ethno jazz', 'worldbeat', 'balkan fusion']),
-    ('electro folk', ['folktronica', 'synth-folk', 'digital cumbia']),
-    ('tribal house', ['afro house', 'deep tribal beats', 'ancestral rhythms'])
-]
+HISTORY_FILE = os.path.join(BASE_DIR, 'anti_playlist_history.json') # Legacy store, imported into SQLite on first use
+DEFAULT_HISTORY_USER = 'default' # History key when the account can't be identified (matches the old global file)
+
+# --- Search Configuration ---
+# Number of cultures searched in parallel by iter_authentic_music.
+YOUTUBE_SEARCH_CONCURRENCY = int(os.environ.get('YOUTUBE_SEARCH_CONCURRENCY', '6'))
+MAX_CANDIDATES_PER_CULTURE = 2 # Max good candidates kept per culture
+MAX_SEARCH_CULTURES = 15 # Cultures drawn for a single run
+# Candidates gathered before the final selection: everything the drawn cultures can yield
+MAX_SEARCH_CANDIDATES = MAX_SEARCH_CULTURES * MAX_CANDIDATES_PER_CULTURE
+MAX_PLAYLIST_TRACKS = 25 # Target playlist size
+PLAYLIST_FETCH_CONCURRENCY = int(os.environ.get('YOUTUBE_PLAYLIST_FETCH_CONCURRENCY', '4'))
+HISTORY_WINDOW = 200 # Most recent history items the taste profile is computed over
+SEARCH_TERMS_PER_CULTURE = 2 # Search terms tried per culture in a live search
+MIN_DURATION_SECONDS = 60 # Tracks of known duration at or below this are skipped
+HARVEST_PAGE_SIZE = 40 # Results the catalog harvester keeps per query
+CATALOG_SAMPLE_PER_CULTURE = 20 # Catalog rows drawn per culture before history filtering
+
+# Every YouTube Music API call goes through the process-wide limiter
+_limiter = get_rate_limiter('youtube')
+# Search responses are shared across users through the search cache
+_search_cache = get_search_cache()
+
+# --- Taxonomy ---
+# Genre opposites and culture search terms are shared with spotify_service (services/taxonomy.json)
+_taxonomy = get_taxonomy()
+GENRE_OPPOSITES = _taxonomy.genre_opposites
+AUTHENTIC_MUSIC_SEARCHES = _taxonomy.cultures
 
 # Keywords to filter OUT (dance videos, covers, etc.)
 EXCLUDE_KEYWORDS = [
@@ -222,16 +65,13 @@ EXCLUDE_KEYWORDS = [
     'tiktok', 'instagram', 'reels', 'shorts', 'challenge', 'trending', 'study', 'long', 'hour', 'cleansing', 'relaxation', 'studying',
     'dj', 'mix', 'compilation', 'playlist', 'karaoke', 'instrumental version', 'mindfulness', 'meditation',
     'how to', 'learn', 'step by step', 'easy', 'beginner', 'class', 'ambience', 'relaxing','cafe',
-    'performance', 'stage', 'live concert', 'festival', 'competition', 'remix', 'ai cover', 'fan edit', 'karaoke', 'sped up', 'slowed', 'fake', 'deepfake', 'bootleg', 'nightcore', 'parody', 'tiktok'
+    'performance', 'stage', 'live concert', 'festival', 'competition', 'ai cover', 'fan edit', 'sped up', 'slowed', 'fake', 'deepfake', 'bootleg', 'nightcore', 'parody'
 ]
 
 # Keywords to PREFER (actual music)
 PREFER_KEYWORDS = [
-    'official', 'original', 'authentic', 'traditional', 'classical',
-    'instrumental', 'solo', 'ensemble', 'orchestra', 'chamber',
-    'album', 'studio', 'recorded', 'composition', 'piece', 'artiste'
     'official', 'original', 'authentic', 'traditional', 'ancestral', 'heritage',
-    'classical', 'composition', 'opus', 'raga', 'maqam', 'suite', 'sonata', 'fugue', 'cantata',
+    'classical', 'composition', 'piece', 'opus', 'raga', 'maqam', 'suite', 'sonata', 'fugue', 'cantata',
     'instrumental', 'solo', 'duet', 'ensemble', 'quartet', 'orchestra', 'symphony',
     'chamber', 'recital', 'live performance', 'concert',
     'album', 'studio', 'recorded', 'mastered', 'released', 'production', 'label', 'EP', 'LP',
@@ -240,6 +80,16 @@ PREFER_KEYWORDS = [
     'museum recording', 'cultural preservation', 'academic', 'intangible heritage'
 ]
 
+# Additional general music indicators (checked against the title only)
+MUSIC_INDICATORS = ['official', 'original', 'instrumental', 'classical', 'traditional', 'music video', 'audio', 'track', 'song']
+
+# Compiled once at import; each classifies a string in a single pass.
+# Keywords are matched as written against lowercased text, so mixed-case
+# entries such as 'EP' and 'LP' never match (as before).
+_EXCLUDE_MATCHER = KeywordMatcher(EXCLUDE_KEYWORDS)
+_PREFER_MATCHER = KeywordMatcher(PREFER_KEYWORDS)
+_INDICATOR_MATCHER = KeywordMatcher(MUSIC_INDICATORS)
+
 def get_authenticated_service():
     """Authenticates with YouTube Music via OAuth 2.0 flow."""
     print("🔐 Step 1/6: Authenticating with YouTube Music...")
@@ -289,14 +139,14 @@ def get_authenticated_service():
     print("   🎵 Initializing YouTube Music API...")
     try:
         # ytmusicapi can be initialized with the token from google_auth_oauthlib
-        ytmusic = YTMusic(authorization=credentials.token)
+        ytmusic = metrics.instrument(YTMusic(**_oauth_kwargs(credentials)), 'youtube')
         print("   ✅ Authentication successful!")
         return ytmusic
     except Exception as e:
         print(f"   ❌ Failed to initialize YTMusic API with OAuth token: {e}")
         print("   🔄 Trying cookie-based authentication (requires headers_auth.json from ytmusicapi setup)...")
         try:
-            ytmusic = YTMusic() # This will look for headers_auth.json or use a guest session
+            ytmusic = metrics.instrument(YTMusic(), 'youtube') # This will look for headers_auth.json or use a guest session
             print("   ✅ Fallback cookie-based authentication successful!")
             return ytmusic
         except Exception as e_fallback:
@@ -304,132 +154,343 @@ def get_authenticated_service():
             print("   Please ensure you have configured ytmusicapi or your client_secret.json is valid.")
             return None
 
-def load_history():
-    """Loads previously saved anti-playlist songs from a JSON file."""
-    print("📚 Step 2/6: Loading previous anti-playlist history...")
-    if os.path.exists(HISTORY_FILE):
+def _oauth_kwargs(credentials, session=None):
+    """YTMusic keyword arguments for google-auth credentials: the OAuth token dict plus the client that refreshes it."""
+    expires_at = 0
+    if credentials.expiry:
+        # google-auth keeps the expiry as a naive UTC datetime
+        expires_at = int(credentials.expiry.replace(tzinfo=datetime.timezone.utc).timestamp())
+    token = {
+        'access_token': credentials.token,
+        'refresh_token': credentials.refresh_token or '',
+        'token_type': 'Bearer',
+        'scope': ' '.join(credentials.scopes or SCOPES),
+        'expires_at': expires_at,
+        'expires_in': max(0, expires_at - int(time.time())),
+    }
+    client = OAuthCredentials(credentials.client_id, credentials.client_secret, session=session)
+    return {'auth': token, 'oauth_credentials': client}
+
+def get_youtube_user_id(ytmusic):
+    """Returns a stable identifier for the signed-in account, used to key history."""
+    try:
+        account = _limiter.call('default', ytmusic.get_account_info)
+        user_id = account.get('channelHandle') or account.get('accountName')
+        if user_id:
+            return user_id
+    except Exception as e:
+        print(f"   ⚠ Couldn't read account info ({e}); using the shared history.")
+    return DEFAULT_HISTORY_USER
+
+def _iter_json_array(f, chunk_size=64 * 1024):
+    """Yields the items of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("History file does not contain a JSON array")
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
         try:
-            with open(HISTORY_FILE, "r") as f:
-                history = set(json.load(f))
-            print(f"   ✓ Loaded {len(history)} songs from history file.")
-            return history
+            item, end = decoder.raw_decode(buffer)
         except json.JSONDecodeError:
-            print("   ⚠ Corrupted history file - starting fresh.")
-            return set()
-        except Exception as e:
-            print(f"   ❌ Error loading history file: {e} - starting fresh.")
-            return set()
-    else:
-        print("   ℹ No history file found - starting fresh.")
-        return set()
+            if eof:
+                raise
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        if end == len(buffer) and not eof:
+            # The item may continue in the next chunk (e.g. a number split in two)
+            chunk = f.read(chunk_size)
+            if chunk:
+                buffer += chunk
+                continue
+            eof = True
+        yield item
+        buffer = buffer[end:]
+
+def import_json_history(path=HISTORY_FILE, batch_size=500):
+    """
+    One-shot import of a legacy anti_playlist_history.json into the SQLite history store.
+    The file was shared by every account, so it is imported under
+    DEFAULT_HISTORY_USER, which every account's history falls back to.
+    The file is streamed in batches and renamed to *.imported once it has been copied.
+    Returns the number of song IDs imported.
+    """
+    user_id = DEFAULT_HISTORY_USER
+    if not os.path.exists(path):
+        return 0
+    
+    imported = 0
+    batch = []
+    try:
+        with open(path, "r") as f:
+            for song_id in _iter_json_array(f):
+                if isinstance(song_id, str):
+                    batch.append(song_id)
+                if len(batch) >= batch_size:
+                    database.save_history(user_id, 'youtube', batch)
+                    imported += len(batch)
+                    batch = []
+        if batch:
+            database.save_history(user_id, 'youtube', batch)
+            imported += len(batch)
+    except (ValueError, OSError) as e:
+        print(f"   ⚠ Could not fully import history file ({e}); imported {imported} songs.")
+        return imported
+    
+    os.replace(path, path + '.imported')
+    print(f"   ✓ Imported {imported} songs from legacy history file.")
+    return imported
+
+def _history_users(user_id):
+    """History keys consulted for an account: its own, then the shared legacy history."""
+    return (user_id,) if user_id == DEFAULT_HISTORY_USER else (user_id, DEFAULT_HISTORY_USER)
+
+def _find_known_songs(user_id, video_ids):
+    """The video IDs already in the account's history or the shared legacy history."""
+    known = set()
+    for history_user in _history_users(user_id):
+        remaining = [video_id for video_id in video_ids if video_id not in known]
+        if remaining:
+            known |= database.find_known_songs(history_user, 'youtube', remaining)
+    return known
+
+def load_history(user_id=DEFAULT_HISTORY_USER):
+    """
+    Loads previously saved anti-playlist songs from the SQLite history store.
+    Prefer history_filter() in generation code: it avoids loading the whole history.
+    """
+    print("📚 Step 2/6: Loading previous anti-playlist history...")
+    import_json_history()
+    history = set()
+    for history_user in _history_users(user_id):
+        history |= database.load_history(history_user, 'youtube')
+    print(f"   ✓ Loaded {len(history)} songs from history.")
+    return history
+
+def history_filter(user_id=DEFAULT_HISTORY_USER):
+    """
+    Prepares the user's history for candidate filtering and returns a callable
+    that maps a list of video IDs to the ones already in history.
+    """
+    print("📚 Step 2/6: Loading previous anti-playlist history...")
+    import_json_history()
+    return partial(_find_known_songs, user_id)
 
-def save_history(song_ids):
-    """Saves a set of song IDs to the history JSON file."""
+def save_history(song_ids, user_id=DEFAULT_HISTORY_USER):
+    """Appends newly added song IDs to the user's history (existing rows are untouched)."""
     try:
         print(f"   💾 Saving {len(song_ids)} songs to history...")
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(list(song_ids), f, indent=4)
+        database.save_history(user_id, 'youtube', list(song_ids))
         print("   ✓ History saved successfully.")
     except Exception as e:
         print(f"   ❌ Error saving history: {e}.")
 
+def _playlist_fingerprint(playlist):
+    """
+    Identifies a library playlist's current state from its listing entry.
+    Returns None if the listing carries no track count (always refetch then).
+    """
+    count = playlist.get('count')
+    if count in (None, ''):
+        return None
+    return f"{count}|{playlist.get('title', '')}"
+
+def _fetch_playlist_video_ids(ytmusic, playlist_id):
+    """Downloads a playlist and returns its video IDs in order."""
+    playlist_details = _limiter.call('library', ytmusic.get_playlist, playlist_id)
+    return [track['videoId'] for track in playlist_details.get('tracks') or [] if track.get('videoId')]
+
 def get_existing_anti_playlist_songs(ytmusic):
-    """Scans user's existing playlists for 'anti playlist' and collects song IDs."""
+    """
+    Scans user's existing playlists for 'anti playlist' and collects song IDs.
+    Unchanged playlists are read from the local snapshot store; new or changed
+    ones are fetched concurrently and their snapshots refreshed.
+    """
     print("📋 Step 3/6: Scanning existing anti-playlists...")
     existing_anti_songs = set()
-    anti_playlist_count = 0
     
     if not ytmusic:
         print("   ❌ YTMusic client not initialized. Skipping playlist scan.")
         return existing_anti_songs
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            print("   🔍 Fetching playlist library...")
-            playlists = ytmusic.get_library_playlists()
-            break
-        except Exception as e:
-            print(f"   ⚠ Attempt {attempt + 1} failed to fetch playlists: {e}")
-            if attempt < max_retries - 1:
-                print(f"   🔄 Retrying in {(attempt + 1) * 2} seconds...")
-                time.sleep((attempt + 1) * 2)
-            else:
-                print(f"   ❌ All attempts failed. Could not fetch playlists.")
-                return existing_anti_songs
-    else: # If loop completes without break
-        print("   ❌ Failed to fetch playlists after multiple attempts.")
+    try:
+        print("   🔍 Fetching playlist library...")
+        # The limiter retries throttled and transient failures with backoff
+        playlists = _limiter.call('library', ytmusic.get_library_playlists)
+    except Exception as e:
+        print(f"   ❌ All attempts failed. Could not fetch playlists: {e}")
         return existing_anti_songs
         
-    if playlists:
-        for pl in tqdm(playlists, desc="   Scanning playlists", leave=False):
-            if 'title' in pl and 'anti playlist' in pl['title'].lower():
-                anti_playlist_count += 1
+    anti_playlists = [
+        pl for pl in playlists or []
+        if pl.get('playlistId') and 'anti playlist' in (pl.get('title') or '').lower()
+    ]
+    anti_playlist_count = len(anti_playlists)
+    
+    # Serve playlists whose track count and title are unchanged from the local snapshot store
+    try:
+        snapshots = database.load_playlist_snapshots(pl['playlistId'] for pl in anti_playlists)
+    except Exception as e:
+        print(f"   ⚠ Couldn't read playlist snapshots: {e}")
+        snapshots = {}
+    
+    to_fetch = []
+    for pl in anti_playlists:
+        fingerprint = _playlist_fingerprint(pl)
+        snapshot = snapshots.get(pl['playlistId'])
+        if fingerprint and snapshot and snapshot[0] == fingerprint:
+            existing_anti_songs.update(snapshot[1])
+        else:
+            to_fetch.append((pl, fingerprint))
+    
+    # Fetch new or changed playlists concurrently
+    fetched_snapshots = []
+    if to_fetch:
+        with ThreadPoolExecutor(max_workers=PLAYLIST_FETCH_CONCURRENCY, thread_name_prefix="ytmusic-playlist") as executor:
+            futures = {executor.submit(_fetch_playlist_video_ids, ytmusic, pl['playlistId']): (pl, fingerprint)
+                       for pl, fingerprint in to_fetch}
+            for future in as_completed(futures):
+                pl, fingerprint = futures[future]
                 try:
-                    playlist_details = ytmusic.get_playlist(pl['playlistId'])
-                    if 'tracks' in playlist_details and playlist_details['tracks']:
-                        for track in playlist_details['tracks']:
-                            video_id = track.get('videoId')
-                            if video_id:
-                                existing_anti_songs.add(video_id)
+                    video_ids = future.result()
                 except Exception as e:
                     print(f"   ⚠ Error processing playlist '{pl.get('title', 'Unknown')}' ({pl.get('playlistId', 'Unknown')}): {e}")
                     continue
-                    
-    print(f"   🎯 Found {anti_playlist_count} anti-playlists with {len(existing_anti_songs)} unique songs.")
+                existing_anti_songs.update(video_ids)
+                if fingerprint:
+                    fetched_snapshots.append((pl['playlistId'], fingerprint, video_ids))
+    
+    if fetched_snapshots:
+        try:
+            database.save_playlist_snapshots(fetched_snapshots)
+        except Exception as e:
+            print(f"   ⚠ Couldn't save playlist snapshots: {e}")
+    
+    print(f"   🎯 Found {anti_playlist_count} anti-playlists with {len(existing_anti_songs)} unique songs "
+          f"({anti_playlist_count - len(to_fetch)} served from snapshots).")
     return existing_anti_songs
 
-def analyze_recent_genres(ytmusic):
-    """Analyzes recent listening history to identify user's preferred genres."""
+# --- Genre Scoring Indexes ---
+# Built once at import so analyze_recent_genres scans each text field once
+# instead of testing every genre and every opposite against it.
+_GENRE_RANK = {genre: rank for rank, genre in enumerate(GENRE_OPPOSITES)}
+_GENRE_MATCHER = KeywordMatcher(GENRE_OPPOSITES)
+# First word of each opposite -> genres that list it (a very rough 'opposite' heuristic)
+_OPPOSITE_TOKEN_GENRES = _taxonomy.token_genres
+_OPPOSITE_TOKEN_MATCHER = KeywordMatcher(_OPPOSITE_TOKEN_GENRES)
+
+def _track_text_fields(track):
+    """Returns the lowercased title, album and first artist of a history track."""
+    track_title = (track.get('title') or '').lower()
+    # Handle album which can be a dict or a string
+    track_album = track.get('album', {})
+    if isinstance(track_album, dict) and track_album.get('name'):
+        track_album = track_album['name'].lower()
+    elif isinstance(track_album, str):
+        track_album = track_album.lower()
+    else:
+        track_album = ''
+    
+    artists = track.get('artists', [])
+    track_artist = (artists[0].get('name') or '').lower() if artists and isinstance(artists, list) and artists[0] else ''
+    
+    return [track_title, track_album, track_artist]
+
+def score_genres(tracks):
+    """
+    Scores a batch of history tracks against every genre in one pass.
+    A direct genre match in a field scores 3; otherwise a genre scores 1 if the
+    first word of one of its opposites appears in that field.
+    Returns (genre, score) pairs sorted by descending score.
+    """
+    genre_counter = defaultdict(int)
+    for track in tracks:
+        for text in _track_text_fields(track):
+            if not text:
+                continue
+            direct = _GENRE_MATCHER.find(text)
+            related = set(direct)
+            for token in _OPPOSITE_TOKEN_MATCHER.find(text):
+                related |= _OPPOSITE_TOKEN_GENRES[token]
+            # Visit genres in taxonomy order so ties sort as they always have
+            for genre in sorted(related, key=_GENRE_RANK.__getitem__):
+                genre_counter[genre] += 3 if genre in direct else 1
+    return sorted(genre_counter.items(), key=lambda x: -x[1])
+
+def analyze_recent_genres(ytmusic, user_id=None, refresh=False):
+    """
+    Analyzes recent listening history to identify user's preferred genres.
+    The profile is the sum of the genre scores of the last HISTORY_WINDOW
+    history items. With a user_id it is kept in the profile store: a profile
+    younger than the TTL is returned as-is; otherwise it is recomputed over
+    the current window, scoring only the items that weren't in the stored one.
+    """
     print("🎧 Step 4/6: Analyzing your listening history...")
     
     if not ytmusic:
         print("   ❌ YTMusic client not initialized. Skipping history analysis.")
         return []
+    
+    stored = None
+    if user_id and not refresh:
+        try:
+            stored = database.load_taste_profile(user_id, 'youtube')
+        except Exception as e:
+            print(f"   ⚠ Couldn't read your saved music profile: {e}")
+        if database.is_profile_fresh(stored):
+            print("   ✓ Using your saved music profile.")
+            return stored['genres']
 
     try:
         print("   📥 Fetching listening history...")
-        history = ytmusic.get_history()
-        recent_tracks = history[:200] if len(history) > 200 else history
+        history = _limiter.call('default', ytmusic.get_history)
+        recent_tracks = history[:HISTORY_WINDOW]
         print(f"   ✓ Retrieved {len(recent_tracks)} recent tracks.")
     except Exception as e:
         print(f"   ❌ Error getting history: {e}.")
-        return []
+        return stored['genres'] if stored else []
     
     if not recent_tracks:
         print("   ⚠ No listening history found.")
-        return []
+        return stored['genres'] if stored else []
+    
+    # Items still in the window keep the scores stored with the last profile
+    known_scores = {}
+    if user_id:
+        try:
+            known_scores = database.load_profile_window(user_id, 'youtube')
+        except Exception as e:
+            print(f"   ⚠ Couldn't read your saved listening window: {e}")
+    
+    window = []
+    new_tracks = 0
+    for track in recent_tracks:
+        video_id = track.get('videoId')
+        scores = known_scores.get(video_id) if video_id else None
+        if scores is None:
+            scores = score_genres([track])
+            new_tracks += 1
+        window.append((video_id, scores))
+    
+    print(f"   🔍 Analyzing genres in {new_tracks} new tracks...")
+    genre_scores = defaultdict(int)
+    for _, scores in window: # A replayed track counts once per play, as in the history
+        for genre, score in scores:
+            genre_scores[genre] += score
+    result = sorted(genre_scores.items(), key=lambda x: -x[1])
+    
+    if user_id:
+        try:
+            database.save_taste_profile(user_id, 'youtube', result, recent_tracks[0].get('videoId'), window)
+        except Exception as e:
+            print(f"   ⚠ Couldn't save your music profile: {e}")
     
-    genre_counter = defaultdict(int)
-    print("   🔍 Analyzing genres in your music...")
-    
-    for track in tqdm(recent_tracks, desc="   Processing tracks", leave=False):
-        track_title = track.get('title', '').lower()
-        # Handle album which can be a dict or a string
-        track_album = track.get('album', {})
-        if isinstance(track_album, dict) and 'name' in track_album:
-            track_album = track_album['name'].lower()
-        elif isinstance(track_album, str):
-            track_album = track_album.lower()
-        else:
-            track_album = ''
-        
-        artists = track.get('artists', [])
-        track_artist = artists[0].get('name', '').lower() if artists and isinstance(artists, list) and artists[0] else ''
-        
-        text_sources = [track_title, track_album, track_artist]
-        
-        for text in text_sources:
-            if text:
-                for genre, opposites in GENRE_OPPOSITES.items():
-                    if genre in text:
-                        genre_counter[genre] += 3 # Stronger weight for direct genre match
-                    # Check if the first word of any opposite genre is in the text
-                    # This is a very rough heuristic for 'opposite' detection
-                    elif any(opposite.split()[0] in text for opposite in opposites):
-                        genre_counter[genre] += 1
-    
-    result = sorted(genre_counter.items(), key=lambda x: -x[1])
     active_genres_count = len([g for g, c in result if c > 0])
     print(f"   ✅ Genre analysis complete - found {active_genres_count} active genres.")
     return result
@@ -440,17 +501,15 @@ def is_authentic_music(title, description=""):
     dance videos, covers, or other non-music content based on keywords.
     """
     title_lower = title.lower()
-    desc_lower = description.lower() # description might not always be available from search results
+    desc_lower = description.lower() if description else "" # description might not always be available from search results
     
-    # Calculate exclude score
-    exclude_score = sum(1 for keyword in EXCLUDE_KEYWORDS if keyword in title_lower or keyword in desc_lower)
+    # Calculate exclude score (distinct keywords found in title or description)
+    exclude_score = len(_EXCLUDE_MATCHER.find(title_lower) | _EXCLUDE_MATCHER.find(desc_lower))
     
     # Calculate prefer score
-    prefer_score = sum(1 for keyword in PREFER_KEYWORDS if keyword in title_lower or keyword in desc_lower)
+    prefer_score = len(_PREFER_MATCHER.find(title_lower) | _PREFER_MATCHER.find(desc_lower))
     
-    # Additional general music indicators
-    music_indicators = ['official', 'original', 'instrumental', 'classical', 'traditional', 'music video', 'audio', 'track', 'song']
-    has_music_indicator = any(indicator in title_lower for indicator in music_indicators)
+    has_music_indicator = _INDICATOR_MATCHER.contains_any(title_lower)
     
     # Strong rejection criteria: if multiple exclude keywords or strong exclude without strong prefer
     if exclude_score >= 2 or (exclude_score >= 1 and prefer_score == 0 and not has_music_indicator):
@@ -463,117 +522,394 @@ def is_authentic_music(title, description=""):
     # Neutral case: if no strong indicators either way, default to true
     return True # Consider it authentic if no strong negative signs
 
-def search_authentic_music(ytmusic, existing_anti_songs, history):
+def classify_many(titles, descriptions=None):
+    """Batch version of is_authentic_music: returns one verdict per title."""
+    if descriptions is None:
+        return [is_authentic_music(title) for title in titles]
+    return [is_authentic_music(title, description) for title, description in zip(titles, descriptions)]
+
+def _candidate_from_track(track, culture, search_term, query, existing_anti_songs, history):
+    """Returns a candidate dict if a search result is usable, otherwise None."""
+    video_id = track.get('videoId')
+    title = track.get('title', '')
+    
+    if not video_id or not title:
+        return None
+    
+    # Skip if already in existing anti-playlists or history
+    if video_id in existing_anti_songs or video_id in history:
+        return None
+    
+    # Apply authenticity check
+    if not is_authentic_music(title):
+        return None
+    
+    # Check for duration (prefer longer tracks)
+    # ytmusicapi search results can have 'duration' (string) and 'duration_seconds' (int)
+    duration_seconds = track.get('duration_seconds')
+    # Ensure it's a number and longer than 60 seconds (1 minute);
+    # if duration info is missing, still consider it
+    if duration_seconds and duration_seconds <= MIN_DURATION_SECONDS:
+        return None # Too short
+    
+    return {
+        'id': video_id,
+        'culture': culture,
+        'search_term': search_term,
+        'title': title,
+        'query': query,
+        'duration_seconds': duration_seconds or 0 # 0 indicates unknown duration
+    }
+
+def _culture_queries(search_term):
+    """The query variants searched for one culture search term."""
+    return [
+        f"{search_term} traditional",
+        f"{search_term} instrumental",
+        f"{search_term} authentic",
+        search_term # Plain term as well
+    ]
+
+def _search_culture(ytmusic, culture, search_terms, existing_anti_songs, history, stop_event=None, seen_filter=None):
+    """
+    Searches the query variants of one culture until its quota is filled.
+    Remaining query variants are skipped once the culture has enough candidates
+    or when stop_event is set.
+    """
+    culture_candidates = []
+    
+    # Limit search terms per culture
+    search_term_limit = min(SEARCH_TERMS_PER_CULTURE, len(search_terms))
+    
+    for search_term in search_terms[:search_term_limit]:
+        for query in _culture_queries(search_term):
+            if len(culture_candidates) >= MAX_CANDIDATES_PER_CULTURE:
+                return culture_candidates
+            if stop_event is not None and stop_event.is_set():
+                return culture_candidates
+            
+            try:
+                # Request slightly more results to filter down
+                results = _search_cache.get_or_fetch(
+                    'youtube', query, 'songs', 20,
+                    lambda: _limiter.call('search', ytmusic.search, query, filter='songs', limit=20)
+                )
+            except Exception as e:
+                # print(f"   ⚠ Error searching for '{query}': {e}") # Too verbose
+                continue
+            
+            # One batched history lookup per result page instead of loading the whole history
+            known = seen_filter([t['videoId'] for t in results if t.get('videoId')]) if seen_filter and results else ()
+            
+            for track in results:
+                if track.get('videoId') in known:
+                    continue
+                candidate = _candidate_from_track(track, culture, search_term, query, existing_anti_songs, history)
+                if candidate:
+                    culture_candidates.append(candidate)
+                    break # Found a good one for this query, move to next query or culture
+    
+    return culture_candidates
+
+def _catalog_candidates(selected_cultures, existing_anti_songs, history, seen_filter=None, mode=None):
+    """
+    Serves cultures from the harvested catalog, using its precomputed
+    authenticity verdicts and durations instead of live searches.
+    Returns ({culture: candidates}, cultures that still need a live search).
+    """
+    mode = catalog.catalog_mode(mode)
+    if mode == 'off':
+        return {}, selected_cultures
+    candidates_by_culture = {}
+    try:
+        store = catalog.get_catalog()
+        covered = {culture for culture, _ in store.fresh_keywords('youtube')}
+        for culture, _ in selected_cultures:
+            if culture not in covered:
+                continue
+            # A random sample of the culture's authentic, long-enough tracks; extra rows cover the filters below
+            entries = store.lookup('youtube', cultures=[culture], authentic_only=True,
+                                   min_duration=MIN_DURATION_SECONDS, sample=CATALOG_SAMPLE_PER_CULTURE)
+            known = seen_filter([entry['id'] for entry in entries]) if seen_filter and entries else ()
+            picked = {}
+            for entry in entries:
+                if len(picked) >= MAX_CANDIDATES_PER_CULTURE:
+                    break
+                video_id = entry['id']
+                if video_id in picked or video_id in existing_anti_songs or video_id in history or video_id in known:
+                    continue
+                picked[video_id] = {
+                    'id': video_id,
+                    'culture': culture,
+                    'search_term': entry['keyword'],
+                    'title': entry['title'],
+                    'query': entry['query'],
+                    'duration_seconds': entry['duration_seconds'] or 0
+                }
+            candidates_by_culture[culture] = list(picked.values())
+    except Exception as e:
+        print(f"   ⚠ Couldn't read the candidate catalog: {e}")
+        return candidates_by_culture, [] if mode == 'only' else [
+            (c, terms) for c, terms in selected_cultures if c not in candidates_by_culture
+        ]
+    
+    remaining = [] if mode == 'only' else [(c, terms) for c, terms in selected_cultures if c not in covered]
+    if covered:
+        print(f"   📚 {len(candidates_by_culture)} cultures served from the catalog, {len(remaining)} left to search live.")
+    return candidates_by_culture, remaining
+
+def iter_authentic_music(ytmusic, existing_anti_songs, history, concurrency=None, seen_filter=None, catalog_mode=None):
     """
-    Searches for authentic traditional music from various cultures,
-    filtering out non-music content.
+    Yields authentic traditional music candidates from various cultures as
+    they are found, filtering out non-music content.
+    
+    Cultures the catalog harvester has covered are served from the local
+    catalog first (see catalog.CATALOG_MODE, or pass catalog_mode). The rest
+    are searched concurrently on up to `concurrency` threads
+    (defaults to YOUTUBE_SEARCH_CONCURRENCY), each stopping as soon as it
+    has MAX_CANDIDATES_PER_CULTURE candidates, and yielded as each culture
+    completes. `seen_filter`, if given, is called with a list of video IDs
+    and returns the ones to exclude. Close the generator once you have
+    enough: outstanding culture searches are stopped.
     """
-    candidates = []
+    if concurrency is None:
+        concurrency = YOUTUBE_SEARCH_CONCURRENCY
     
     if not ytmusic:
         print("   ❌ YTMusic client not initialized. Skipping music search.")
-        return candidates
+        return
 
     print("🌍 Searching for authentic traditional music...")
     
     # Shuffle the music searches for variety
-    music_searches_shuffled = AUTHENTIC_MUSIC_SEARCHES.copy()
+    music_searches_shuffled = list(AUTHENTIC_MUSIC_SEARCHES)
     random.shuffle(music_searches_shuffled)
     
     # Limit to a reasonable number of cultures for a single run
-    search_limit_cultures = min(15, len(music_searches_shuffled)) 
+    search_limit_cultures = min(MAX_SEARCH_CULTURES, len(music_searches_shuffled)) 
+    selected_cultures = music_searches_shuffled[:search_limit_cultures]
+    
+    results_by_culture, live_cultures = _catalog_candidates(
+        selected_cultures, existing_anti_songs, history, seen_filter, catalog_mode
+    )
+    found = 0
+    # Catalog cultures in the shuffled culture order
+    for culture, _ in selected_cultures:
+        for candidate in results_by_culture.get(culture, []):
+            found += 1
+            yield candidate
+    
+    stop_event = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ytmusic-search")
+    try:
+        futures = {
+            executor.submit(_search_culture, ytmusic, culture, search_terms,
+                            existing_anti_songs, history, stop_event, seen_filter): culture
+            for culture, search_terms in live_cultures
+        }
+        for future in as_completed(futures):
+            try:
+                culture_candidates = future.result()
+            except Exception as e:
+                print(f"   ⚠ Error searching culture: {e}")
+                continue
+            for candidate in culture_candidates:
+                found += 1
+                yield candidate
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    print(f"   ✅ Found {found} total authentic music candidates.")
+
+def search_authentic_music(ytmusic, existing_anti_songs, history, concurrency=None, seen_filter=None, catalog_mode=None):
+    """Collects every candidate of iter_authentic_music (same arguments) into a list."""
+    return list(iter_authentic_music(ytmusic, existing_anti_songs, history, concurrency, seen_filter, catalog_mode))
+
+# --- Catalog Harvesting ---
+
+def _harvest_search_term(ytmusic, search_term, limit):
+    """Searches every query variant of a term; returns catalog tracks, or raises if every query failed."""
+    tracks = []
+    seen = set()
+    errors = []
+    for query in _culture_queries(search_term):
+        try:
+            results = _limiter.call('search', ytmusic.search, query, filter='songs', limit=limit)
+        except Exception as e:
+            errors.append(e)
+            continue
+        for track in results:
+            video_id, title = track.get('videoId'), track.get('title')
+            if not video_id or not title or video_id in seen:
+                continue
+            seen.add(video_id)
+            artists = track.get('artists') or []
+            tracks.append({
+                'id': video_id,
+                'title': title,
+                'query': query,
+                'artist': artists[0].get('name') if artists else None,
+                'duration_seconds': track.get('duration_seconds'),
+                'authentic': is_authentic_music(title)
+            })
+    if errors and len(errors) == len(_culture_queries(search_term)):
+        raise errors[0]
+    return tracks
+
+def harvest_catalog(ytmusic, cultures=None, max_age=None, terms_per_culture=None, concurrency=None,
+                    limit=HARVEST_PAGE_SIZE):
+    """
+    Crawls AUTHENTIC_MUSIC_SEARCHES into the candidate catalog with
+    authenticity verdicts precomputed. Every search term of each culture is
+    harvested unless terms_per_culture is given; terms harvested within
+    max_age seconds (default catalog.HARVEST_REFRESH_SECONDS) are skipped.
+    Returns (terms harvested, terms failed).
+    """
+    max_age = catalog.HARVEST_REFRESH_SECONDS if max_age is None else max_age
+    store = catalog.get_catalog()
+    fresh = store.fresh_keywords('youtube', max_age)
+    pending = [
+        (culture, search_term)
+        for culture, search_terms in AUTHENTIC_MUSIC_SEARCHES
+        if cultures is None or culture in cultures
+        for search_term in search_terms[:terms_per_culture]
+        if (culture, search_term) not in fresh
+    ]
+    print(f"🌾 Harvesting {len(pending)} YouTube Music search terms...")
+    
+    harvested = failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency or YOUTUBE_SEARCH_CONCURRENCY),
+                            thread_name_prefix="ytmusic-harvest") as executor:
+        futures = {executor.submit(_harvest_search_term, ytmusic, search_term, limit): (culture, search_term)
+                   for culture, search_term in pending}
+        for future in as_completed(futures):
+            culture, search_term = futures[future]
+            try:
+                tracks = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"   ⚠ Couldn't search for '{search_term}' ({culture}): {e}")
+                continue
+            store.store('youtube', search_term, tracks, culture=culture)
+            harvested += 1
+    print(f"   ✅ Harvested {harvested} search terms, {failed} failed.")
+    return harvested, failed
+
+def select_final_tracks(candidates, limit=MAX_PLAYLIST_TRACKS):
+    """
+    Picks up to `limit` candidates, one per culture first, then fills the
+    remaining slots in candidate order. Returns (selected, cultures_used).
+    """
+    final_tracks_info = [] # Store full candidate info, not just IDs
+    selected_ids = set()
+    cultures_used = set()
     
-    for culture, search_terms in tqdm(music_searches_shuffled[:search_limit_cultures], desc="Searching cultures"):
-        # print(f"   🎵 Searching {culture} music...") # Too verbose for tqdm
-        culture_candidates = []
-        
-        # Limit search terms per culture
-        search_term_limit = min(2, len(search_terms))
-
-        for search_term in search_terms[:search_term_limit]:
-            search_queries = [
-                f"{search_term} traditional",
-                f"{search_term} instrumental",
-                f"{search_term} authentic",
-                search_term # Plain term as well
-            ]
-            
-            for query in search_queries:
-                if len(culture_candidates) >= 2: # Max 2 good candidates per culture
-                    break
-                
-                try:
-                    # Request slightly more results to filter down
-                    results = ytmusic.search(query, filter='songs', limit=20) 
-                    
-                    for track in results:
-                        if len(culture_candidates) >= 2:
-                            break
-                            
-                        video_id = track.get('videoId')
-                        title = track.get('title', '')
-                        
-                        if not video_id or not title:
-                            continue
-                        
-                        # Skip if already in existing anti-playlists or history
-                        if video_id in existing_anti_songs or video_id in history:
-                            # print(f"      - Skipping duplicate: {title}") # Too verbose
-                            continue
-                        
-                        # Apply authenticity check
-                        if is_authentic_music(title):
-                            # Check for duration (prefer longer tracks)
-                            # ytmusicapi search results can have 'duration' (string) and 'duration_seconds' (int)
-                            duration_seconds = track.get('duration_seconds')
-                            # Ensure it's a number and longer than 60 seconds (1 minute)
-                            if duration_seconds and duration_seconds > 60:
-                                culture_candidates.append({
-                                    'id': video_id,
-                                    'culture': culture,
-                                    'search_term': search_term,
-                                    'title': title,
-                                    'query': query,
-                                    'duration_seconds': duration_seconds
-                                })
-                                # print(f"      ✓ Found: {title} ({culture})") # Too verbose
-                                break # Found a good one for this query, move to next query or culture
-                            elif not duration_seconds: # If duration info is missing, still consider it
-                                culture_candidates.append({
-                                    'id': video_id,
-                                    'culture': culture,
-                                    'search_term': search_term,
-                                    'title': title,
-                                    'query': query,
-                                    'duration_seconds': 0 # Indicate unknown duration
-                                })
-                                # print(f"      ✓ Found: {title} (No duration info) ({culture})") # Too verbose
-                                break
-                            # else: Too short, skip implicitly
-                except Exception as e:
-                    # print(f"   ⚠ Error searching for '{query}': {e}") # Too verbose
-                    continue
-                    
-                time.sleep(0.1) # Small delay to avoid hammering API
-        
-        candidates.extend(culture_candidates)
-        # print(f"      → Added {len(culture_candidates)} authentic tracks from {culture}.") # Too verbose
-        time.sleep(0.3) # Delay between cultures
+    # First pass: try to get one track per unique culture
+    for candidate in candidates:
+        if len(final_tracks_info) >= limit:
+            break
+        if candidate['culture'] not in cultures_used:
+            final_tracks_info.append(candidate)
+            selected_ids.add(candidate['id'])
+            cultures_used.add(candidate['culture'])
     
-    print(f"   ✅ Found {len(candidates)} total authentic music candidates.")
-    return candidates
-
-def create_anti_playlist_main_flow(ytmusic):
-    """Orchestrates the creation of the anti-playlist."""
+    # Second pass: fill any remaining slots with diverse tracks
+    for candidate in candidates:
+        if len(final_tracks_info) >= limit:
+            break
+        # Avoid adding tracks already selected (by ID)
+        if candidate['id'] not in selected_ids:
+            final_tracks_info.append(candidate)
+            selected_ids.add(candidate['id'])
+    
+    return final_tracks_info, cultures_used
+
+def _playlist_ops(ytmusic):
+    """YouTube Music callbacks for the playlist writer."""
+    def create(title, description):
+        # create_playlist returns the playlist ID
+        return ytmusic.create_playlist(title, description, privacy_status='PRIVATE')
+    
+    def find(title, marker):
+        # Titles repeat every month, so only a playlist carrying the marker is ours.
+        # A library listing's 'description' is its subtitle, so read the real one from the playlist.
+        for playlist in ytmusic.get_library_playlists(limit=None) or []:
+            if playlist.get('title') != title or not playlist.get('playlistId'):
+                continue
+            description = ytmusic.get_playlist(playlist['playlistId'], limit=1).get('description')
+            if description and marker in description:
+                return playlist['playlistId']
+        return None
+    
+    def list_items(playlist_id):
+        playlist = ytmusic.get_playlist(playlist_id, limit=None)
+        return [track['videoId'] for track in playlist.get('tracks') or [] if track.get('videoId')]
+    
+    return playlist_writer.PlaylistOps(create, ytmusic.add_playlist_items, find, list_items)
+
+def _run_playlist_write(ytmusic, write, report, resuming=False):
+    """Executes a persisted playlist write and returns the result dict, or None on failure."""
+    try:
+        with metrics.stage('youtube', 'write'):
+            playlist_id = playlist_writer.execute_write(write, _playlist_ops(ytmusic), _limiter, resuming)
+    except Exception as e:
+        print(f"   ❌ Error creating or adding tracks to playlist: {e}")
+        print("   Please check your internet connection and YouTube Music API permissions.")
+        return None
+    
+    track_ids = write['track_ids']
+    cultures = (write['meta'] or {}).get('cultures', [])
+    playlist_url = f"https://music.youtube.com/playlist?list={playlist_id}"
+    print(f"\n🎉 SUCCESS! Created '{write['title']}' with:")
+    print(f"   • {len(track_ids)} authentic music tracks")
+    print(f"   • {len(cultures)} different cultures")
+    print(f"   • Cultures included: {', '.join(cultures)}")
+    print(f"   • View your new playlist here: {playlist_url}")
+    
+    message = f"Created '{write['title']}' with {len(track_ids)} tracks from {len(cultures)} cultures: {playlist_url}"
+    report('done', message)
+    return {
+        'playlist_id': playlist_id,
+        'title': write['title'],
+        'url': playlist_url,
+        'track_ids': track_ids,
+        'cultures': cultures,
+        'message': message
+    }
+
+def create_anti_playlist_main_flow(ytmusic, report=None):
+    """
+    Orchestrates the creation of the anti-playlist.
+    If an earlier run left a playlist half-written, it is finished instead of
+    searching again. report(stage, message) is called as each stage starts.
+    Returns a dict with the playlist details and the written track IDs, or None on failure.
+    """
+    report = report or (lambda stage, message: None)
     if not ytmusic:
         print("❌ Cannot proceed: YouTube Music client not authenticated or initialized.")
         return
 
-    existing_anti_songs = get_existing_anti_playlist_songs(ytmusic)
-    history = load_history()
+    report('library', "Checking your existing anti-playlists...")
+    with metrics.stage('youtube', 'library'):
+        user_id = get_youtube_user_id(ytmusic)
+    
+    write = playlist_writer.find_resumable_write('youtube', user_id)
+    if write is not None:
+        print(f"🔁 Resuming unfinished playlist '{write['title']}' ({write['written']}/{len(write['track_ids'])} tracks written)...")
+        report('write', f"Finishing your unfinished playlist '{write['title']}'...")
+        return _run_playlist_write(ytmusic, write, report, resuming=True)
+    
+    with metrics.stage('youtube', 'library'):
+        existing_anti_songs = get_existing_anti_playlist_songs(ytmusic)
+    
+    with metrics.stage('youtube', 'history'):
+        seen_filter = history_filter(user_id)
     
     # Analyze musical preferences  
-    genre_ranking = analyze_recent_genres(ytmusic)
+    report('profile', "Analyzing your listening history...")
+    with metrics.stage('youtube', 'profile'):
+        genre_ranking = analyze_recent_genres(ytmusic, user_id)
     
     if genre_ranking:
         print(f"   📊 Top detected genres:")
@@ -583,9 +919,15 @@ def create_anti_playlist_main_flow(ytmusic):
         print("   ⚠ No genres detected from listening history.")
     
     print("🔍 Step 5/6: Searching for authentic cultural music candidates...")
-    
-    # Search for authentic music instead of genre-based opposites
-    all_candidates = search_authentic_music(ytmusic, existing_anti_songs, history)
+    report('candidates', "Searching for authentic music from around the world...")
+    
+    # Search for authentic music instead of genre-based opposites. Gathering only a
+    # playlist's worth would keep just the fastest cultures, so over-gather and select below.
+    with metrics.stage('youtube', 'candidates'):
+        all_candidates = gather_candidates(
+            iter_authentic_music(ytmusic, existing_anti_songs, set(), seen_filter=seen_filter),
+            MAX_SEARCH_CANDIDATES, report
+        )
     
     if not all_candidates:
         print("   ❌ No suitable authentic music tracks found. Cannot create playlist.")
@@ -593,28 +935,9 @@ def create_anti_playlist_main_flow(ytmusic):
     
     # Select diverse tracks prioritizing cultural diversity
     print("   🌐 Selecting culturally diverse tracks for final playlist...")
-    final_tracks_info = [] # Store full candidate info, not just IDs
-    cultures_used = set()
-    
     random.shuffle(all_candidates) # Shuffle for variety in selection
-    
-    # First pass: try to get one track per unique culture, up to 25
-    for candidate in all_candidates:
-        if len(final_tracks_info) >= 25: # Target playlist size
-            break
-        if candidate['culture'] not in cultures_used:
-            final_tracks_info.append(candidate)
-            cultures_used.add(candidate['culture'])
-            # print(f"      ✓ Selected: {candidate['title']} ({candidate['culture']})") # Too verbose
-    
-    # Second pass: fill any remaining slots up to 25 with diverse tracks
-    for candidate in all_candidates:
-        if len(final_tracks_info) >= 25:
-            break
-        # Avoid adding tracks already selected (by ID)
-        if candidate['id'] not in [t['id'] for t in final_tracks_info]:
-            final_tracks_info.append(candidate)
-            # print(f"      ✓ Added: {candidate['title']} ({candidate['culture']})") # Too verbose
+    with metrics.stage('youtube', 'selection'):
+        final_tracks_info, cultures_used = select_final_tracks(all_candidates)
     
     final_track_ids = [t['id'] for t in final_tracks_info]
 
@@ -622,6 +945,7 @@ def create_anti_playlist_main_flow(ytmusic):
     
     if final_track_ids:
         print("🎵 Step 6/6: Creating anti-playlist on YouTube Music...")
+        report('write', f"Found {len(final_track_ids)} tracks from {len(cultures_used)} cultures. Creating playlist...")
         
         now = datetime.datetime.now()
         playlist_title = f"Anti Playlist {now.strftime('%B %Y')}"
@@ -633,36 +957,42 @@ def create_anti_playlist_main_flow(ytmusic):
         
         print(f"   📝 Playlist title: '{playlist_title}'")
         
-        try:
-            print("   🏗️ Creating playlist...")
-            # create_playlist returns the playlist ID
-            playlist_id = ytmusic.create_playlist(playlist_title, playlist_description, privacy_status='PRIVATE')
-            print(f"   ✓ Playlist created successfully with ID: {playlist_id}")
-            
-            print("   ➕ Adding tracks to playlist...")
-            # Add playlist items in batches (ytmusicapi add_playlist_items takes max 100 items per call)
-            batch_size = 50 # Using 50 to be safe, max is 100
-            for i in tqdm(range(0, len(final_track_ids), batch_size), desc="   Adding tracks"):
-                batch = final_track_ids[i:i+batch_size]
-                ytmusic.add_playlist_items(playlist_id, batch)
-                time.sleep(0.5) # Small delay between batches to avoid rate limits
-            
-            # Update history with all newly added song IDs
-            history.update(final_track_ids)
-            save_history(history)
-            
-            print(f"\n🎉 SUCCESS! Created '{playlist_title}' with:")
-            print(f"   • {len(final_track_ids)} authentic music tracks")
-            print(f"   • {len(cultures_used)} different cultures")
-            print(f"   • Cultures included: {', '.join(sorted(cultures_used))}")
-            print(f"   • View your new playlist here: https://music.youtube.com/playlist?list={playlist_id}")
-            
-        except Exception as e:
-            print(f"   ❌ Error creating or adding tracks to playlist: {e}")
-            print("   Please check your internet connection and YouTube Music API permissions.")
+        # The chosen tracks are persisted first, so a failed write can be resumed
+        write = playlist_writer.start_write(
+            'youtube', user_id, playlist_title, playlist_description, final_track_ids,
+            meta={'cultures': sorted(cultures_used)}
+        )
+        return _run_playlist_write(ytmusic, write, report)
     else:
         print("   ⚠ Final track selection resulted in no tracks. Cannot create playlist.")
 
+def get_ytmusic_client(credentials):
+    """
+    Returns a YTMusic client for the session's OAuth credentials, reused from
+    the client registry (with its pooled HTTP session) while the token is unchanged.
+    """
+    def factory(session):
+        try:
+            ytmusic = YTMusic(requests_session=session, **_oauth_kwargs(credentials, session))
+        except Exception as e:
+            print(f"   ❌ Failed to initialize YTMusic API with OAuth token: {e}")
+            ytmusic = YTMusic(requests_session=session)
+        return metrics.instrument(ytmusic, 'youtube')
+    return get_client_registry().get_or_create(registry_key('youtube', credentials.token), factory)
+
+def run_youtube_generation(credentials, report=None, profile=None):
+    """
+    Job entry point: builds a client from the session's OAuth credentials and runs the main flow.
+    profile=True records stage spans and a cProfile for this run (default: DEBUG / OTTER_PROFILE).
+    """
+    with profiling.profile_run('youtube', enabled=profile):
+        with metrics.stage('youtube', 'auth'):
+            ytmusic = get_ytmusic_client(credentials)
+        result = create_anti_playlist_main_flow(ytmusic, report=report)
+    if not result:
+        raise RuntimeError("Failed to create YouTube Music anti-playlist")
+    return result
+
 def main():
     print("🚀 Starting Authentic Anti-Playlist Creator for YouTube Music")
     print("=" * 50)
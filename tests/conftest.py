@@ -0,0 +1,29 @@
+"""
+Shared test setup. Like benchmarks/run.py, tests run in a temporary working
+directory (database.DATA_DIR is relative to it) with the provider rate
+limits lifted, against the fakes in benchmarks/fakes.py.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Set up before any test module imports database or the services
+_workdir = tempfile.TemporaryDirectory(prefix='otter-tests-')
+os.chdir(_workdir.name)
+for _provider, _backend in [('SPOTIFY', b) for b in ('DEFAULT', 'SEARCH', 'WRITE')] + \
+                           [('YOUTUBE', b) for b in ('DEFAULT', 'SEARCH', 'LIBRARY', 'WRITE')]:
+    os.environ[f"OTTER_RATE_{_provider}_{_backend}"] = '100000/100000'
+
+@pytest.fixture(scope='session', autouse=True)
+def _database():
+    import database
+    database.init_db()
+    yield
+    os.chdir(ROOT)
+    _workdir.cleanup()
@@ -0,0 +1,112 @@
+import time
+
+import pytest
+
+from services import catalog
+
+@pytest.fixture
+def store(tmp_path):
+    return catalog.Catalog(path=tmp_path / 'catalog.db')
+
+def _track(track_id, **extra):
+    return dict({'id': track_id, 'title': f"Title {track_id}", 'query': 'q'}, **extra)
+
+def test_catalog_mode_falls_back_to_auto():
+    assert catalog.catalog_mode('ONLY') == 'only'
+    assert catalog.catalog_mode('sometimes') == 'auto'
+
+def test_store_replaces_a_keyword(store):
+    store.store('youtube', 'joik', [_track('a'), _track('b')], culture='sami')
+    store.store('youtube', 'joik', [_track('c')], culture='sami')
+    assert [row['id'] for row in store.lookup('youtube', cultures=['sami'])] == ['c']
+    assert store.fresh_keywords('youtube') == {('sami', 'joik')}
+
+def test_lookup_filters(store):
+    store.store('youtube', 'joik', [
+        _track('short', duration_seconds=30, authentic=True),
+        _track('long', duration_seconds=300, authentic=True),
+        _track('unknown', duration_seconds=None, authentic=True),
+        _track('remix', duration_seconds=300, authentic=False),
+    ], culture='sami')
+    rows = store.lookup('youtube', cultures=['sami'], authentic_only=True, min_duration=60)
+    assert {row['id'] for row in rows} == {'long', 'unknown'}
+    assert len(store.lookup('youtube', cultures=['sami'], sample=2)) == 2
+    assert store.lookup('youtube', keywords=[]) == []
+
+def test_stale_keywords_are_ignored(store, monkeypatch):
+    store.store('spotify', 'fado', [_track('a', payload={'id': 'a'})])
+    later = time.time() + catalog.CATALOG_MAX_AGE_SECONDS + 1
+    monkeypatch.setattr(catalog.time, 'time', lambda: later)
+    assert store.fresh_keywords('spotify') == set()
+    assert store.lookup('spotify') == []
+
+# --- Generation against the catalog ---
+
+KEYWORDS = ['fado', 'qawwali', 'gamelan', 'mbalax']
+
+@pytest.fixture
+def spotify(monkeypatch):
+    """spotify_service with half of KEYWORDS harvested into the shared catalog, searching fixed keywords."""
+    pytest.importorskip('spotipy')
+    from benchmarks.fakes import FakeSpotify
+    from services import spotify_service
+    from services.search_cache import get_search_cache
+
+    catalog.get_catalog().clear()
+    spotify_service.harvest_catalog(FakeSpotify(), keywords=KEYWORDS[:2])
+    get_search_cache().clear()
+    monkeypatch.setattr(spotify_service, '_opposite_keywords', lambda top_genres, raw_genres=None: list(KEYWORDS))
+    yield spotify_service, FakeSpotify()
+    catalog.get_catalog().clear()
+
+@pytest.mark.parametrize('mode', ['auto', 'only', 'off'])
+def test_spotify_catalog_modes(spotify, mode):
+    spotify_service, sp = spotify
+    tracks = spotify_service.find_opposite_tracks(sp, [('pop', 1)], catalog_mode=mode)
+    assert tracks
+
+    # Live searches stop at MAX_SEARCH_CANDIDATES, so not every uncovered keyword is searched
+    searched = set(sp.search_queries)
+    if mode == 'only':
+        assert not searched
+        assert {track['genre_keyword'] for track in tracks} <= set(KEYWORDS[:2])
+    elif mode == 'auto':
+        assert searched and searched <= set(KEYWORDS[2:])
+    else:
+        assert searched
+
+@pytest.fixture
+def youtube(monkeypatch):
+    """youtube_service limited to three cultures, two of them harvested into the shared catalog."""
+    pytest.importorskip('ytmusicapi')
+    pytest.importorskip('google_auth_oauthlib')
+    from benchmarks.fakes import FakeYTMusic
+    from services import youtube_service
+    from services.search_cache import get_search_cache
+
+    cultures = youtube_service.AUTHENTIC_MUSIC_SEARCHES[:3]
+    monkeypatch.setattr(youtube_service, 'AUTHENTIC_MUSIC_SEARCHES', cultures)
+    catalog.get_catalog().clear()
+    youtube_service.harvest_catalog(FakeYTMusic(), cultures=[culture for culture, _ in cultures[:2]])
+    get_search_cache().clear()
+    yield youtube_service, FakeYTMusic(), cultures
+    catalog.get_catalog().clear()
+
+@pytest.mark.parametrize('mode', ['auto', 'only', 'off'])
+def test_youtube_catalog_modes(youtube, mode):
+    youtube_service, yt, cultures = youtube
+    candidates = youtube_service.search_authentic_music(yt, set(), set(), catalog_mode=mode)
+    assert candidates
+
+    harvested = {culture for culture, _ in cultures[:2]}
+    _, live_terms = cultures[2]
+    searched = set(yt.search_queries)
+    if mode == 'only':
+        assert not searched
+        assert {candidate['culture'] for candidate in candidates} <= harvested
+    elif mode == 'auto':
+        assert searched
+        assert searched <= set(query for term in live_terms for query in youtube_service._culture_queries(term))
+    else:
+        assert len({candidate['culture'] for candidate in candidates}) >= 2
+        assert searched
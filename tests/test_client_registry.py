@@ -0,0 +1,29 @@
+from services import client_registry
+from services.client_registry import ClientRegistry
+
+class Session:
+    """Stands in for a pooled requests.Session."""
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_evicted_sessions_stay_open_for_their_holders(monkeypatch):
+    monkeypatch.setattr(client_registry, 'make_session', Session)
+    registry = ClientRegistry(max_clients=1)
+    held = registry.get_or_create('first', lambda session: session)
+    registry.get_or_create('second', lambda session: session)
+    assert len(registry) == 1
+    # A job still using the evicted client must not have its connections closed under it
+    assert not held.closed
+    assert registry.get_or_create('first', lambda session: session) is not held
+
+def test_idle_clients_are_dropped(monkeypatch):
+    monkeypatch.setattr(client_registry, 'make_session', Session)
+    registry = ClientRegistry(idle_seconds=60)
+    held = registry.get_or_create('idle', lambda session: session)
+    registry._entries['idle'].last_used -= 61
+    assert registry.evict_idle() == 1
+    assert len(registry) == 0
+    assert not held.closed
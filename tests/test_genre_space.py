@@ -0,0 +1,51 @@
+import random
+import threading
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from services import genre_space
+
+@pytest.fixture
+def fresh(monkeypatch, tmp_path):
+    """Clean module state, a private matrix path and a recording build_genre_space."""
+    for name, value in [('_space', None), ('_checked_at', None), ('_loaded_mtime', None),
+                        ('_attempted_count', 0), ('_rebuild_thread', None)]:
+        monkeypatch.setattr(genre_space, name, value)
+    monkeypatch.setattr(genre_space, 'SPACE_PATH', tmp_path / 'genre_space.npz')
+    artists = {'count': 100}
+    monkeypatch.setattr(genre_space.database, 'count_artist_genres', lambda: artists['count'])
+    builds = []
+    def build(artist_genres=None):
+        builds.append(threading.current_thread())
+        return None # Vocabulary still too small
+    monkeypatch.setattr(genre_space, 'build_genre_space', build)
+    return artists, builds
+
+def test_get_genre_space_never_builds_in_the_caller(fresh):
+    _, builds = fresh
+    assert genre_space.get_genre_space() is None
+    genre_space._rebuild_thread.join(5)
+    assert len(builds) == 1
+    assert builds[0] is not threading.current_thread()
+
+def test_too_small_vocabulary_is_not_retried_until_artists_grow(fresh):
+    artists, builds = fresh
+    genre_space.rebuild_genre_space()
+    genre_space.rebuild_genre_space()
+    assert len(builds) == 1
+    artists['count'] = int(100 * (1 + genre_space.REBUILD_GROWTH)) + 1
+    genre_space.rebuild_genre_space()
+    assert len(builds) == 2
+
+def test_built_space_scores_distant_genres():
+    # Two clusters of genres that never share an artist
+    rng = random.Random(0)
+    clusters = [[f"a{i}" for i in range(30)], [f"b{i}" for i in range(30)]]
+    artist_genres = [rng.sample(cluster, 4) for cluster in clusters for _ in range(200)]
+    space = genre_space.build_genre_space(artist_genres)
+    assert space is not None
+    opposite = space.most_opposite([('a1', 3), ('a2', 1)], 10)
+    assert len(opposite) == 10
+    assert all(genre.startswith('b') for genre, _ in opposite)
@@ -0,0 +1,68 @@
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+import pytest
+
+import database
+import jobs
+
+def _job(owner, heartbeat_age=0.0):
+    job_id = uuid.uuid4().hex
+    database.create_job(job_id, f"test:{job_id}", 'spotify', owner)
+    if heartbeat_age:
+        with database.transaction() as conn:
+            conn.execute('UPDATE job_leases SET heartbeat_at = ? WHERE job_id = ?',
+                         (time.time() - heartbeat_age, job_id))
+    return job_id
+
+def _status(job_id):
+    return database.load_job(job_id)['status']
+
+def test_jobs_of_live_processes_are_not_failed():
+    mine = _job(jobs.OWNER)
+    other_host = _job("other-host:1234:abcd1234")
+    jobs.fail_abandoned_jobs()
+    assert _status(mine) == 'queued'
+    assert _status(other_host) == 'queued'
+
+def test_jobs_with_a_stale_heartbeat_are_failed():
+    job_id = _job("other-host:1234:abcd1234", heartbeat_age=jobs.JOB_STALE_SECONDS + 1)
+    jobs.fail_abandoned_jobs()
+    job = database.load_job(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == jobs.INTERRUPTED_ERROR
+
+def test_jobs_of_an_earlier_process_with_the_same_pid_are_failed():
+    job_id = _job(f"{socket.gethostname()}:{os.getpid()}:00000000")
+    assert jobs.get_job(job_id)['status'] == 'failed'
+
+def test_submitted_job_runs_to_completion():
+    def work(value, report):
+        report('progress', "working")
+        return {'value': value}
+
+    job_id = jobs.submit_job(f"test:{uuid.uuid4().hex}", 'spotify', work, 3)
+    deadline = time.time() + 10
+    while jobs.is_active(jobs.get_job(job_id)) and time.time() < deadline:
+        time.sleep(0.01)
+    job = jobs.get_job(job_id)
+    assert job['status'] == 'succeeded'
+    assert job['result'] == {'value': 3}
+    assert [event['message'] for event in job['events']] == ["working"]
+
+def test_job_that_cannot_be_started_is_failed(monkeypatch):
+    update_job = database.update_job
+    def locked_on_start(job_id, status, **kwargs):
+        if status == 'running':
+            raise sqlite3.OperationalError("database is locked")
+        return update_job(job_id, status, **kwargs)
+    monkeypatch.setattr(database, 'update_job', locked_on_start)
+
+    job_id = _job(jobs.OWNER)
+    jobs._run_job(job_id, lambda report: None, (), {})
+    job = database.load_job(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == "database is locked"
@@ -0,0 +1,124 @@
+import pytest
+
+pytest.importorskip('spotipy')
+pytest.importorskip('ytmusicapi')
+pytest.importorskip('google_auth_oauthlib')
+
+import database
+from benchmarks.fakes import FakeSpotify, FakeYTMusic
+from services import playlist_writer, spotify_service, youtube_service
+from services.rate_limiter import RateLimiter
+
+TRACKS = [f"track-{i:02d}" for i in range(25)]
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr('services.playlist_writer.backoff_delay', lambda attempt: 0.0)
+
+def _flaky(func, failures, applied):
+    """Wraps a client method to fail `failures` times, applying the call first when `applied`."""
+    state = {'left': failures}
+    def call(*args, **kwargs):
+        if state['left']:
+            state['left'] -= 1
+            if applied:
+                func(*args, **kwargs)
+            raise TimeoutError("read timed out")
+        return func(*args, **kwargs)
+    return call
+
+def _spotify_write(sp, user_id):
+    write = playlist_writer.start_write('spotify', user_id, "Anti-Playlist Test", "Contrasting music.", TRACKS)
+    return write, spotify_service._playlist_ops(sp, user_id)
+
+@pytest.mark.parametrize('applied', [True, False])
+def test_failed_create_is_not_duplicated(applied):
+    user_id = f"writer-create-{applied}"
+    sp = FakeSpotify(user_id=user_id)
+    sp.user_playlist_create = _flaky(sp.user_playlist_create, 1, applied)
+    write, ops = _spotify_write(sp, user_id)
+
+    playlist_id = playlist_writer.execute_write(write, ops, RateLimiter('spotify'))
+    assert len(sp.playlists) == 1
+    assert sp.playlists[playlist_id] == TRACKS
+
+@pytest.mark.parametrize('applied', [True, False])
+def test_failed_add_is_not_duplicated(applied):
+    user_id = f"writer-add-{applied}"
+    sp = FakeSpotify(user_id=user_id)
+    sp.playlist_add_items = _flaky(sp.playlist_add_items, 1, applied)
+    write, ops = _spotify_write(sp, user_id)
+
+    playlist_id = playlist_writer.execute_write(write, ops, RateLimiter('spotify'))
+    assert sp.playlists[playlist_id] == TRACKS
+
+def test_interrupted_write_resumes_without_duplicates(monkeypatch):
+    monkeypatch.setattr(playlist_writer, 'MAX_BATCH_SIZE', 10)
+    user_id = 'writer-resume'
+    sp = FakeSpotify(user_id=user_id)
+    add_items = sp.playlist_add_items
+    calls = []
+    def crash_on_second_batch(playlist_id, items, position=None):
+        calls.append(items)
+        if len(calls) == 2:
+            raise RuntimeError("process killed")
+        return add_items(playlist_id, items)
+    sp.playlist_add_items = crash_on_second_batch
+    write, ops = _spotify_write(sp, user_id)
+    with pytest.raises(RuntimeError):
+        playlist_writer.execute_write(write, ops, RateLimiter('spotify'))
+
+    resumed = playlist_writer.find_resumable_write('spotify', user_id)
+    assert resumed['write_id'] == write['write_id']
+    playlist_id = playlist_writer.execute_write(resumed, ops, RateLimiter('spotify'), resuming=True)
+    assert len(sp.playlists) == 1
+    assert sp.playlists[playlist_id] == TRACKS
+    assert playlist_writer.find_resumable_write('spotify', user_id) is None
+    assert database.find_known_songs(user_id, 'spotify', TRACKS) == set(TRACKS)
+
+def test_youtube_find_requires_the_marker():
+    yt = FakeYTMusic(account='writer-find')
+    write = playlist_writer.start_write('youtube', 'writer-find', "Anti Playlist October 2026", "Music.", TRACKS)
+    marker = playlist_writer.write_marker(write['write_id'])
+    ops = youtube_service._playlist_ops(yt)
+
+    # An older playlist with the same title, written by another run
+    yt.library.append(yt._listing('older', write['title'], 0))
+    yt.playlists['older'] = []
+    yt.descriptions['older'] = "Music."
+    assert ops.find(write['title'], marker) is None
+
+    playlist_id = ops.create(write['title'], write['description'])
+    # The listing only carries the subtitle; the marker is read from the playlist itself
+    assert marker not in yt.library[-1]['description']
+    assert ops.find(write['title'], marker) == playlist_id
+
+def test_abandoned_write_is_not_resumed(monkeypatch):
+    monkeypatch.setattr(playlist_writer, 'MAX_WRITE_ATTEMPTS', 1)
+    write = playlist_writer.start_write('spotify', 'writer-abandoned', "Anti-Playlist Test", "Music.", TRACKS)
+    assert playlist_writer.find_resumable_write('spotify', 'writer-abandoned') is None
+    assert database.find_unfinished_playlist_write('spotify', 'writer-abandoned') is None
+    # A newer write is still found once the old one has been given up on
+    newer = playlist_writer.start_write('spotify', 'writer-abandoned', "Anti-Playlist Test", "Music.", TRACKS)
+    assert database.find_unfinished_playlist_write('spotify', 'writer-abandoned')['write_id'] == newer['write_id']
+    assert newer['write_id'] != write['write_id']
+
+def _failing(message):
+    def call(*args, **kwargs):
+        raise RuntimeError(message)
+    return call
+
+def test_failed_recovery_lookup_raises_the_original_error():
+    sp = FakeSpotify(user_id='writer-lookup')
+    sp.user_playlist_create = _failing("create failed")
+    write, ops = _spotify_write(sp, 'writer-lookup')
+    ops.find = _failing("lookup failed")
+    with pytest.raises(RuntimeError, match="create failed"):
+        playlist_writer.execute_write(write, ops, RateLimiter('spotify'))
+
+    sp = FakeSpotify(user_id='writer-listing')
+    sp.playlist_add_items = _failing("add failed")
+    write, ops = _spotify_write(sp, 'writer-listing')
+    ops.list_items = _failing("listing failed")
+    with pytest.raises(RuntimeError, match="add failed"):
+        playlist_writer.execute_write(write, ops, RateLimiter('spotify'))
@@ -0,0 +1,54 @@
+import pytest
+
+from services.rate_limiter import RateLimiter
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.http_status = status
+
+def _failing(*errors):
+    """A callable raising each error in turn, then returning 'ok'; counts its calls."""
+    calls = []
+    def func():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return 'ok'
+    return func, calls
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr('services.rate_limiter.BACKOFF_BASE_SECONDS', 0.0)
+    return RateLimiter('test')
+
+def test_transient_errors_are_retried(limiter):
+    func, calls = _failing(HTTPError(503), ConnectionError("reset"))
+    assert limiter.call('search', func) == 'ok'
+    assert len(calls) == 3
+
+def test_client_errors_are_not_retried(limiter):
+    func, calls = _failing(HTTPError(404))
+    with pytest.raises(HTTPError):
+        limiter.call('search', func)
+    assert len(calls) == 1
+
+def test_writes_are_not_retried_on_transient_errors(limiter):
+    func, calls = _failing(HTTPError(502))
+    with pytest.raises(HTTPError):
+        limiter.call('write', func)
+    assert len(calls) == 1
+
+def test_writes_are_retried_when_throttled(limiter, monkeypatch):
+    monkeypatch.setattr('services.rate_limiter.TokenBucket.penalize', lambda self, delay: None)
+    func, calls = _failing(HTTPError(429))
+    assert limiter.call('write', func) == 'ok'
+    assert len(calls) == 2
+
+def test_exhausted_quota_is_not_retried(limiter):
+    error = HTTPError(403)
+    error.args = ("The request cannot be completed because you have exceeded your quota. (quotaExceeded)",)
+    func, calls = _failing(error)
+    with pytest.raises(HTTPError):
+        limiter.call('search', func)
+    assert len(calls) == 1
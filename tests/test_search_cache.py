@@ -0,0 +1,50 @@
+import pytest
+
+from services.search_cache import SearchCache
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.http_status = status
+
+@pytest.fixture
+def cache(tmp_path):
+    return SearchCache(path=tmp_path / 'search_cache.db')
+
+def _fetch(result, calls):
+    def fetch():
+        calls.append(1)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fetch
+
+def test_results_are_cached(cache):
+    calls = []
+    for _ in range(2):
+        assert cache.get_or_fetch('spotify', 'Fado', 'track', 20, _fetch([{'id': 'a'}], calls)) == [{'id': 'a'}]
+    assert len(calls) == 1
+    assert cache.get('spotify', ' fado ', 'track', 20) == (True, [{'id': 'a'}])
+
+def test_empty_results_are_negatively_cached(cache):
+    calls = []
+    for _ in range(2):
+        assert cache.get_or_fetch('spotify', 'nothing', 'track', 20, _fetch([], calls)) == []
+    assert len(calls) == 1
+    assert cache.stats()['negative_hits'] == 1
+
+@pytest.mark.parametrize('status', [400, 404])
+def test_rejected_queries_are_negatively_cached(cache, status):
+    calls = []
+    with pytest.raises(HTTPError):
+        cache.get_or_fetch('spotify', 'bad query', 'track', 20, _fetch(HTTPError(status), calls))
+    assert cache.get('spotify', 'bad query', 'track', 20) == (True, [])
+
+@pytest.mark.parametrize('error', [HTTPError(401), HTTPError(403), HTTPError(429), HTTPError(503),
+                                   ConnectionError("reset"), KeyError('items')])
+def test_other_errors_are_not_cached(cache, error):
+    calls = []
+    with pytest.raises(type(error)):
+        cache.get_or_fetch('spotify', 'fado', 'track', 20, _fetch(error, calls))
+    assert cache.get('spotify', 'fado', 'track', 20) == (False, None)
+    assert cache.get_or_fetch('spotify', 'fado', 'track', 20, _fetch([{'id': 'a'}], calls)) == [{'id': 'a'}]
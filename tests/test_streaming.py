@@ -0,0 +1,112 @@
+import time
+from collections import Counter
+
+import pytest
+
+from services.streaming import gather_candidates
+
+def test_gather_stops_at_the_limit_and_closes_the_generator():
+    state = {'produced': 0, 'closed': False}
+    def candidates():
+        try:
+            while True:
+                state['produced'] += 1
+                yield state['produced']
+        finally:
+            state['closed'] = True
+
+    events = []
+    gathered = gather_candidates(candidates(), 12, lambda stage, message: events.append(stage), every=5)
+    assert gathered == list(range(1, 13))
+    assert state == {'produced': 12, 'closed': True}
+    assert events == ['progress', 'progress']
+
+def test_gather_returns_everything_from_a_short_generator():
+    assert gather_candidates((candidate for candidate in [1, 2]), 10) == [1, 2]
+
+# --- Service generators ---
+
+KEYWORDS = [f"keyword {i}" for i in range(20)]
+
+@pytest.fixture
+def spotify(monkeypatch):
+    pytest.importorskip('spotipy')
+    from services import catalog, spotify_service
+    from services.search_cache import get_search_cache
+
+    catalog.get_catalog().clear()
+    get_search_cache().clear()
+    monkeypatch.setattr(spotify_service, '_opposite_keywords', lambda top_genres, raw_genres=None: list(KEYWORDS))
+    yield spotify_service
+    catalog.get_catalog().clear()
+
+def test_closing_the_spotify_generator_cancels_outstanding_searches(spotify):
+    from benchmarks.fakes import FakeSpotify
+    sp = FakeSpotify(latency=0.05)
+    tracks = spotify.iter_opposite_tracks(sp, [('pop', 1)], concurrency=2, catalog_mode='off')
+    next(tracks)
+    tracks.close()
+    time.sleep(0.2) # Anything not cancelled would run now
+    assert len(sp.search_queries) <= 4
+
+def test_fair_share_spans_catalog_and_live_keywords(spotify):
+    from benchmarks.fakes import FakeSpotify
+    spotify.harvest_catalog(FakeSpotify(), keywords=KEYWORDS[:10])
+    tracks = list(spotify.iter_opposite_tracks(FakeSpotify(), [('pop', 1)], fair_share=True))
+
+    per_keyword = Counter(track['genre_keyword'] for track in tracks)
+    assert len(tracks) == spotify.MAX_SEARCH_CANDIDATES
+    assert max(per_keyword.values()) <= -(-spotify.MAX_SEARCH_CANDIDATES // len(KEYWORDS))
+    assert set(per_keyword) & set(KEYWORDS[10:]) # Live keywords still contribute
+
+def test_stream_profile_candidates_samples_a_playlist(spotify):
+    from benchmarks.fakes import FakeSpotify
+    events = []
+    candidates = spotify.stream_profile_candidates(
+        FakeSpotify(), {'top_genres': [('pop', 1)]}, report=lambda stage, message: events.append(stage)
+    )
+    assert len(candidates) == spotify.MAX_PLAYLIST_TRACKS
+    assert len({candidate['id'] for candidate in candidates}) == len(candidates)
+    assert 'progress' in events
+
+def test_closing_the_youtube_generator_stops_outstanding_searches():
+    pytest.importorskip('ytmusicapi')
+    pytest.importorskip('google_auth_oauthlib')
+    from benchmarks.fakes import FakeYTMusic
+    from services import youtube_service
+    from services.search_cache import get_search_cache
+
+    get_search_cache().clear()
+    yt = FakeYTMusic(latency=0.05)
+    candidates = youtube_service.iter_authentic_music(yt, set(), set(), concurrency=2, catalog_mode='off')
+    next(candidates)
+    searched = len(yt.search_queries)
+    candidates.close()
+    time.sleep(0.3)
+    # Cultures already running finish at most their current query; nothing new starts
+    assert len(yt.search_queries) <= searched + 2
+
+def test_youtube_playlist_spans_every_drawn_culture(monkeypatch):
+    pytest.importorskip('ytmusicapi')
+    pytest.importorskip('google_auth_oauthlib')
+    from benchmarks.fakes import FakeYTMusic
+    from services import youtube_service
+    from services.search_cache import get_search_cache
+
+    get_search_cache().clear()
+    selections = []
+    select_final_tracks = youtube_service.select_final_tracks
+    def recording(candidates):
+        selections.append(select_final_tracks(candidates))
+        return selections[-1]
+    monkeypatch.setattr(youtube_service, 'select_final_tracks', recording)
+    monkeypatch.setattr(youtube_service, 'YOUTUBE_SEARCH_CONCURRENCY', 2)
+    monkeypatch.setattr('services.catalog.CATALOG_MODE', 'off')
+
+    result = youtube_service.create_anti_playlist_main_flow(FakeYTMusic(account='streaming-spread'))
+    assert result
+    [(selected, cultures_used)] = selections
+    assert len(selected) == youtube_service.MAX_PLAYLIST_TRACKS
+    # Over-gathering lets the slowest cultures into the selection, not just the first to finish
+    assert len(cultures_used) == min(youtube_service.MAX_SEARCH_CULTURES, len(youtube_service.AUTHENTIC_MUSIC_SEARCHES))
+    assert {candidate['culture'] for candidate in selected} == cultures_used
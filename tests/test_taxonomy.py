@@ -0,0 +1,34 @@
+import json
+
+from services import taxonomy
+
+def _write(path, cultures):
+    path.write_text(json.dumps({'genre_opposites': {'pop': ['fado', 'fado', 'joik']}, 'cultures': cultures}))
+
+def test_compile_dedupes_terms_into_their_first_culture():
+    compiled = taxonomy.compile_taxonomy({
+        'genre_opposites': {'pop': ['fado', 'joik', 'fado']},
+        'cultures': {'portuguese': ['fado', 'fado'], 'sami': ['joik', 'fado'], 'empty': ['joik']},
+    })
+    assert compiled['genre_opposites'] == {'pop': ('fado', 'joik')}
+    assert compiled['cultures'] == (('portuguese', ('fado',)), ('sami', ('joik',)))
+    assert compiled['term_culture'] == {'fado': 'portuguese', 'joik': 'sami'}
+
+def test_cache_round_trips_and_follows_the_json(tmp_path):
+    source, cache = tmp_path / 'taxonomy.json', tmp_path / 'taxonomy.marshal'
+    _write(source, {'sami': ['joik']})
+    compiled = taxonomy.load_taxonomy(source, cache)
+    assert cache.exists()
+    cached = taxonomy.load_taxonomy(source, cache)
+    assert cached.cultures == compiled.cultures
+    assert dict(cached.opposite_genres) == dict(compiled.opposite_genres)
+
+    # Any change to the JSON invalidates the cache
+    _write(source, {'tuva': ['xoomi']})
+    assert taxonomy.load_taxonomy(source, cache).cultures == (('tuva', ('xoomi',)),)
+
+def test_unreadable_cache_is_ignored(tmp_path):
+    source, cache = tmp_path / 'taxonomy.json', tmp_path / 'taxonomy.marshal'
+    _write(source, {'sami': ['joik']})
+    cache.write_bytes(b'not a marshal stream')
+    assert taxonomy.load_taxonomy(source, cache).world_terms == ('joik',)
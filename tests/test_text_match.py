@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from services.taxonomy import get_taxonomy
+from services.text_match import KeywordMatcher
+
+def _substring_scan(keywords, text):
+    """The scan KeywordMatcher replaces."""
+    return {keyword for keyword in keywords if keyword and keyword in text}
+
+def _random_text(rng, alphabet, length):
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_substring_scan_on_overlapping_keywords(seed):
+    # A tiny alphabet produces many shared prefixes, nested and overlapping keywords
+    rng = random.Random(seed)
+    keywords = [_random_text(rng, 'abc ', rng.randint(1, 5)) for _ in range(30)]
+    matcher = KeywordMatcher(keywords)
+    for _ in range(200):
+        text = _random_text(rng, 'abc ', rng.randint(0, 30))
+        assert matcher.find(text) == _substring_scan(keywords, text)
+        assert matcher.contains_any(text) == bool(_substring_scan(keywords, text))
+
+def test_matches_substring_scan_on_taxonomy_terms():
+    taxonomy = get_taxonomy()
+    keywords = list(taxonomy.world_terms) + list(taxonomy.genres) + list(taxonomy.token_genres)
+    matcher = KeywordMatcher(keywords)
+    rng = random.Random(0)
+    for _ in range(300):
+        text = ' '.join(rng.sample(keywords, 3)) + ' ' + _random_text(rng, 'aeiou rstln', 12)
+        assert matcher.find(text) == _substring_scan(keywords, text)
+
+def test_regex_metacharacters_are_literal():
+    keywords = ['r&b', 'k-pop', 'a.b', '(live)', 'c++']
+    matcher = KeywordMatcher(keywords)
+    text = "r&b and k-pop (live) c++ axb"
+    assert matcher.find(text) == _substring_scan(keywords, text)
+
+def test_empty_inputs():
+    assert KeywordMatcher([]).find("anything") == set()
+    assert KeywordMatcher(['', 'x']).find("") == set()
+    assert not KeywordMatcher([]).contains_any("anything")
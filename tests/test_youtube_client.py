@@ -0,0 +1,37 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('ytmusicapi')
+pytest.importorskip('google_auth_oauthlib')
+
+from ytmusicapi.auth.types import AuthType
+
+from services import youtube_service
+from services.client_registry import get_client_registry
+
+def _credentials(token):
+    """The attributes of google-auth credentials that the client is built from."""
+    return SimpleNamespace(
+        token=token, refresh_token='refresh', client_id='client-id', client_secret='client-secret',
+        scopes=youtube_service.SCOPES, expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+    )
+
+def test_client_is_built_with_the_oauth_token():
+    ytmusic = youtube_service.get_ytmusic_client(_credentials('client-token'))
+    try:
+        assert ytmusic.auth_type == AuthType.OAUTH_CUSTOM_CLIENT
+        assert ytmusic._token.access_token == 'client-token'
+        assert ytmusic._token.credentials.client_id == 'client-id'
+    finally:
+        get_client_registry().discard(youtube_service.registry_key('youtube', 'client-token'))
+
+def test_client_falls_back_to_an_unauthenticated_session():
+    credentials = _credentials('broken-token')
+    credentials.client_secret = None # OAuthCredentials rejects an id without a secret
+    ytmusic = youtube_service.get_ytmusic_client(credentials)
+    try:
+        assert ytmusic.auth_type == AuthType.UNAUTHORIZED
+    finally:
+        get_client_registry().discard(youtube_service.registry_key('youtube', 'broken-token'))
@@ -0,0 +1,26 @@
+import json
+from functools import partial
+
+import pytest
+
+pytest.importorskip('ytmusicapi')
+pytest.importorskip('google_auth_oauthlib')
+
+import database
+from services import youtube_service
+
+def test_legacy_history_is_shared_not_given_to_one_account(tmp_path, monkeypatch):
+    legacy = tmp_path / 'anti_playlist_history.json'
+    legacy.write_text(json.dumps(['legacy-1', 'legacy-2']))
+    monkeypatch.setattr(youtube_service, 'import_json_history',
+                        partial(youtube_service.import_json_history, path=str(legacy)))
+
+    database.save_history('alice-test', 'youtube', ['alice-1'])
+    known = youtube_service.history_filter('alice-test')(['legacy-1', 'alice-1', 'new'])
+    assert known == {'legacy-1', 'alice-1'}
+    assert not legacy.exists()
+
+    # The file was imported under the shared key, so other accounts see it too
+    assert database.find_known_songs('alice-test', 'youtube', ['legacy-1']) == set()
+    assert youtube_service.history_filter('bob-test')(['legacy-2', 'alice-1']) == {'legacy-2'}
+    assert youtube_service.load_history('bob-test') >= {'legacy-1', 'legacy-2'}
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip('ytmusicapi')
+pytest.importorskip('google_auth_oauthlib')
+
+from services import youtube_service
+
+class History:
+    """Minimal YTMusic stand-in whose history can be replaced between runs."""
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    def get_history(self):
+        return list(self.tracks)
+
+def _track(video_id, genre):
+    return {'videoId': video_id, 'title': f"{genre} song {video_id}", 'artists': [], 'album': None}
+
+@pytest.fixture
+def scored(monkeypatch):
+    """Counts the history items scored by analyze_recent_genres."""
+    scored = []
+    score_genres = youtube_service.score_genres
+    def counting(tracks):
+        scored.extend(track['videoId'] for track in tracks)
+        return score_genres(tracks)
+    monkeypatch.setattr(youtube_service, 'score_genres', counting)
+    return scored
+
+def _analyze(client, user_id):
+    return dict(youtube_service.analyze_recent_genres(client, user_id, refresh=True))
+
+def test_profile_is_the_score_of_the_current_window(scored):
+    client = History([_track('a', 'rock'), _track('b', 'jazz'), _track('c', 'pop')])
+    first = _analyze(client, 'profile-window')
+    assert first == dict(youtube_service.score_genres(client.tracks))
+
+    # Replaying the newest track puts it first again; the plays in between still count
+    client.tracks = [_track('a', 'rock'), _track('d', 'metal')] + client.tracks
+    scored.clear()
+    second = _analyze(client, 'profile-window')
+    assert scored == ['d'] # Only the new item was scored
+    assert second == dict(youtube_service.score_genres(client.tracks))
+
+def test_profile_does_not_accumulate_across_updates(scored):
+    client = History([_track('a', 'rock'), _track('b', 'jazz')])
+    first = _analyze(client, 'profile-repeat')
+    assert _analyze(client, 'profile-repeat') == first
+
+def test_profile_keeps_its_scale_when_the_window_moves(monkeypatch, scored):
+    monkeypatch.setattr(youtube_service, 'HISTORY_WINDOW', 3)
+    client = History([_track('a', 'rock'), _track('b', 'rock'), _track('c', 'rock')])
+    first = _analyze(client, 'profile-slide')
+    # Entirely new listening pushes every stored item out of the window
+    client.tracks = [_track(video_id, 'rock') for video_id in 'xyz'] + client.tracks
+    assert _analyze(client, 'profile-slide') == first